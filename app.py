@@ -4,33 +4,40 @@ import json
 import hmac
 import hashlib
 from dotenv import load_dotenv
-from services.zalo_api import ZaloAPI
-from services.message_handler import message_handler
+from services.registry import registry
 from datetime import datetime
 import redis
-from services.database import db
+from services.event_dedup import EventDeduplicator
+from services.admission import admission_controller
+from services.model_gateway import model_gateway
+from services.turn_scheduler import turn_schedulers
+from services.oa_registry import oa_registry, scoped_id, set_current_oa
 import asyncio
 from asgiref.wsgi import WsgiToAsgi  # Thêm để chuyển WSGI sang ASGI
 
 load_dotenv()
 
 app = Flask(__name__)
-zalo_api = ZaloAPI()
-
-# Redis client to track processed messages
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, socket_connect_timeout=1, decode_responses=True)
-    redis_client.ping()
-    print("Redis connected successfully")
-except redis.ConnectionError:
-    print("Warning: Redis not available. Deduplication will be disabled.")
-    class FakeRedis:
-        def exists(self, key): return False
-        def setex(self, key, time, value): pass
-    redis_client = FakeRedis()
+zalo_api = registry.lazy("zalo_api")
+message_handler = registry.lazy("message_handler")
 
 CACHE_EXPIRY = 300  # 5 minutes in seconds
 
+
+def _create_event_deduplicator():
+    # Redis client to track processed messages
+    try:
+        redis_client = redis.Redis(host='localhost', port=6379, db=0, socket_connect_timeout=1, decode_responses=True)
+        redis_client.ping()
+        print("Redis connected successfully")
+    except redis.ConnectionError:
+        print("Warning: Redis not available. Deduplication will use the in-process cache only.")
+        redis_client = None
+    return EventDeduplicator(redis_client, ttl=CACHE_EXPIRY)
+
+
+event_deduplicator = registry.register("event_deduplicator", _create_event_deduplicator, phase="core")
+
 @app.route('/')
 def index():
     return "Thuận Pony Travel - Zalo Chatbot is running!"
@@ -40,13 +47,52 @@ def api_test():
     profile = zalo_api.get_user_profile("3273615087242629962")
     return jsonify({"api_status": profile})
 
+@app.route('/ops/status', methods=['GET'])
+def ops_status():
+    # Mức degradation hiện tại và backlog Gemini cho vận hành
+    return jsonify({
+        "admission": admission_controller.status(),
+        "models": model_gateway.stats(),
+        "scheduler": turn_schedulers.status(),
+        "oas": {oa.oa_id: {"name": oa.name, "owned": oa_registry.owns(oa.oa_id)} for oa in oa_registry.all()},
+    })
+
 @app.route('/webhook', methods=['GET', 'POST'])
 async def webhook():
+    # Route cũ: OA mặc định
+    return await _handle_webhook(oa_registry.default_id)
+
+@app.route('/webhook/<oa_id>', methods=['GET', 'POST'])
+async def oa_webhook(oa_id):
+    if oa_registry.get(oa_id) is None:
+        return jsonify({"error": "Unknown OA"}), 404
+    return await _handle_webhook(oa_id)
+
+async def _handle_webhook(oa_id):
     if request.method == 'GET':
         return "Webhook is active!"
     
+    if not oa_registry.owns(oa_id):
+        # OA thuộc shard khác: load balancer cần định tuyến lại
+        return jsonify({"error": "OA is not served by this worker"}), 421
+    
+    # Namespace key Redis, client Zalo và pool scheduler theo OA của webhook
+    set_current_oa(oa_id)
+    if oa_id == oa_registry.default_id:
+        client, handler = zalo_api, message_handler
+    else:
+        from services.message_handler import get_message_handler
+        client, handler = oa_registry.client(oa_id), get_message_handler(oa_id)
+    
     if request.method == 'POST':
-        data = request.json
+        # Xác thực chữ ký trước mọi thao tác Redis/Mongo, trên raw body Zalo đã ký
+        mac = request.headers.get('X-ZaloOA-Signature')
+        if mac and not client.verify_webhook(request.get_data(cache=True), mac):
+            return jsonify({"error": "Invalid signature"}), 401
+        
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid JSON body"}), 400
         print(f"Received webhook: {data}")
         
         event_name = data.get('event_name')
@@ -68,20 +114,15 @@ async def webhook():
             event_id = f"event:{event_name}:{data.get('timestamp')}"
         
         if event_id:
-            if redis_client.exists(f"event:{event_id}"):
-                print(f"Skipping duplicate event: {event_id}")
-                return jsonify({"status": "duplicate_skipped"}), 200
-            
             current_time = datetime.now().timestamp()
             if (current_time - timestamp) > 300:
                 print(f"Skipping old event: {event_id}, age: {current_time - timestamp} seconds")
                 return jsonify({"status": "old_event_skipped"}), 200
             
-            redis_client.setex(f"event:{event_id}", CACHE_EXPIRY, str(current_time))
-        
-        mac = request.headers.get('X-ZaloOA-Signature')
-        if mac and not zalo_api.verify_webhook(data, mac):
-            return jsonify({"error": "Invalid signature"}), 401
+            # SET NX EX: kiểm tra và ghi nhận trong một round trip, không có race giữa các worker
+            if not event_deduplicator.claim(scoped_id(event_id), str(current_time)):
+                print(f"Skipping duplicate event: {event_id}")
+                return jsonify({"status": "duplicate_skipped"}), 200
         
         try:
             event_name = data.get('event_name')
@@ -91,10 +132,10 @@ async def webhook():
                 print(f"Processing message from user_id: {user_id}")
                 
                 if 'text' in data.get('message', {}):
-                    zalo_api.send_typing_indicator(user_id)
+                    client.send_typing_indicator(user_id)
                     
                     message = data['message']
-                    await message_handler.process_message(message, user_id)
+                    await handler.process_message(message, user_id)
                     
                     print("Message added to queue, waiting for processing")
                     return jsonify({"status": "message_queued"}), 200
@@ -112,9 +153,11 @@ async def webhook():
                     "✈️ Đặt vé máy bay",
                     "Tôi có thể giúp gì cho bạn hôm nay?"
                 ]
+                loop = asyncio.get_running_loop()
                 for msg in welcome_messages:
                     try:
-                        result = zalo_api.send_text_message(user_id, msg)
+                        # Gửi (và chờ rate limit) trên thread pool, không chặn event loop
+                        result = await loop.run_in_executor(None, client.send_text_message, user_id, msg)
                         if "error" in result:
                             print(f"Failed to send welcome message '{msg}': {result}")
                             continue
@@ -128,7 +171,9 @@ async def webhook():
                 user_id = data['sender']['id']
                 response = "Tôi đã nhận được hình ảnh của bạn. Tuy nhiên, tôi chỉ có thể xử lý tin nhắn văn bản. Vui lòng gửi yêu cầu bằng văn bản."
                 try:
-                    result = zalo_api.send_text_message(user_id, response)
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        None, client.send_text_message, user_id, response
+                    )
                     if "error" in result:
                         return jsonify({"error": "Failed to send response", "details": result}), 500
                 except Exception as e:
@@ -145,8 +190,61 @@ async def webhook():
 
 # Giữ nguyên các route khác (/api/visa-products, /api/consultation-request)
 
+def start_background_services():
+    """Khởi tạo trước mọi service (kèm archiver, token refresher) và bật prefetch thời tiết."""
+    from services.weather_service import weather_service
+    # Khởi tạo trước mọi service để request đầu tiên không phải chờ
+    print(registry.warm_up())
+    if os.environ.get('WEATHER_API_KEY'):
+        weather_service.start_prefetcher()
+
+
+def stop_background_services():
+    from services.conversation_store import conversation_store
+    from services.weather_service import weather_service
+    conversation_store.stop_archiver()
+    weather_service.close()
+
+
+class LifespanMiddleware:
+    """Xử lý sự kiện lifespan của ASGI server (WsgiToAsgi không hỗ trợ), chuyển request HTTP cho app.
+
+    Nhờ đó `uvicorn app:asgi_app` (mỗi worker) cũng khởi động service nền, không chỉ khi chạy `python app.py`.
+    """
+
+    def __init__(self, app, on_startup=None, on_shutdown=None):
+        self.app = app
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    if self.on_startup:
+                        # Warm-up có I/O đồng bộ (Mongo, Redis, model): chạy ngoài event loop
+                        await loop.run_in_executor(None, self.on_startup)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    if self.on_shutdown:
+                        await loop.run_in_executor(None, self.on_shutdown)
+                except Exception as e:
+                    print(f"Error stopping background services: {e}")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
 # Chuyển Flask WSGI sang ASGI
-asgi_app = WsgiToAsgi(app)
+asgi_app = LifespanMiddleware(WsgiToAsgi(app), on_startup=start_background_services,
+                              on_shutdown=stop_background_services)
 
 if __name__ == '__main__':
     import uvicorn
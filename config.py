@@ -14,6 +14,23 @@ class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     COMPANY_NAME = "Passport Lounge"
     HOTLINE = "1900 636563"
+    
+    # Tỷ giá dùng để quy đổi giá visa USD sang VND khi báo giá
+    USD_VND_RATE = int(os.getenv("USD_VND_RATE", "25000"))
+    
+    # Số request Gemini đồng thời tối đa cho mỗi model
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    
+    # Số ký tự tối đa của một tin nhắn văn bản Zalo OA (2000); đặt nhỏ hơn nếu muốn chia câu trả lời ngắn hơn
+    ZALO_MESSAGE_LIMIT = int(os.getenv("ZALO_MESSAGE_LIMIT", "2000"))
+    
+    # Nhiều Official Account: file JSON danh sách OA (không đặt thì dùng một OA từ ZALO_APP_ID/...)
+    ZALO_OA_CONFIG = os.getenv("ZALO_OA_CONFIG")
+    ZALO_OA_ID = os.getenv("ZALO_OA_ID", "default")
+    
+    # Chia OA cho các worker: worker chỉ nhận webhook của OA có crc32(oa_id) % COUNT == INDEX
+    WORKER_SHARD_INDEX = int(os.getenv("WORKER_SHARD_INDEX", "0"))
+    WORKER_SHARD_COUNT = int(os.getenv("WORKER_SHARD_COUNT", "1"))
 
 if not Config.GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY is required in .env file")
\ No newline at end of file
@@ -3,8 +3,115 @@ from datetime import datetime
 from bson import ObjectId
 from services.database import db
 
-def import_excel_visa_products(excel_file_path):
-    """Nhập dữ liệu visa từ file Excel vào MongoDB"""
+STAGING_COLLECTION = "visas_staging"
+
+# Không thay catalog nếu bản mới ít hơn tỷ lệ này so với bản đang chạy (file Excel lỗi, thiếu sheet...)
+MIN_KEEP_RATIO = 0.5
+
+
+def _text_column(df, *names, default=''):
+    """Cột văn bản đầu tiên có trong file (ô trống -> default)"""
+    result = pd.Series(default, index=df.index, dtype=object)
+    for name in reversed(names):
+        if name in df.columns:
+            column = df[name]
+            result = column.where(column.notna() & (column.astype(str).str.strip() != ''), result)
+    return result.astype(str)
+
+
+def _extract_country_names(product_names):
+    """Tách quốc gia từ tên sản phẩm: "Visa Du Lịch Qatar" -> "Qatar", "Du Lịch Ả Rập Xê Út" -> "Ả Rập Xê Út" """
+    lower = product_names.str.lower()
+    has_visa = lower.str.contains("visa", regex=False)
+    has_du_lich = lower.str.contains("du lịch", regex=False)
+
+    countries = product_names.copy()
+    countries[has_visa] = (countries[has_visa]
+                           .str.replace("Visa", "", n=1, regex=False)
+                           .str.replace("visa", "", n=1, regex=False))
+    strip_du_lich = has_visa | has_du_lich
+    countries[strip_du_lich] = (countries[strip_du_lich]
+                                .str.replace("Du Lịch", "", n=1, regex=False)
+                                .str.replace("du lịch", "", n=1, regex=False))
+    countries = countries.str.strip()
+
+    empty = countries == ''
+    countries[empty] = [f"Visa_{index}" for index in countries.index[empty]]
+    for index in countries.index[empty]:
+        print(f"Không thể trích xuất quốc gia từ '{product_names[index]}'. Sử dụng tên mặc định: {countries[index]}")
+    return countries
+
+
+def build_visa_documents(df):
+    """Chuyển DataFrame từ file Excel thành danh sách document visa (xử lý theo cột)"""
+    product_names = _text_column(df, 'Tên sản phẩm*', 'Tên sản phẩm').str.strip()
+    valid = product_names != ''
+    for index in df.index[~valid]:
+        print(f"Bỏ qua dòng {index+2}: Tên sản phẩm trống")
+    df = df[valid]
+    product_names = product_names[valid]
+
+    price = df['Giá'] if 'Giá' in df.columns else pd.Series(0, index=df.index)
+    price = pd.to_numeric(
+        price.astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip(),
+        errors='coerce'
+    ).fillna(0)
+
+    now = datetime.now()
+    visas = pd.DataFrame({
+        "country": _extract_country_names(product_names),
+        "price": price.astype(float),
+        "visa_method": _text_column(df, 'Nhãn hiệu', default='Visa điện tử'),
+        "description": _text_column(df, 'Mô tả sản phẩm'),
+        "short_description": _text_column(df, 'Mô tả ngắn'),
+        "product_id": _text_column(df, 'Id sản phẩm'),
+        "product_url": _text_column(df, 'Đường dẫn/Alias'),
+    }, index=df.index)
+
+    # Mỗi quốc gia một bản ghi: dòng sau trong file ghi đè dòng trước
+    visas = visas.drop_duplicates(subset="country", keep="last")
+
+    visas["country_aliases"] = visas["country"].str.lower().map(lambda alias: [alias])
+    visas["requirements"] = visas["description"].map(extract_requirements)
+    visas["costs"] = [extract_costs(description, price)
+                      for description, price in zip(visas["description"], visas["price"])]
+    visas["process_steps"] = visas["short_description"].map(extract_process_steps)
+
+    documents = visas.to_dict("records")
+    for document in documents:
+        document.update({
+            "_id": ObjectId(),
+            "visa_type": "du lịch",  # Mặc định là du lịch
+            "type_aliases": ["du lich", "du lịch", "tourist", "travel"],
+            "duration": "90 ngày",  # Mặc định
+            "processing_time": "5-7 ngày làm việc",  # Mặc định
+            "success_rate": 98.6,  # Mặc định
+            "created_at": now,
+            "updated_at": now,
+        })
+    return documents
+
+
+def validate_staging(staging, documents, live_count):
+    """Kiểm tra dữ liệu trong staging trước khi thay thế catalog đang chạy"""
+    staged = staging.count_documents({})
+    if staged != len(documents):
+        raise ValueError(f"Staging có {staged} bản ghi, mong đợi {len(documents)}")
+    if staged == 0:
+        raise ValueError("Không có sản phẩm visa hợp lệ trong file")
+    invalid = staging.count_documents({"$or": [{"country": {"$in": [None, ""]}}, {"price": {"$lt": 0}}]})
+    if invalid:
+        raise ValueError(f"{invalid} bản ghi thiếu quốc gia hoặc có giá âm")
+    if live_count and staged < live_count * MIN_KEEP_RATIO:
+        raise ValueError(f"Catalog mới ({staged}) ít hơn nhiều so với catalog hiện tại ({live_count})")
+
+
+def import_excel_visa_products(excel_file_path, force=False):
+    """Nhập dữ liệu visa từ file Excel vào MongoDB.
+
+    Dữ liệu được ghi vào collection staging, kiểm tra, rồi rename đè lên `visas` trong một
+    thao tác nguyên tử, nên bot luôn thấy catalog cũ hoặc catalog mới đầy đủ.
+    """
     try:
         print(f"Bắt đầu nhập dữ liệu từ file {excel_file_path}")
         
@@ -16,115 +123,25 @@ def import_excel_visa_products(excel_file_path):
         print(f"Đọc được {product_count} sản phẩm từ file Excel")
         
         # Chuyển đổi dữ liệu để phù hợp với cấu trúc của collection visa
-        visa_products = []
-
-        #Xoa tat ca du lieu trong collection visa
-        db.get_collection("visas").delete_many({})
+        visa_products = build_visa_documents(df)
         
+        visas = db.get_collection("visas")
+        staging = db.get_collection(STAGING_COLLECTION)
+        staging.drop()
+        if visa_products:
+            staging.insert_many(visa_products, ordered=False)
         
-        for index, row in df.iterrows():
-            try:
-                # Lấy thông tin cơ bản của sản phẩm - kiểm tra cả "Tên sản phẩm" và "Tên sản phẩm*"
-                product_name = row.get('Tên sản phẩm*') or row.get('Tên sản phẩm', '')
-                
-                # Kiểm tra nếu tên sản phẩm trống
-                if not product_name or str(product_name).strip() == '':
-                    print(f"Bỏ qua dòng {index+2}: Tên sản phẩm trống")
-                    continue
-                    
-                print(f"Đang xử lý sản phẩm: {product_name}")
-                
-                # Tách tên sản phẩm để lấy quốc gia
-                # Ví dụ: "Visa Du Lịch Qatar" -> "Qatar"
-                # Hoặc "Du Lịch Ả Rập Xê Út" -> "Ả Rập Xê Út"
-                country_name = None
-                
-                # Xử lý trường hợp tên sản phẩm có "Visa"
-                if "visa" in str(product_name).lower():
-                    country_name = str(product_name).replace("Visa", "", 1).replace("visa", "", 1).replace("Du Lịch", "", 1).replace("du lịch", "", 1).strip()
-                # Xử lý trường hợp tên sản phẩm có "Du Lịch"
-                elif "du lịch" in str(product_name).lower():
-                    country_name = str(product_name).replace("Du Lịch", "", 1).replace("du lịch", "", 1).strip()
-                else:
-                    # Trường hợp còn lại, lấy tên sản phẩm làm tên quốc gia
-                    country_name = str(product_name).strip()
-                
-                if not country_name:
-                    country_name = f"Visa_{index}"
-                    print(f"Không thể trích xuất quốc gia từ '{product_name}'. Sử dụng tên mặc định: {country_name}")
-                
-                print(f"Tên quốc gia trích xuất: {country_name}")
-                
-                # Kiểm tra nếu đã có visa của quốc gia này
-                existing_visa = db.get_collection("visas").find_one({"country": country_name})
-                
-                # Xác định loại visa từ thông tin sản phẩm
-                visa_method = str(row.get('Nhãn hiệu', 'Visa điện tử'))  # Mặc định là visa điện tử
-                visa_type = "du lịch"  # Mặc định là du lịch
-                
-                # Lấy giá từ sản phẩm
-                price = row.get('Giá', 0)
-                if isinstance(price, str):
-                    price = float(price.replace('$', '').replace(',', '').strip()) if price else 0
-                
-                # Phân tích mô tả để trích xuất thông tin
-                description = str(row.get('Mô tả sản phẩm', ''))
-                short_desc = str(row.get('Mô tả ngắn', ''))
-                
-                # Tạo document visa mới
-                visa_data = {
-                    "_id": ObjectId(),
-                    "country": country_name,
-                    "country_aliases": [country_name.lower()],
-                    "visa_type": visa_type,
-                    "type_aliases": ["du lich", "du lịch", "tourist", "travel"],
-                    "price": price,
-                    "duration": "90 ngày",  # Mặc định
-                    "processing_time": "5-7 ngày làm việc",  # Mặc định
-                    "success_rate": 98.6,  # Mặc định
-                    "visa_method": visa_method,
-                    "requirements": extract_requirements(description),
-                    "costs": extract_costs(description, price),
-                    "process_steps": extract_process_steps(short_desc),
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now(),
-                    "product_id": str(row.get('Id sản phẩm', '')),
-                    "product_url": row.get('Đường dẫn/Alias', ''),
-                    "description": description,  # Lưu cả mô tả gốc
-                    "short_description": short_desc  # Lưu cả mô tả ngắn gốc
-                }
-                
-                # In thông tin sản phẩm đã xử lý để kiểm tra
-                print(f"Quốc gia: {visa_data['country']}, Giá: {visa_data['price']} USD")
-                
-                # Nếu đã tồn tại thì cập nhật, nếu không thì thêm mới
-                if existing_visa:
-                    print(f"Cập nhật visa cho quốc gia: {country_name}")
-                    db.get_collection("visas").update_one(
-                        {"_id": existing_visa["_id"]},
-                        {"$set": visa_data}
-                    )
-                else:
-                    print(f"Thêm visa mới cho quốc gia: {country_name}")
-                    visa_products.append(visa_data)
-                    
-            except Exception as e:
-                print(f"Lỗi khi xử lý dòng {index+2}: {e}")
-                import traceback
-                traceback.print_exc()
+        # Giữ nguyên các index của collection đang chạy
+        for name, info in visas.index_information().items():
+            if name == "_id_":
                 continue
+            options = {key: value for key, value in info.items() if key not in ("key", "v", "ns")}
+            staging.create_index(info["key"], name=name, **options)
         
-        # Thêm các visa mới vào database
-        if visa_products:
-            try:
-                db.get_collection("visas").insert_many(visa_products)
-                print(f"Đã nhập thành công {len(visa_products)} sản phẩm visa mới")
-            except Exception as e:
-                print(f"Lỗi khi thêm sản phẩm vào database: {e}")
-                import traceback
-                traceback.print_exc()
-        else:
-            print("Không có sản phẩm mới để thêm vào database")
+        validate_staging(staging, visa_products, 0 if force else visas.estimated_document_count())
+        
+        staging.rename("visas", dropTarget=True)
+        print(f"Đã nhập thành công {len(visa_products)} sản phẩm visa")
         
         return True
     except Exception as e:
@@ -258,5 +275,6 @@ def extract_process_steps(short_desc):
 
 if __name__ == "__main__":
     # Đường dẫn đến file Excel - điều chỉnh cho phù hợp
+    import sys
     excel_file_path = "visa_products.xlsx"
-    import_excel_visa_products(excel_file_path)
\ No newline at end of file
+    import_excel_visa_products(excel_file_path, force="--force" in sys.argv)
\ No newline at end of file
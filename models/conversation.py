@@ -0,0 +1,110 @@
+# Model for conversation turns and the Redis codec for context/history
+import json
+import time
+import zlib
+
+import msgpack
+
+# Byte đầu của mọi giá trị nhị phân; JSON cũ bắt đầu bằng '[' hoặc '{'
+CODEC_VERSION = 1
+
+# Câu trả lời dài hơn ngưỡng này (byte UTF-8) được nén zlib
+COMPRESS_THRESHOLD = 512
+
+_ROLES = ("user", "bot")
+_LEGACY_PREFIXES = (("User:", "user"), ("Bot:", "bot"))
+_ZLIB_EXT = 1
+
+
+class Turn:
+    """Một lượt hội thoại: ai nói (user/bot), lúc nào, nội dung và intent (nếu biết)."""
+
+    __slots__ = ("role", "text", "ts", "intent")
+
+    def __init__(self, role, text, ts=None, intent=None):
+        if role not in _ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        self.role = role
+        self.text = text or ""
+        self.ts = int(ts if ts is not None else time.time())
+        self.intent = intent
+
+    @classmethod
+    def user(cls, text, intent=None):
+        return cls("user", text, intent=intent)
+
+    @classmethod
+    def bot(cls, text, intent=None):
+        return cls("bot", text, intent=intent)
+
+    @classmethod
+    def from_legacy(cls, line):
+        """Đọc dòng lịch sử cũ dạng "User: ..." / "Bot: ..." (không có thời gian)."""
+        for prefix, role in _LEGACY_PREFIXES:
+            if line.startswith(prefix):
+                return cls(role, line[len(prefix):].strip(), ts=0)
+        return None
+
+    def to_dict(self):
+        return {"role": self.role, "text": self.text, "ts": self.ts, "intent": self.intent}
+
+    def __eq__(self, other):
+        return isinstance(other, Turn) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Turn({self.role!r}, {self.text!r}, ts={self.ts}, intent={self.intent!r})"
+
+
+def _pack_text(text):
+    raw = text.encode("utf-8")
+    if len(raw) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(raw, 1)
+        if len(compressed) < len(raw):
+            return msgpack.ExtType(_ZLIB_EXT, compressed)
+    return text
+
+
+def _ext_hook(code, data):
+    if code == _ZLIB_EXT:
+        return zlib.decompress(data).decode("utf-8")
+    return msgpack.ExtType(code, data)
+
+
+def _pack(value):
+    return bytes([CODEC_VERSION]) + msgpack.packb(value, use_bin_type=True)
+
+
+def _unpack(data):
+    """Trả về (True, giá trị) cho định dạng nhị phân, (False, JSON đã parse) cho dữ liệu cũ."""
+    if isinstance(data, str):
+        return False, json.loads(data)
+    if data[:1] in (b"[", b"{"):
+        return False, json.loads(data.decode("utf-8"))
+    version = data[0]
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unsupported conversation codec version: {version}")
+    return True, msgpack.unpackb(data[1:], raw=False, ext_hook=_ext_hook, strict_map_key=False)
+
+
+def encode_history(turns):
+    """Mỗi lượt là mảng [role, ts, text, intent]; role lưu dạng số 0/1."""
+    return _pack([[_ROLES.index(t.role), t.ts, _pack_text(t.text), t.intent] for t in turns])
+
+
+def decode_history(data):
+    if not data:
+        return []
+    binary, value = _unpack(data)
+    if not binary:
+        return [turn for turn in map(Turn.from_legacy, value) if turn]
+    return [Turn(_ROLES[role], text, ts, intent) for role, ts, text, intent in value]
+
+
+def encode_context(context):
+    return _pack(context)
+
+
+def decode_context(data):
+    if not data:
+        return {}
+    return _unpack(data)[1]
@@ -7,7 +7,8 @@ class Lead(BaseModel):
     def __init__(self, name=None, phone=None, email=None, country_interest=None, 
                  zalo_user_id=None, source="zalo_bot", status="new_lead",
                  customer_needs=None, special_concerns=False, special_case_type=None,
-                 original_query=None, description=None):
+                 original_query=None, description=None, service_interests=None,
+                 service_type=None, special_case_types=None):
         super().__init__()
         self.name = name
         self.phone = phone
@@ -21,6 +22,9 @@ class Lead(BaseModel):
         self.special_case_type = special_case_type
         self.original_query = original_query
         self.description = description  # Add this line
+        self.service_interests = service_interests or []  # tour, visa, ... (gộp theo SĐT)
+        self.service_type = service_type  # dịch vụ của lần hỏi này, gộp vào service_interests
+        self.special_case_types = special_case_types or []
         self.assigned_to = None
         self.notes = []
         self.last_contact_date = None
@@ -52,7 +56,10 @@ class Lead(BaseModel):
             special_concerns=data.get("special_concerns", False),
             special_case_type=data.get("special_case_type"),
             original_query=data.get("original_query"),
-            description=data.get("description")  # Add this line
+            description=data.get("description"),  # Add this line
+            service_interests=data.get("service_interests", []),
+            service_type=data.get("service_type"),
+            special_case_types=data.get("special_case_types", [])
         )
         
         lead._id = data.get("_id", ObjectId())
@@ -1,14 +1,138 @@
 import logging
 import redis
 import json
+import threading
 import time
 from datetime import datetime, timedelta
 
+from services.oa_registry import scoped_id
+
 # Redis setup
 redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
 logger = logging.getLogger(__name__)
 
+PAUSE_PREFIX = "botpause:"
+PAUSE_CHANNEL = "events:botpause"
+
+
+class PauseCache:
+    """Bản sao trong tiến trình của các key `botpause:*` (user_id -> thời điểm hết tạm dừng).
+
+    Tạm dừng rất hiếm nên kiểm tra "không bị tạm dừng" chỉ cần tra dict, không round trip Redis.
+    /stop và /resume phát sự kiện qua pub/sub để mọi worker cập nhật ngay; định kỳ SCAN lại
+    toàn bộ để bù các sự kiện bị lỡ khi mất kết nối. Trước lần đồng bộ đầu tiên (hoặc khi
+    listener đang kết nối lại) thì hỏi thẳng Redis như trước.
+    """
+
+    def __init__(self, redis_client, channel=PAUSE_CHANNEL, resync_interval=60, auto_start=True):
+        self.redis_client = redis_client
+        self.channel = channel
+        self.resync_interval = resync_interval
+        self.auto_start = auto_start
+        self._paused = {}
+        self._synced = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name="botpause-listener", daemon=True)
+                self._thread.start()
+        return self
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                # Subscribe trước rồi mới SCAN để không lỡ thay đổi xảy ra giữa hai bước
+                pubsub.subscribe(self.channel)
+                self.resync()
+                backoff = 1
+                next_resync = time.monotonic() + self.resync_interval
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.apply(message["data"])
+                    if time.monotonic() >= next_resync:
+                        self.resync()
+                        next_resync = time.monotonic() + self.resync_interval
+            except Exception as e:
+                self._synced = False
+                logger.warning(f"Mất kết nối kênh {self.channel}, thử lại sau {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def resync(self):
+        """Nạp lại toàn bộ trạng thái tạm dừng từ Redis bằng SCAN."""
+        keys = list(self.redis_client.scan_iter(match=f"{PAUSE_PREFIX}*", count=500))
+        values = self.redis_client.mget(keys) if keys else []
+        paused = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            try:
+                resume_at = float(json.loads(value)["resume_at"])
+            except (ValueError, KeyError, TypeError):
+                resume_at = time.time() + max(self.redis_client.ttl(key), 0)
+            paused[key[len(PAUSE_PREFIX):]] = resume_at
+        # Sự kiện đến trong lúc SCAN nằm chờ trong pubsub và được áp dụng ngay sau bước này
+        self._paused = paused
+        self._synced = True
+        return len(paused)
+
+    def apply(self, data):
+        """Áp dụng một sự kiện {"user_id", "resume_at"}; resume_at null nghĩa là đã resume."""
+        try:
+            event = json.loads(data)
+            user_id = str(event["user_id"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Sự kiện tạm dừng không hợp lệ: {data!r}")
+            return
+        if event.get("resume_at"):
+            self._paused[user_id] = float(event["resume_at"])
+        else:
+            self._paused.pop(user_id, None)
+
+    def _publish(self, user_id, resume_at):
+        data = json.dumps({"user_id": str(user_id), "resume_at": resume_at})
+        self.apply(data)
+        try:
+            self.redis_client.publish(self.channel, data)
+        except Exception as e:
+            logger.error(f"Không phát được sự kiện tạm dừng: {e}")
+
+    def mark_paused(self, user_id, resume_at):
+        self._publish(user_id, resume_at)
+
+    def mark_resumed(self, user_id):
+        self._publish(user_id, None)
+
+    def is_paused(self, user_id):
+        if self.auto_start and self._thread is None:
+            self.start()
+        if not self._synced:
+            return bool(self.redis_client.exists(f"{PAUSE_PREFIX}{user_id}"))
+        resume_at = self._paused.get(str(user_id))
+        if resume_at is None:
+            return False
+        if resume_at <= time.time():
+            self._paused.pop(str(user_id), None)
+            return False
+        return True
+
+
+pause_cache = PauseCache(redis_client)
+
 class AdminCommandHandler:
     """Xử lý các lệnh admin để kiểm soát bot"""
     
@@ -44,6 +168,7 @@ class AdminCommandHandler:
     @staticmethod
     def stop_bot_for_user(user_id, minutes):
         """Tạm dừng bot cho một user trong khoảng thời gian xác định"""
+        user_id = scoped_id(user_id)
         try:
             expiry_time = datetime.now() + timedelta(minutes=minutes)
             data = {
@@ -54,10 +179,11 @@ class AdminCommandHandler:
             
             # Lưu trạng thái tạm dừng vào Redis với thời gian hết hạn
             redis_client.setex(
-                f"botpause:{user_id}", 
+                f"{PAUSE_PREFIX}{user_id}", 
                 int(minutes * 60),  # Convert to seconds for Redis expiry
                 json.dumps(data)
             )
+            pause_cache.mark_paused(user_id, data["resume_at"])
             
             end_time = expiry_time.strftime("%H:%M:%S, %d/%m/%Y")
             
@@ -70,13 +196,15 @@ class AdminCommandHandler:
     @staticmethod
     def resume_bot_for_user(user_id):
         """Khôi phục bot cho một user trước thời gian hết hạn"""
+        user_id = scoped_id(user_id)
         try:
-            pause_key = f"botpause:{user_id}"
+            pause_key = f"{PAUSE_PREFIX}{user_id}"
             if not redis_client.exists(pause_key):
                 return False, f"Bot không bị tạm dừng cho cuộc hội thoại này"
                 
             # Xóa key tạm dừng
             redis_client.delete(pause_key)
+            pause_cache.mark_resumed(user_id)
             
             logger.info(f"Bot đã được khôi phục cho user {user_id}")
             return True, f"Bot đã được khôi phục và sẵn sàng phản hồi lại"
@@ -87,8 +215,9 @@ class AdminCommandHandler:
     @staticmethod
     def check_bot_status(user_id):
         """Kiểm tra trạng thái bot cho một user"""
+        user_id = scoped_id(user_id)
         try:
-            pause_key = f"botpause:{user_id}"
+            pause_key = f"{PAUSE_PREFIX}{user_id}"
             if not redis_client.exists(pause_key):
                 return True, f"Bot đang hoạt động bình thường trong cuộc hội thoại này"
                 
@@ -105,8 +234,7 @@ class AdminCommandHandler:
     def is_bot_paused_for_user(user_id):
         """Kiểm tra xem bot có đang bị tạm dừng cho user không"""
         try:
-            pause_key = f"botpause:{user_id}"
-            return redis_client.exists(pause_key)
+            return pause_cache.is_paused(scoped_id(user_id))
         except Exception as e:
             logger.error(f"Lỗi khi kiểm tra trạng thái tạm dừng: {e}")
             return False
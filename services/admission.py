@@ -0,0 +1,158 @@
+# Service for admission control and template answers when the model backlog grows
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+from services.visa_quotes import update_quote
+
+logger = logging.getLogger(__name__)
+
+# normal: mọi lượt gọi Gemini; degraded: trả lời bằng mẫu khi đủ dữ liệu, còn lại vẫn gọi
+# Gemini; shed: không gọi Gemini, chỉ trả lời mẫu hoặc hướng dẫn gọi hotline
+LEVELS = ("normal", "degraded", "shed")
+
+HOTLINE_FALLBACK = (
+    "Dạ, hiện có nhiều khách đang cần hỗ trợ cùng lúc. Anh/chị vui lòng để lại số điện thoại "
+    "hoặc gọi hotline 1900 636563, nhân viên tư vấn sẽ liên hệ ngay ạ!"
+)
+
+_PAX = re.compile(r"(\d+)\s*(?:người|khách|pax|ng\b)")
+_DAYS = re.compile(r"(\d+)\s*(?:ngày|ngay)")
+
+
+class AdmissionController:
+    """Chọn mức phục vụ cho từng lượt theo backlog của model gateway và tuổi lượt lâu nhất.
+
+    backlog = số lời gọi Gemini đang chạy/chờ slot + số lượt đang chờ trong TurnScheduler;
+    tuổi = thời gian lượt cũ nhất đang được xử lý (kể cả lúc chờ slot) đã chạy. Vượt ngưỡng
+    degrade thì chuyển sang câu trả lời mẫu, vượt ngưỡng shed thì ngừng gọi Gemini hẳn.
+    """
+
+    def __init__(self, backlog=None, degrade_backlog=None, shed_backlog=None, degrade_age=15, shed_age=40,
+                 clock=time.monotonic):
+        self.backlog = backlog or _model_backlog
+        self.degrade_backlog = degrade_backlog or Config.GEMINI_MAX_CONCURRENCY
+        self.shed_backlog = shed_backlog or Config.GEMINI_MAX_CONCURRENCY * 3
+        self.degrade_age = degrade_age
+        self.shed_age = shed_age
+        self.clock = clock
+        self.level = "normal"
+        self.changed_at = clock()
+        self.counters = {level: 0 for level in LEVELS}
+        self._active = {}  # {token: thời điểm bắt đầu}
+        self._lock = threading.Lock()
+
+    def oldest_age(self):
+        with self._lock:
+            started = min(self._active.values(), default=None)
+        return 0.0 if started is None else self.clock() - started
+
+    def current_level(self):
+        backlog = self.backlog()
+        age = self.oldest_age()
+        if backlog >= self.shed_backlog or age >= self.shed_age:
+            level = "shed"
+        elif backlog >= self.degrade_backlog or age >= self.degrade_age:
+            level = "degraded"
+        else:
+            level = "normal"
+        if level != self.level:
+            logger.warning(f"Admission: {self.level} -> {level} (backlog {backlog}, lượt lâu nhất {age:.1f}s)")
+            self.level = level
+            self.changed_at = self.clock()
+        return level
+
+    def admit(self):
+        """Mức phục vụ cho lượt sắp xử lý (đồng thời đếm theo mức)."""
+        level = self.current_level()
+        self.counters[level] += 1
+        return level
+
+    @contextmanager
+    def track(self):
+        """Bao quanh phần xử lý có thể gọi Gemini để tính tuổi lượt."""
+        token = object()
+        with self._lock:
+            self._active[token] = self.clock()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(token, None)
+
+    def status(self):
+        level = self.current_level()
+        return {
+            "level": level,
+            "since_seconds": round(self.clock() - self.changed_at, 1),
+            "backlog": self.backlog(),
+            "active_turns": len(self._active),
+            "oldest_turn_seconds": round(self.oldest_age(), 1),
+            "thresholds": {
+                "degrade_backlog": self.degrade_backlog,
+                "shed_backlog": self.shed_backlog,
+                "degrade_age": self.degrade_age,
+                "shed_age": self.shed_age,
+            },
+            "turns_by_level": dict(self.counters),
+        }
+
+
+def _model_backlog():
+    from services.model_gateway import model_gateway
+    from services.turn_scheduler import turn_schedulers
+    return model_gateway.backlog() + turn_schedulers.waiting()
+
+
+def _extract_number(pattern, text):
+    match = pattern.search(text.lower())
+    return int(match.group(1)) if match else None
+
+
+def visa_template(text, context, ai_processor):
+    """Báo giá visa từ catalog đã nạp (không gọi Gemini). None nếu chưa xác định được visa."""
+    country = context.get("country") or ai_processor._extract_country_from_query(text)
+    if not country or country.lower() not in ai_processor.visa_data:
+        return None
+    visa = ai_processor._select_best_visa(country.lower(), context)
+    if not visa or not visa.get("price"):
+        return None
+    update_quote(visa, ai_processor.usd_vnd_rate)
+    quote = visa["quote"]
+    name = country.title()
+    visa_type = f"{visa.get('visa_type', '')} {visa.get('visa_method', '')}".strip()
+    if visa_type:
+        name += f" ({visa_type})"
+    response = f"Dạ, visa {name} hiện có phí dịch vụ khoảng {quote['range_low']}-{quote['range_high']} triệu VND"
+    if visa.get("processing_time"):
+        response += f", thời gian xử lý {visa['processing_time']}"
+    return response + ". Để được tư vấn hồ sơ chi tiết, anh/chị vui lòng để lại số điện thoại hoặc gọi hotline 1900 636563 ạ!"
+
+
+def tour_template(text, context, ai_processor, tour_processor):
+    """Báo giá tour bằng bảng giá (_calculate_tour_price) khi đã biết nước, số người và số ngày."""
+    country = context.get("country") or ai_processor._extract_country_from_query(text)
+    pax = _extract_number(_PAX, text) or context.get("pax")
+    days = _extract_number(_DAYS, text) or context.get("days")
+    if not (country and pax and days):
+        return None
+    details = dict(context, country=country, pax=int(pax), days=int(days))
+    price_info = tour_processor._calculate_tour_price(country, int(pax), int(days), context.get("no_meal", False))
+    return tour_processor._build_price_response(price_info, details)
+
+
+def template_answer(intent, text, context, ai_processor, tour_processor):
+    """Câu trả lời xác định cho một lượt (None nếu không đủ dữ liệu để trả lời bằng mẫu)."""
+    try:
+        if intent == "visa":
+            return visa_template(text, context, ai_processor)
+        return tour_template(text, context, ai_processor, tour_processor)
+    except Exception as e:
+        logger.error(f"Lỗi khi tạo câu trả lời mẫu: {e}")
+        return None
+
+
+admission_controller = AdmissionController()
@@ -2,13 +2,19 @@
 """
 AI Processor for handling visa queries using Google Gemini API.
 """
-import google.generativeai as genai
 import asyncio
 import logging
 import re
 from datetime import datetime, timedelta
 
 from config import Config
+from services.country_cache import country_cache
+from services.faq_index import faq_index
+from services.message_packer import pack_message
+from services.model_gateway import model_gateway
+from services.registry import registry
+from services.visa_chunks import relevant_chunks
+from services.visa_quotes import annotate_visa, build_quote, duration_to_days, region_class
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,11 +23,11 @@ logger = logging.getLogger(__name__)
 class AIProcessor:
     def __init__(self):
         """Initialize AIProcessor with Gemini API and cache."""
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = model_gateway.model('gemini-2.0-flash')
         self.visa_data = {}  # Cache dữ liệu visa
         self.last_refresh = None  # Thời gian làm mới cache cuối cùng
         self.conversation_context = {}  # Theo dõi ngữ cảnh hội thoại
+        self.usd_vnd_rate = Config.USD_VND_RATE  # Tỷ giá quy đổi giá visa
 
     async def load_visa_data(self, country=None):
         """Load visa data from database, optionally for a specific country."""
@@ -35,6 +41,7 @@ class AIProcessor:
             logger.info(f"Tìm thấy {len(visas)} bản ghi visa trong database")
             for visa in visas:
                 visa['_id'] = str(visa['_id'])
+                annotate_visa(visa, self.usd_vnd_rate)
                 country_key = visa.get('country', '').lower()
                 if country_key not in self.visa_data:
                     self.visa_data[country_key] = []
@@ -165,15 +172,16 @@ class AIProcessor:
                         role = "Khách hàng" if msg['sender'] == 'user' else "Tư vấn viên"
                         context_str += f"{role}: {msg['message']}\n"
 
-            prompt = self._build_visa_prompt(user_query, visa_info, context_str, context_to_return)
+            prompt = self._build_visa_prompt(user_query, visa_info, context_str, context_to_return,
+                                             faq_snippets=faq_index.snippets(user_query))
             
             # THAY ĐỔI Ở ĐÂY
             raw_response = await self._generate_response(prompt)
             
             # Xử lý phản hồi dài
-            if len(raw_response) > 160:
+            response_parts = self._split_message(raw_response)
+            if len(response_parts) > 1:
                 # Phản hồi quá dài, trả về một mảng
-                response_parts = self._split_message(raw_response)
                 return {"type": "multi_part", "messages": response_parts}, context_to_return
             else:
                 # Phản hồi ngắn, trả về một chuỗi đơn như trước
@@ -188,15 +196,9 @@ class AIProcessor:
 
     async def _save_customer_contact(self, name, phone, country, user_id, context=None):
         """Save customer contact with a detailed description capturing special cases."""
-        from services.database import db
         from services.lead_service import lead_service
         try:
-            leads_collection = db.get_collection("leads")
-            existing_lead = leads_collection.find_one({"phone": phone})
-            if existing_lead:
-                logger.info(f"Lead với SĐT {phone} đã tồn tại, không cập nhật")
-                return True
-
+            # Lead trùng SĐT được gộp bằng upsert theo SĐT chuẩn hóa (services.lead_merge)
             if not name and context:
                 name = self._extract_customer_name_from_context(context, phone)
 
@@ -284,10 +286,11 @@ class AIProcessor:
                 "original_query": original_query,
                 "special_concerns": special_concerns,
                 "special_case_types": special_case_types,
+                "service_type": "visa",
                 "description": final_description
             }
 
-            lead_id = lead_service.create_lead_with_description(customer_data, final_description)
+            lead_service.create_lead_with_description(customer_data, final_description)
             logger.info(f"Đã lưu thông tin khách hàng: {phone} với mô tả: {final_description}")
             return True
 
@@ -569,11 +572,10 @@ class AIProcessor:
         if "stay_duration" in context and context["stay_duration"].get("days"):
             target_days = context["stay_duration"]["days"]
             for visa in visas:
-                for opt in visa.get("costs", {}).get("options", []):
-                    opt_days = self._convert_duration_to_days(opt.get("duration", ""))
-                    if opt_days >= target_days:
-                        best_visa = visa
-                        break
+                if "max_duration_days" not in visa:
+                    annotate_visa(visa, self.usd_vnd_rate)
+                if visa["max_duration_days"] >= target_days:
+                    best_visa = visa
         elif "family_travel" in context and context["family_travel"]:
             best_visa = min(visas, key=lambda v: v.get("price", float('inf')))
         logger.info(f"Selected visa for {country}: {best_visa.get('price')} USD")
@@ -581,33 +583,12 @@ class AIProcessor:
 
     def _convert_duration_to_days(self, duration_str):
         """Convert visa duration string to days."""
-        if not duration_str:
-            return 0
-        duration_str = duration_str.lower()
-        if "ngày" in duration_str:
-            try:
-                return int(re.search(r'(\d+)', duration_str).group(1))
-            except Exception:
-                return 30
-        elif "tháng" in duration_str:
-            try:
-                months = int(re.search(r'(\d+)', duration_str).group(1))
-                return months * 30
-            except Exception:
-                return 90
-        elif "năm" in duration_str:
-            try:
-                years = int(re.search(r'(\d+)', duration_str).group(1))
-                return years * 365
-            except Exception:
-                return 365
-        return 90
+        return duration_to_days(duration_str)
 
     async def _generate_response(self, prompt):
         """Generate response using Gemini API."""
         try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, lambda: self.model.generate_content(prompt))
+            response = await model_gateway.generate_async(prompt)
             result = response.text.strip()
             if len(result) < 100 and "số điện thoại" not in result.lower():
                 result += " Anh/chị vui lòng để lại số điện thoại để tư vấn viên liên hệ hỗ trợ chi tiết nhé!"
@@ -616,7 +597,7 @@ class AIProcessor:
             logger.error(f"Lỗi khi tạo phản hồi: {e}")
             return "Xin lỗi, tôi không thể trả lời vào lúc này. Vui lòng gọi 1900 636563 để được hỗ trợ."
 
-    def _build_visa_prompt(self, query, visa_info, context_str="", user_context=None):
+    def _build_visa_prompt(self, query, visa_info, context_str="", user_context=None, faq_snippets=None):
         """Build an effective prompt for visa queries with optimized price range."""
         prompt = (
             "Bạn là tư vấn viên visa chuyên nghiệp tại Passport Lounge với giọng điệu tự nhiên giống người, lịch sự và thân thiện.\n"
@@ -633,53 +614,32 @@ class AIProcessor:
             prompt += f"\nDữ liệu sản phẩm visa {country_name}:\n"
             prompt += f"- Loại visa: {visa_info.get('visa_type', '')} {visa_info.get('visa_method', '')}\n"
             
-            # Tính toán giá với range hợp lý
+            # Giá VND và khoảng giá báo khách đã được tính sẵn khi nạp catalog
             price = visa_info.get('price', 0)
             if price:
-                price_vnd = int(price * 25000)  # Tỷ giá 25,000 VND/USD
-                price_million = price_vnd / 1000000  # Quy đổi sang triệu VND
-
-                # Phân loại quốc gia và tính range giá hợp lý
-                premium_countries = ['mỹ', 'anh quốc', 'canada', 'úc', 'new zealand']
-                schengen_countries = ['đức (visa schengen)', 'ý (visa schengen)', 'pháp (visa schengen)', 
-                                    'tây ban nha (visa schengen)', 'thụy sĩ (visa schengen)', 
-                                    'thụy điển (visa schengen)', 'ch séc (visa schengen)', 
-                                    'phần lan (visa schengen)', 'na uy (visa schengen)', 
-                                    'hy lạp (visa schengen)', 'hà lan (visa schengen)', 
-                                    'đan mạch (visa schengen)', 'bồ đào nha (visa schengen)', 
-                                    'bỉ (visa schengen)', 'áo (visa schengen)']
-
-                if country_name in premium_countries:
-                    # Nhóm cao cấp: range ±15% (không quá rộng, hợp lý)
-                    price_range_low = round(price_million * 0.85, 1)
-                    price_range_high = round(price_million * 1.15, 1)
-                elif country_name in schengen_countries:
-                    # Nhóm Schengen: range ±10% (hẹp hơn vì giá đồng nhất)
-                    price_range_low = round(price_million * 0.9, 1)
-                    price_range_high = round(price_million * 1.1, 1)
-                else:
-                    # Nhóm khác: range ±12% (trung bình, tối ưu)
-                    price_range_low = round(price_million * 0.88, 1)
-                    price_range_high = round(price_million * 1.12, 1)
-
-                # Điều chỉnh để range không quá rộng (tối đa chênh 2 triệu)
-                if price_range_high - price_range_low > 2:
-                    price_range_high = price_range_low + 2
-
-                # Đảm bảo range hợp lý (ít nhất chênh 0.5 triệu)
-                if price_range_high - price_range_low < 0.5:
-                    price_range_high = price_range_low + 0.5
-
-                prompt += f"- Giá thật: ${price} USD (khoảng {price_vnd:,} VND)\n"
-                prompt += f"- Giá báo khách: khoảng {price_range_low}-{price_range_high} triệu VND\n"
+                quote = visa_info.get('quote')
+                if not quote or quote.get('rate') != self.usd_vnd_rate:
+                    region = visa_info.get('region_class') or region_class(country_name)
+                    quote = build_quote(price, region, self.usd_vnd_rate)
+                prompt += f"- Giá thật: ${price} USD (khoảng {quote['price_vnd']:,} VND)\n"
+                prompt += f"- Giá báo khách: khoảng {quote['range_low']}-{quote['range_high']} triệu VND\n"
             
             prompt += f"- Thời gian xử lý: {visa_info.get('processing_time', '')}\n"
+
+            # Chỉ đưa vào các đoạn hồ sơ/chi phí liên quan tới câu hỏi thay vì cả bản ghi
+            chunks = relevant_chunks(visa_info, query)
+            if chunks:
+                prompt += "- Thông tin liên quan tới câu hỏi:\n" + "".join(f"  + {chunk}\n" for chunk in chunks)
         else:
             prompt += (
                 "\nKhông có dữ liệu cụ thể về visa này trong cơ sở dữ liệu. "
                 "Trả lời ngắn gọn và hỏi thêm thông tin để hiểu nhu cầu khách hàng."
             )
 
+        if faq_snippets:
+            prompt += "\nCâu hỏi thường gặp liên quan (tham khảo, diễn đạt lại ngắn gọn):\n"
+            prompt += "\n\n".join(faq_snippets) + "\n"
+
         has_concerns = user_context and user_context.get('has_special_concerns', False)
         if has_concerns:
             prompt += (
@@ -762,6 +722,11 @@ class AIProcessor:
             logger.info(f"Phát hiện quốc gia từ pattern: '{country_from_pattern}'")
             return country_from_pattern
         
+        # Câu hỏi tương tự đã được AI xử lý trước đó (kể cả kết quả NONE)
+        found, cached_country = country_cache.get(query)
+        if found:
+            return self._standardize_country_name(cached_country) if cached_country else None
+        
         # Nếu không tìm được bằng pattern, sử dụng AI
         prompt = (
             "Nhiệm vụ: Xác định quốc gia được đề cập trong câu hỏi về visa dưới đây.\n"
@@ -784,8 +749,7 @@ class AIProcessor:
         
         try:
             # Gửi prompt tới Gemini API
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, lambda: self.model.generate_content(prompt))
+            response = await model_gateway.generate_async(prompt)
             result = response.text.strip().lower()
             
             # Loại bỏ dấu câu và ký tự thừa
@@ -795,7 +759,10 @@ class AIProcessor:
             logger.info(f"AI nhận diện quốc gia từ '{query}': '{result}'")
             
             if result == "none" or not result:
+                country_cache.set(query, None)
                 return None
+            
+            country_cache.set(query, result)
                 
             # Chuẩn hóa tên quốc gia
             return self._standardize_country_name(result)
@@ -820,27 +787,7 @@ class AIProcessor:
 
     def _split_message(self, message):
         """Chia nhỏ tin nhắn nếu vượt quá giới hạn ký tự của Zalo."""
-        ZALO_MESSAGE_LIMIT = 160  # Giới hạn ký tự Zalo
-        
-        if len(message) <= ZALO_MESSAGE_LIMIT:
-            return [message]
-        
-        messages = []
-        lines = message.split('\n')
-        current_message = ""
-        
-        for line in lines:
-            if len(current_message) + len(line) + 1 > ZALO_MESSAGE_LIMIT:
-                if current_message:
-                    messages.append(current_message.strip())
-                current_message = line
-            else:
-                current_message += f"\n{line}" if current_message else line
-        
-        if current_message:
-            messages.append(current_message.strip())
-        
-        return messages
+        return pack_message(message)
 
     async def _generate_and_format_response(self, prompt, context):
         """Tạo phản hồi và định dạng phù hợp."""
@@ -906,4 +853,5 @@ class AIProcessor:
         # Mặc định: không chắc chắn
         return None
 
-ai_processor = AIProcessor()
\ No newline at end of file
+# Khởi tạo khi dùng lần đầu (xem services.registry)
+ai_processor = registry.lazy("ai_processor")
\ No newline at end of file
@@ -1,9 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from bson import ObjectId
 from services.database import db
 from models.booking import Booking
 
+# Collection và các trường cần để hiển thị tên dịch vụ theo từng loại booking
+SERVICE_COLLECTIONS = {
+    "tour": ("tours", {"name": 1}),
+    "visa": ("visas", {"country": 1, "visa_type": 1}),
+    "flight": ("flights", {"airline": 1, "flight_number": 1, "departure": 1, "destination": 1})
+}
+
+SERVICE_NAME_TTL = 600
+
+
+class ServiceNameCache:
+    """LRU có thời hạn trong tiến trình: (service_type, service_id) -> tên dịch vụ."""
+
+    def __init__(self, max_size=5000, ttl=SERVICE_NAME_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {key: (name, expires_at)}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Tên đã cache và còn hạn, không thì None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, name):
+        with self._lock:
+            self._entries[key] = (name, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_service_name_cache = ServiceNameCache()
+
+
+def _format_service_name(service_type, service):
+    if service_type == "tour":
+        return service["name"]
+    if service_type == "visa":
+        return f"Visa {service['country']} - {service['visa_type']}"
+    if service_type == "flight":
+        return f"{service['airline']} {service['flight_number']} ({service['departure']} - {service['destination']})"
+    return None
+
+
 class BookingService:
+    def _resolve_service_names(self, bookings):
+        """Gắn service_name cho danh sách booking: mỗi loại dịch vụ tối đa một truy vấn $in"""
+        missing = {}
+        for booking in bookings:
+            key = (booking.get("service_type"), booking.get("service_id"))
+            cached = _service_name_cache.get(key)
+            if cached:
+                booking["service_name"] = cached
+            elif key[0] in SERVICE_COLLECTIONS:
+                missing.setdefault(key[0], set()).add(key[1])
+
+        for service_type, service_ids in missing.items():
+            collection_name, projection = SERVICE_COLLECTIONS[service_type]
+            services = db.get_collection(collection_name).find({"_id": {"$in": list(service_ids)}}, projection)
+            for service in services:
+                _service_name_cache.set((service_type, service["_id"]), _format_service_name(service_type, service))
+
+        for booking in bookings:
+            if "service_name" in booking:
+                continue
+            cached = _service_name_cache.get((booking.get("service_type"), booking.get("service_id")))
+            if cached:
+                booking["service_name"] = cached
+        return bookings
+
+    def _booking_details_pipeline(self, booking_id, service_type=None):
+        """Aggregate lấy booking kèm chi tiết dịch vụ trong một round trip.
+
+        Mỗi collection dịch vụ có một $lookup dạng pipeline, chỉ khớp khi service_type của booking
+        trùng loại của collection đó; biết trước service_type thì chỉ $lookup đúng một collection.
+        """
+        pipeline = [{"$match": {"_id": booking_id}}, {"$limit": 1}]
+        if service_type is not None:
+            pipeline[0]["$match"]["service_type"] = service_type
+        for lookup_type, (collection_name, _) in SERVICE_COLLECTIONS.items():
+            if service_type is not None and lookup_type != service_type:
+                continue
+            pipeline.append({"$lookup": {
+                "from": collection_name,
+                "let": {"sid": "$service_id", "stype": "$service_type"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$$stype", lookup_type]},
+                        {"$eq": ["$_id", "$$sid"]}
+                    ]}}},
+                    {"$limit": 1}
+                ],
+                "as": f"_{lookup_type}_details"
+            }})
+        return pipeline
+
     def create_tour_booking(self, user_id, tour_id, user_info):
         """Tạo đặt tour mới"""
         try:
@@ -148,27 +258,10 @@ class BookingService:
     def get_user_bookings(self, user_id):
         """Lấy danh sách đặt dịch vụ của người dùng"""
         try:
-            bookings = list(db.bookings.find({"user_id": user_id}).sort("booking_date", -1))
+            bookings = list(db.get_collection("bookings").find({"user_id": user_id}).sort("booking_date", -1))
             
             # Thêm thông tin chi tiết về dịch vụ
-            for booking in bookings:
-                service_type = booking["service_type"]
-                service_id = booking["service_id"]
-                
-                if service_type == "tour":
-                    tour = db.tours.find_one({"_id": service_id})
-                    if tour:
-                        booking["service_name"] = tour["name"]
-                        
-                elif service_type == "visa":
-                    visa = db.visas.find_one({"_id": service_id})
-                    if visa:
-                        booking["service_name"] = f"Visa {visa['country']} - {visa['visa_type']}"
-                        
-                elif service_type == "flight":
-                    flight = db.flights.find_one({"_id": service_id})
-                    if flight:
-                        booking["service_name"] = f"{flight['airline']} {flight['flight_number']} ({flight['departure']} - {flight['destination']})"
+            self._resolve_service_names(bookings)
             
             return {
                 "success": True,
@@ -183,30 +276,28 @@ class BookingService:
                 "message": "Đã xảy ra lỗi khi lấy thông tin đặt dịch vụ"
             }
     
-    def get_booking_details(self, booking_id):
-        """Lấy thông tin chi tiết của một đặt dịch vụ"""
+    def get_booking_details(self, booking_id, service_type=None):
+        """Lấy thông tin chi tiết của một đặt dịch vụ (một lần aggregate; service_type chỉ để thu hẹp $lookup)"""
         try:
-            booking = db.bookings.find_one({"_id": ObjectId(booking_id)})
-            if not booking:
+            pipeline = self._booking_details_pipeline(ObjectId(booking_id), service_type)
+            results = list(db.get_collection("bookings").aggregate(pipeline))
+            if not results:
                 return {
                     "success": False,
                     "message": "Không tìm thấy thông tin đặt dịch vụ"
                 }
             
-            service_type = booking["service_type"]
-            service_id = booking["service_id"]
+            booking = results[0]
+            matches = {lookup_type: booking.pop(f"_{lookup_type}_details", [])
+                       for lookup_type in SERVICE_COLLECTIONS}
             
-            # Lấy thông tin chi tiết của dịch vụ
+            # Lấy thông tin chi tiết của dịch vụ (booking thiếu service_type thì trả về không kèm chi tiết)
             service_details = None
-            
-            if service_type == "tour":
-                service_details = db.tours.find_one({"_id": service_id})
-                
-            elif service_type == "visa":
-                service_details = db.visas.find_one({"_id": service_id})
-                
-            elif service_type == "flight":
-                service_details = db.flights.find_one({"_id": service_id})
+            found = matches.get(booking.get("service_type"))
+            if found:
+                service_details = found[0]
+                _service_name_cache.set((booking["service_type"], booking["service_id"]),
+                                        _format_service_name(booking["service_type"], service_details))
             
             return {
                 "success": True,
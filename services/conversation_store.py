@@ -0,0 +1,256 @@
+# Service for conversation state (context/history) with sliding TTL and cold-storage archival
+import logging
+import threading
+import time
+
+import redis
+
+from models.conversation import decode_context, decode_history, encode_context, encode_history
+from services.oa_registry import scoped_id
+
+logger = logging.getLogger(__name__)
+
+# Client nhị phân: context/history lưu bằng codec msgpack trong models.conversation
+redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=False)
+
+ARCHIVE_COLLECTION = "conversation_archive"
+
+# Xóa context/history chỉ khi người dùng chưa quay lại kể từ lúc archiver đọc dữ liệu
+_RELEASE_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) <= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[2], KEYS[3])
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def _archive_collection():
+    from services.database import db
+    return db.get_collection(ARCHIVE_COLLECTION)
+
+
+class ConversationStore:
+    """Đọc/ghi `context:{user_id}` và `history:{user_id}` (dict context và danh sách Turn) với TTL trượt.
+
+    Mỗi lần ghi làm mới TTL của cả hai khóa và cập nhật zset `conversations:last_seen`.
+    Archiver định kỳ chuyển các hội thoại im lặng quá `idle_after` giây sang Mongo
+    theo lô rồi xóa khỏi Redis; lần đọc tiếp theo của người dùng đó nạp lại từ Mongo.
+    TTL (mặc định 7 ngày) là lưới an toàn khi archiver không chạy.
+
+    user_id được gắn namespace của OA hiện tại (services.oa_registry.scoped_id); các hàm nội bộ
+    và archiver làm việc trực tiếp với id đã gắn namespace.
+    """
+
+    CONTEXT_PREFIX = "context:"
+    HISTORY_PREFIX = "history:"
+    LAST_SEEN_KEY = "conversations:last_seen"
+
+    def __init__(self, redis_client, ttl=7 * 24 * 3600, idle_after=24 * 3600, batch_size=200,
+                 archive_collection=None):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.idle_after = idle_after
+        self.batch_size = batch_size
+        self.archive_collection = archive_collection or _archive_collection
+        self._release = redis_client.register_script(_RELEASE_SCRIPT)
+        self._archiver = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _member(user_id):
+        return user_id.decode("utf-8") if isinstance(user_id, bytes) else user_id
+
+    def _keys(self, user_id):
+        return f"{self.CONTEXT_PREFIX}{user_id}", f"{self.HISTORY_PREFIX}{user_id}"
+
+    def _load(self, user_id, key):
+        """GET một khóa; nếu người dùng không có trong last_seen thì thử nạp lại từ archive."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.zscore(self.LAST_SEEN_KEY, user_id)
+        value, last_seen = pipe.execute()
+        if value is not None or last_seen is not None:
+            return value
+        self._rehydrate(user_id)
+        return self.redis_client.get(key)
+
+    def _rehydrate(self, user_id):
+        context_key, history_key = self._keys(user_id)
+        doc = None
+        try:
+            doc = self.archive_collection().find_one({"_id": user_id})
+        except Exception as e:
+            logger.warning(f"Không đọc được hội thoại lưu trữ của {user_id}: {e}")
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        if doc:
+            if doc.get("context") is not None:
+                pipe.set(context_key, doc["context"], ex=self.ttl, nx=True)
+            if doc.get("history") is not None:
+                pipe.set(history_key, doc["history"], ex=self.ttl, nx=True)
+        # Đánh dấu đã kiểm tra để các lần đọc sau không hỏi lại Mongo
+        pipe.zadd(self.LAST_SEEN_KEY, {user_id: time.time()})
+        pipe.execute()
+
+        if doc:
+            logger.info(f"Nạp lại hội thoại của {user_id} từ {ARCHIVE_COLLECTION}")
+            try:
+                self.archive_collection().delete_one({"_id": user_id})
+            except Exception as e:
+                logger.warning(f"Không xóa được bản lưu trữ của {user_id}: {e}")
+
+    def _write(self, user_id, context_value=None, history_value=None):
+        """Ghi các khóa được truyền, làm mới TTL của cả hai và cập nhật last_seen trong một round trip."""
+        context_key, history_key = self._keys(user_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, value in ((context_key, context_value), (history_key, history_value)):
+            if value is None:
+                pipe.expire(key, self.ttl)
+            else:
+                pipe.set(key, value, ex=self.ttl)
+        pipe.zadd(self.LAST_SEEN_KEY, {user_id: time.time()})
+        pipe.execute()
+
+    def get_context(self, user_id):
+        cid = scoped_id(user_id)
+        return decode_context(self._load(cid, self._keys(cid)[0]))
+
+    def set_context(self, user_id, context):
+        self._write(scoped_id(user_id), context_value=encode_context(context))
+
+    def get_history(self, user_id):
+        """Danh sách Turn (đọc được cả lịch sử JSON "User: ..." cũ)."""
+        cid = scoped_id(user_id)
+        return decode_history(self._load(cid, self._keys(cid)[1]))
+
+    def set_history(self, user_id, turns, keep=10):
+        self._write(scoped_id(user_id), history_value=encode_history(turns[-keep:]))
+
+    def append_history(self, user_id, *turns, keep=10):
+        self.set_history(user_id, self.get_history(user_id) + list(turns), keep=keep)
+
+    def reset(self, user_id, context=None):
+        """Ghi context mới (hoặc rỗng) và xóa lịch sử."""
+        cid = scoped_id(user_id)
+        self.redis_client.delete(self._keys(cid)[1])
+        self._write(cid, context_value=encode_context(context or {}))
+
+    def archive_idle(self, now=None):
+        """Chuyển một lô hội thoại im lặng sang Mongo. Trả về số hội thoại đã chuyển."""
+        from pymongo import ReplaceOne
+
+        now = now or time.time()
+        cutoff = now - self.idle_after
+        user_ids = self.redis_client.zrangebyscore(self.LAST_SEEN_KEY, '-inf', cutoff,
+                                                   start=0, num=self.batch_size, withscores=True)
+        if not user_ids:
+            return 0
+
+        # Client nhị phân trả member dạng bytes
+        user_ids = [(self._member(user_id), last_seen) for user_id, last_seen in user_ids]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for user_id, _ in user_ids:
+            pipe.mget(*self._keys(user_id))
+        values = pipe.execute()
+
+        operations = []
+        for (user_id, last_seen), (context, history) in zip(user_ids, values):
+            if context is None and history is None:
+                continue
+            operations.append(ReplaceOne({"_id": user_id}, {
+                "context": context,
+                "history": history,
+                "last_seen": last_seen,
+                "archived_at": now,
+            }, upsert=True))
+        if operations:
+            self.archive_collection().bulk_write(operations, ordered=False)
+
+        archived = 0
+        returned = []
+        for user_id, _ in user_ids:
+            context_key, history_key = self._keys(user_id)
+            released = self._release(keys=[self.LAST_SEEN_KEY, context_key, history_key], args=[user_id, cutoff])
+            archived += released
+            if not released:
+                returned.append(user_id)
+        if returned and operations:
+            # Người dùng quay lại trong lúc lưu trữ: Redis vẫn là bản mới nhất, bỏ bản lưu trữ vừa ghi
+            # (chỉ bản của lần chạy này, theo archived_at) để không nạp lại dữ liệu cũ sau này
+            try:
+                self.archive_collection().delete_many({"_id": {"$in": returned}, "archived_at": now})
+            except Exception as e:
+                logger.warning(f"Không xóa được {len(returned)} bản lưu trữ cũ: {e}")
+        logger.info(f"Đã lưu trữ {archived}/{len(user_ids)} hội thoại im lặng vào {ARCHIVE_COLLECTION}")
+        return archived
+
+    def backfill_untracked(self, now=None, scan_count=500):
+        """Gắn TTL và mục last_seen cho các khóa context/history ghi bằng SET thường trước khi có store này.
+
+        Các khóa đó không có TTL (TTL = -1) và không nằm trong zset nên archiver không bao giờ thấy.
+        Chỉ đụng tới khóa chưa có TTL, nên chạy lại nhiều lần vẫn an toàn. Trả về số khóa đã sửa.
+        """
+        now = now or time.time()
+        fixed = 0
+        for prefix in (self.CONTEXT_PREFIX, self.HISTORY_PREFIX):
+            keys = list(self.redis_client.scan_iter(match=f"{prefix}*", count=scan_count))
+            for start in range(0, len(keys), scan_count):
+                batch = keys[start:start + scan_count]
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key in batch:
+                    pipe.ttl(key)
+                ttls = pipe.execute()
+
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, ttl in zip(batch, ttls):
+                    if ttl != -1:
+                        continue
+                    user_id = self._member(key)[len(prefix):]
+                    pipe.expire(key, self.ttl)
+                    # nx: không lùi last_seen của người dùng đang hoạt động
+                    pipe.zadd(self.LAST_SEEN_KEY, {user_id: now}, nx=True)
+                    fixed += 1
+                pipe.execute()
+        if fixed:
+            logger.info(f"Đã gắn TTL/last_seen cho {fixed} khóa hội thoại cũ")
+        return fixed
+
+    def _run_archiver(self, interval):
+        try:
+            self.backfill_untracked()
+        except Exception as e:
+            logger.error(f"Lỗi khi gắn TTL cho khóa hội thoại cũ: {e}")
+        while not self._stop.wait(interval):
+            try:
+                # Chạy liên tục khi còn lô đầy, nghỉ khi đã hết hội thoại cần chuyển
+                while self.archive_idle() >= self.batch_size and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Lỗi khi lưu trữ hội thoại: {e}")
+
+    def start_archiver(self, interval=300):
+        """Chạy archiver trên thread nền (một lần cho mỗi tiến trình)."""
+        if self._archiver is None or not self._archiver.is_alive():
+            self._stop.clear()
+            self._archiver = threading.Thread(target=self._run_archiver, args=(interval,),
+                                              name="conversation-archiver", daemon=True)
+            self._archiver.start()
+        return self
+
+    def stop_archiver(self):
+        self._stop.set()
+
+
+conversation_store = ConversationStore(redis_client)
+
+
+def start_archiver():
+    return conversation_store.start_archiver()
+
+
+if __name__ == "__main__":
+    conversation_store.backfill_untracked()
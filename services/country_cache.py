@@ -0,0 +1,122 @@
+# Service for caching AI country detection results
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Redis dùng chung giữa các worker
+redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+
+NONE_MARKER = "NONE"
+
+# Dòng log do AIProcessor._extract_country_with_ai ghi ra
+LOG_PATTERN = re.compile(r"AI nhận diện quốc gia từ '(?P<query>.*)': '(?P<result>.*)'\s*$")
+
+
+def normalize_country_query(query):
+    """Chuẩn hóa câu hỏi làm khóa cache: chữ thường, bỏ dấu câu, gộp khoảng trắng (giữ dấu tiếng Việt)."""
+    if not query:
+        return ""
+    text = unicodedata.normalize("NFC", str(query)).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class CountryCache:
+    """Cache kết quả nhận diện quốc gia theo câu hỏi đã chuẩn hóa, lưu cả kết quả NONE.
+
+    Dict cục bộ phía trước (tránh round trip cho câu lặp lại trên cùng worker),
+    Redis phía sau để chia sẻ giữa các worker. Kết quả NONE có TTL ngắn hơn để
+    câu hỏi bị nhận diện sai không bị kẹt quá lâu.
+    """
+
+    KEY_PREFIX = "country:q:"
+
+    def __init__(self, redis_client=None, ttl=7 * 24 * 3600, none_ttl=24 * 3600, local_size=5000):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.none_ttl = none_ttl
+        self.local_size = local_size
+        self._local = OrderedDict()  # {normalized_query: (result, expires_at)}
+        self._lock = threading.Lock()
+
+    def _key(self, normalized):
+        return self.KEY_PREFIX + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def _remember(self, normalized, value, ttl):
+        with self._lock:
+            self._local[normalized] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(normalized)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, query):
+        """Trả về (found, country). country là None khi đã biết câu hỏi không có quốc gia."""
+        normalized = normalize_country_query(query)
+        if not normalized:
+            return False, None
+
+        with self._lock:
+            entry = self._local.get(normalized)
+            if entry and entry[1] > time.monotonic():
+                self._local.move_to_end(normalized)
+                return True, None if entry[0] == NONE_MARKER else entry[0]
+
+        if self.redis_client is None:
+            return False, None
+        try:
+            value = self.redis_client.get(self._key(normalized))
+        except Exception as e:
+            logger.warning(f"Không đọc được cache quốc gia từ Redis: {e}")
+            return False, None
+        if value is None:
+            return False, None
+
+        self._remember(normalized, value, self.none_ttl if value == NONE_MARKER else self.ttl)
+        return True, None if value == NONE_MARKER else value
+
+    def set(self, query, country):
+        """Lưu kết quả nhận diện; country rỗng/None được lưu dưới dạng NONE."""
+        normalized = normalize_country_query(query)
+        if not normalized:
+            return
+        value = country or NONE_MARKER
+        ttl = self.none_ttl if value == NONE_MARKER else self.ttl
+        self._remember(normalized, value, ttl)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.setex(self._key(normalized), ttl, value)
+        except Exception as e:
+            logger.warning(f"Không ghi được cache quốc gia vào Redis: {e}")
+
+    def seed_from_log(self, lines):
+        """Nạp cache từ log cũ (các dòng 'AI nhận diện quốc gia từ ...'). Trả về số mục đã nạp."""
+        count = 0
+        for line in lines:
+            match = LOG_PATTERN.search(line)
+            if not match:
+                continue
+            result = match.group("result").strip()
+            self.set(match.group("query"), None if result in ("", "none") else result)
+            count += 1
+        return count
+
+
+country_cache = CountryCache(redis_client)
+
+
+if __name__ == "__main__":
+    import sys
+    seeded = 0
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            seeded += country_cache.seed_from_log(f)
+    print(f"Đã nạp {seeded} kết quả nhận diện quốc gia vào cache")
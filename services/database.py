@@ -3,15 +3,38 @@ from config import Config
 
 class Database:
     def __init__(self):
+        # Kết nối được tạo ở lần truy cập đầu tiên, import module không mở kết nối
+        self._client = None
+        self._db = None
+
+    def _connect(self):
         try:
             # Sửa MONGO_URI thành MONGODB_URI để khớp với config.py
-            self.client = MongoClient(Config.MONGODB_URI)
-            self.db = self.client[Config.MONGODB_DB]
+            self._client = MongoClient(Config.MONGODB_URI)
+            self._db = self._client[Config.MONGODB_DB]
             print("MongoDB connected successfully")
         except Exception as e:
             print(f"MongoDB connection error: {e}")
             raise
 
+    @property
+    def client(self):
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._connect()
+        return self._db
+
+    def __getattr__(self, name):
+        # db.tours, db.bookings... trả về collection tương ứng
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.db[name]
+
     def get_collection(self, collection_name):
         return self.db[collection_name]
 
@@ -22,7 +45,13 @@ class Database:
         return self.db[collection_name].find(query or {}, projection or {})
 
     def close(self):
-        if self.client:
-            self.client.close()
+        if self._client:
+            self._client.close()
+
+db = Database()
+
 
-db = Database()
\ No newline at end of file
+def connect():
+    """Mở kết nối Mongo ngay (dùng khi warm-up lúc khởi động)"""
+    db.client
+    return db
\ No newline at end of file
@@ -0,0 +1,80 @@
+# Service for webhook event deduplication
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEventCache:
+    """LRU có thời hạn trong tiến trình, dùng để chặn retry trùng lặp mà không cần gọi Redis."""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {event_id: expires_at}
+        self._lock = threading.Lock()
+
+    def seen(self, event_id):
+        """Trả về True nếu event_id đã được ghi nhận và chưa hết hạn."""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(event_id)
+            if expires_at is None:
+                return False
+            if expires_at <= now:
+                del self._entries[event_id]
+                return False
+            self._entries.move_to_end(event_id)
+            return True
+
+    def add(self, event_id):
+        """Ghi nhận event_id. Trả về False nếu event đã tồn tại (và còn hạn)."""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(event_id)
+            if expires_at is not None and expires_at > now:
+                self._entries.move_to_end(event_id)
+                return False
+            self._entries[event_id] = now + self.ttl
+            self._entries.move_to_end(event_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def discard(self, event_id):
+        with self._lock:
+            self._entries.pop(event_id, None)
+
+
+class EventDeduplicator:
+    """Khử trùng lặp webhook: LRU cục bộ phía trước, Redis SET NX EX phía sau (1 round trip)."""
+
+    KEY_PREFIX = "event:"
+
+    def __init__(self, redis_client=None, ttl=300, local_size=10000):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.local = LocalEventCache(max_size=local_size, ttl=ttl)
+
+    def claim(self, event_id, value="1"):
+        """Nhận quyền xử lý event. Trả về True nếu đây là lần đầu event được thấy.
+
+        Retry trùng lặp trên cùng worker bị loại ngay bởi LRU cục bộ. Giữa các worker,
+        `SET key value NX EX ttl` là thao tác nguyên tử nên chỉ một worker thắng.
+        """
+        if not self.local.add(event_id):
+            return False
+
+        if self.redis_client is None:
+            return True
+
+        try:
+            claimed = self.redis_client.set(f"{self.KEY_PREFIX}{event_id}", value, nx=True, ex=self.ttl)
+            return bool(claimed)
+        except Exception as e:
+            # Redis gặp sự cố: vẫn xử lý, LRU cục bộ đã chặn retry trên worker này
+            logger.warning(f"Redis dedup unavailable, using local cache only: {e}")
+            return True
@@ -0,0 +1,74 @@
+# Service for answering FAQ-style questions from the curated faqs collection
+import logging
+import threading
+import time
+
+from services.text_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+
+def _load_faqs():
+    from services.database import db
+    return list(db.faqs.find({}, {"_id": 0, "question": 1, "answer": 1}))
+
+
+class FAQIndex:
+    """Chỉ mục BM25 trên câu hỏi của collection `faqs`, nạp lại sau mỗi `ttl` giây.
+
+    `answer()` trả lời thẳng khi câu hỏi khớp một FAQ với độ tin cậy >= `answer_threshold`
+    (không gọi Gemini); `snippets()` trả về vài FAQ liên quan để đưa vào prompt khi chưa đủ chắc.
+    """
+
+    def __init__(self, loader=None, ttl=600, answer_threshold=0.7, snippet_threshold=0.25):
+        self.loader = loader or _load_faqs
+        self.ttl = ttl
+        self.answer_threshold = answer_threshold
+        self.snippet_threshold = snippet_threshold
+        self._faqs = []
+        self._index = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            try:
+                faqs = [faq for faq in self.loader() if faq.get("question") and faq.get("answer")]
+                self._index = BM25Index([faq["question"] for faq in faqs])
+                self._faqs = faqs
+                logger.info(f"Đã nạp {len(faqs)} FAQ vào chỉ mục")
+            except Exception as e:
+                # Giữ chỉ mục cũ (nếu có), thử lại ở lần nạp sau
+                logger.warning(f"Không nạp được FAQ: {e}")
+            self._loaded_at = time.monotonic()
+
+    def search(self, text, k=3):
+        """Danh sách (faq, confidence) khớp nhất."""
+        self._ensure_loaded()
+        if self._index is None:
+            return []
+        return [(self._faqs[index], confidence) for index, _, confidence in self._index.search(text, k)]
+
+    def answer(self, text):
+        """Câu trả lời FAQ nếu đủ chắc chắn, không thì None."""
+        matches = self.search(text, k=1)
+        if matches and matches[0][1] >= self.answer_threshold:
+            faq, confidence = matches[0]
+            logger.info(f"FAQ khớp '{faq['question']}' (confidence {confidence:.2f})")
+            return faq["answer"]
+        return None
+
+    def snippets(self, text, k=2):
+        """Các cặp hỏi-đáp liên quan (đủ ngưỡng `snippet_threshold`) để đưa vào prompt."""
+        return [
+            f"Hỏi: {faq['question']}\nĐáp: {faq['answer']}"
+            for faq, confidence in self.search(text, k)
+            if confidence >= self.snippet_threshold
+        ]
+
+
+faq_index = FAQIndex()
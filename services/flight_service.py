@@ -2,45 +2,184 @@
 # Created: 2025-03-04 23:44:55
 # Author: thuanpony03
 
-from datetime import datetime
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
 from services.database import db
 
+# Các trường cần cho danh sách kết quả tìm kiếm
+FLIGHT_LIST_PROJECTION = {
+    "airline": 1, "flight_number": 1, "departure": 1, "destination": 1,
+    "departure_time": 1, "arrival_time": 1, "class_type": 1, "price": 1, "baggage_allowance": 1
+}
+
+
+# Tiền tố thường gặp trước tên điểm đi/đến, bỏ đi để 'TP. Hồ Chí Minh' khớp 'Hồ Chí Minh'
+PLACE_PREFIXES = ("thanh pho ", "tp ", "san bay ")
+
+
+def normalize_place(name):
+    """Chuẩn hóa tên điểm đi/đến: chữ thường, bỏ dấu, gộp khoảng trắng ('Hà Nội' -> 'ha noi')."""
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFD", str(name).lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    text = " ".join(re.sub(r"[^\w\s]", " ", text).split())
+    for prefix in PLACE_PREFIXES:
+        if text.startswith(prefix):
+            return text[len(prefix):]
+    return text
+
+
+def place_filter(name):
+    """Khớp khóa bắt đầu bằng tên đã chuẩn hóa ('ha noi' khớp 'ha noi han' của 'Hà Nội (HAN)').
+
+    Regex neo đầu chuỗi nên Mongo vẫn quét theo khoảng trên index tuyến.
+    """
+    return {"$regex": f"^{re.escape(normalize_place(name))}(?: |$)"}
+
+
+def with_route_keys(flight):
+    """Gắn departure_key/destination_key vào document chuyến bay trước khi ghi."""
+    flight["departure_key"] = normalize_place(flight.get("departure"))
+    flight["destination_key"] = normalize_place(flight.get("destination"))
+    return flight
+
+
+def parse_departure_date(value):
+    """Trả về (đầu ngày, đầu ngày hôm sau) cho ngày khởi hành dạng dd/mm/YYYY, YYYY-mm-dd hoặc datetime."""
+    parsed_date = None
+    if isinstance(value, datetime):
+        parsed_date = value
+    elif isinstance(value, str):
+        for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+            try:
+                parsed_date = datetime.strptime(value.strip(), fmt)
+                break
+            except ValueError:
+                continue
+    if not parsed_date:
+        return None
+    day_start = parsed_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start, day_start + timedelta(days=1)
+
+
+def ensure_flight_indexes(collection):
+    """Index theo tuyến (điểm đi, điểm đến) cho tìm kiếm theo ngày và lấy top-k rẻ nhất."""
+    collection.create_index(
+        [("departure_key", ASCENDING), ("destination_key", ASCENDING), ("departure_time", ASCENDING)],
+        name="route_departure_time"
+    )
+    collection.create_index(
+        [("departure_key", ASCENDING), ("destination_key", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)],
+        name="route_price_id"
+    )
+
+
+def backfill_route_keys(collection, batch_size=500):
+    """Bổ sung/tính lại departure_key/destination_key cho các chuyến bay đã có, rồi tạo index."""
+    operations = []
+    updated = 0
+    fields = {"departure": 1, "destination": 1, "departure_key": 1, "destination_key": 1}
+    for flight in collection.find({}, fields):
+        keys = with_route_keys({"departure": flight.get("departure"), "destination": flight.get("destination")})
+        if keys["departure_key"] == flight.get("departure_key") and keys["destination_key"] == flight.get("destination_key"):
+            continue
+        operations.append(UpdateOne({"_id": flight["_id"]}, {"$set": {
+            "departure_key": keys["departure_key"], "destination_key": keys["destination_key"]
+        }}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    ensure_flight_indexes(collection)
+    return updated
+
+
+class FlightPage(list):
+    """Một trang kết quả tìm kiếm; next_cursor là None ở trang cuối"""
+
+    def __init__(self, items=(), next_cursor=None):
+        super().__init__(items)
+        self.next_cursor = next_cursor
+
+
 class FlightService:
-    def search_flights(self, departure, destination, departure_date=None, class_type=None):
-        """Tìm kiếm chuyến bay dựa trên các tiêu chí"""
+    def add_flights(self, flights):
+        """Thêm chuyến bay (kèm khóa tuyến để tìm kiếm), trả về danh sách _id"""
+        documents = [with_route_keys(dict(flight)) for flight in flights]
+        if not documents:
+            return []
+        return db.get_collection("flights").insert_many(documents).inserted_ids
+
+    def update_flight(self, flight_id, update_data):
+        """Cập nhật chuyến bay; đổi điểm đi/đến thì tính lại khóa tuyến"""
+        if isinstance(flight_id, str):
+            flight_id = ObjectId(flight_id)
+        update_data = dict(update_data)
+        if "departure" in update_data:
+            update_data["departure_key"] = normalize_place(update_data["departure"])
+        if "destination" in update_data:
+            update_data["destination_key"] = normalize_place(update_data["destination"])
+        result = db.get_collection("flights").update_one({"_id": flight_id}, {"$set": update_data})
+        return result.modified_count > 0
+
+    def _build_filter(self, departure, destination, departure_date=None, class_type=None):
         search_filter = {
-            "departure": {"$regex": departure, "$options": "i"},
-            "destination": {"$regex": destination, "$options": "i"}
+            "departure_key": place_filter(departure),
+            "destination_key": place_filter(destination)
         }
         
         if departure_date:
-            # Định dạng ngày tháng thành datetime object để tìm kiếm
-            try:
-                if isinstance(departure_date, str):
-                    date_formats = ["%d/%m/%Y", "%Y-%m-%d"]
-                    parsed_date = None
-                    for fmt in date_formats:
-                        try:
-                            parsed_date = datetime.strptime(departure_date, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if parsed_date:
-                        # Tìm các chuyến bay có ngày khởi hành trong cùng ngày
-                        next_day = datetime(parsed_date.year, parsed_date.month, parsed_date.day + 1)
-                        search_filter["departure_time"] = {
-                            "$gte": parsed_date,
-                            "$lt": next_day
-                        }
-            except Exception as e:
-                print(f"Error parsing date: {e}")
+            # Tìm các chuyến bay có ngày khởi hành trong cùng ngày
+            day_range = parse_departure_date(departure_date)
+            if day_range:
+                search_filter["departure_time"] = {"$gte": day_range[0], "$lt": day_range[1]}
+            else:
+                print(f"Error parsing date: {departure_date}")
         
         if class_type:
-            search_filter["class_type"] = {"$regex": class_type, "$options": "i"}
+            search_filter["class_type"] = {"$regex": re.escape(class_type), "$options": "i"}
+        return search_filter
+
+    def search_flights(self, departure, destination, departure_date=None, class_type=None, limit=5, cursor=None):
+        """Tìm top-k chuyến bay rẻ nhất; truyền next_cursor của trang trước để lấy trang tiếp theo"""
+        search_filter = self._build_filter(departure, destination, departure_date, class_type)
+        
+        if cursor:
+            price, flight_id = cursor.rsplit("|", 1)
+            price, flight_id = float(price), ObjectId(flight_id)
+            search_filter["$or"] = [
+                {"price": {"$gt": price}},
+                {"price": price, "_id": {"$gt": flight_id}}
+            ]
         
-        flights = list(db.flights.find(search_filter).sort("price", 1))  # Sắp xếp theo giá tăng dần
-        return flights
+        flights = list(
+            db.get_collection("flights")
+            .find(search_filter, FLIGHT_LIST_PROJECTION)
+            .sort([("price", ASCENDING), ("_id", ASCENDING)])  # Sắp xếp theo giá tăng dần
+            .limit(limit)
+        )
+        next_cursor = None
+        if len(flights) == limit:
+            next_cursor = f"{flights[-1]['price']}|{flights[-1]['_id']}"
+        return FlightPage(flights, next_cursor)
+
+    def iter_flights(self, departure, destination, departure_date=None, class_type=None, batch_size=50):
+        """Duyệt toàn bộ kết quả theo giá tăng dần, mỗi lần chỉ giữ một trang trong bộ nhớ"""
+        cursor = None
+        while True:
+            page = self.search_flights(departure, destination, departure_date, class_type,
+                                       limit=batch_size, cursor=cursor)
+            yield from page
+            cursor = page.next_cursor
+            if not cursor:
+                break
     
     def format_flight_message(self, flight):
         """Định dạng thông tin chuyến bay thành tin nhắn văn bản"""
@@ -68,14 +207,11 @@ class FlightService:
         
         return message
     
-    def format_flight_list_message(self, flights):
-        """Định dạng danh sách chuyến bay thành tin nhắn văn bản"""
-        if not flights:
-            return "Không tìm thấy chuyến bay phù hợp với yêu cầu của bạn."
-        
-        message = f"✈️ TÌM THẤY {len(flights)} CHUYẾN BAY PHÙ HỢP\n\n"
-        
-        for i, flight in enumerate(flights[:5], 1):  # Lấy tối đa 5 chuyến bay
+    def iter_flight_list_lines(self, flights, max_items=5):
+        """Sinh từng đoạn tin nhắn cho danh sách chuyến bay mà không cần nạp hết kết quả"""
+        for i, flight in enumerate(flights, 1):
+            if i > max_items:
+                break
             # Định dạng thời gian
             departure_time = flight["departure_time"]
             if isinstance(departure_time, datetime):
@@ -83,13 +219,27 @@ class FlightService:
             else:
                 dep_time_str = str(departure_time)
             
-            message += f"{i}. {flight['airline']} ({flight['flight_number']})\n"
-            message += f"   🛫 {flight['departure']} - {dep_time_str}\n"
-            message += f"   💰 {'{:,.0f}'.format(flight['price']).replace(',', '.')} VNĐ - {flight['class_type']}\n\n"
+            yield (
+                f"{i}. {flight['airline']} ({flight['flight_number']})\n"
+                f"   🛫 {flight['departure']} - {dep_time_str}\n"
+                f"   💰 {'{:,.0f}'.format(flight['price']).replace(',', '.')} VNĐ - {flight['class_type']}\n\n"
+            )
+    
+    def format_flight_list_message(self, flights, max_items=5):
+        """Định dạng danh sách chuyến bay (list hoặc iterator) thành tin nhắn văn bản"""
+        lines = list(self.iter_flight_list_lines(flights, max_items))  # Lấy tối đa 5 chuyến bay
+        if not lines:
+            return "Không tìm thấy chuyến bay phù hợp với yêu cầu của bạn."
         
+        # Chỉ có một trang kết quả (không đếm toàn bộ), nên không ghi tổng số chuyến
+        message = "✈️ CÁC CHUYẾN BAY PHÙ HỢP (GIÁ THẤP NHẤT TRƯỚC)\n\n"
+        message += "".join(lines)
         message += "Để xem chi tiết, vui lòng trả lời số thứ tự chuyến bay."
         
         return message
 
 # Khởi tạo service
-flight_service = FlightService()
\ No newline at end of file
+flight_service = FlightService()
+
+if __name__ == "__main__":
+    print(f"Đã cập nhật {backfill_route_keys(db.get_collection('flights'))} chuyến bay")
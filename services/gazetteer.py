@@ -0,0 +1,112 @@
+# Service for matching location names in messages
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Dùng khi không đọc được collection locations
+FALLBACK_LOCATIONS = ["nhật bản", "hàn quốc", "thái lan", "singapore", "mỹ", "pháp"]
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Tách từ (chữ thường, chuẩn hóa NFC để 'ậ' nhập kiểu tổ hợp vẫn khớp)."""
+    if not text:
+        return []
+    return _TOKEN.findall(unicodedata.normalize("NFC", str(text)).lower())
+
+
+class TokenTrie:
+    """Trie theo từ: mỗi nút là một token, nút kết thúc lưu tên địa điểm."""
+
+    _END = object()
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, name):
+        tokens = tokenize(name)
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if self._END not in node:
+            self.size += 1
+        node[self._END] = " ".join(tokens)
+
+    def find_all(self, text):
+        """Quét một lượt, tại mỗi vị trí lấy tên dài nhất khớp ('nhật bản' thay vì 'nhật')."""
+        tokens = tokenize(text)
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self._root
+            best = None
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if self._END in node:
+                    best = (node[self._END], j)
+            if best:
+                matches.append(best[0])
+                i = best[1]
+            else:
+                i += 1
+        return matches
+
+
+def _load_location_names():
+    from services.database import db
+    return [loc["name"] for loc in db.locations.find({}, {"name": 1}) if loc.get("name")]
+
+
+class LocationGazetteer:
+    """Danh bạ địa điểm nạp một lần vào TokenTrie, làm mới sau `ttl` giây hoặc khi invalidate()."""
+
+    def __init__(self, loader=None, ttl=600):
+        self.loader = loader or _load_location_names
+        self.ttl = ttl
+        self._trie = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Gọi khi collection locations thay đổi để lần tra cứu sau nạp lại."""
+        self._expires_at = 0.0
+
+    def _refresh(self):
+        trie = TokenTrie()
+        try:
+            names = self.loader()
+        except Exception as e:
+            logger.warning(f"Could not access locations collection: {str(e)}. Using fallback method.")
+            names = []
+        for name in names or FALLBACK_LOCATIONS:
+            trie.add(name)
+        self._trie = trie
+        self._expires_at = time.monotonic() + self.ttl
+        logger.info(f"Đã nạp {trie.size} địa điểm vào gazetteer")
+
+    def _current(self):
+        if self._trie is None or time.monotonic() >= self._expires_at:
+            # Một luồng nạp lại, các luồng khác tiếp tục dùng trie cũ (nếu có)
+            if self._lock.acquire(blocking=self._trie is None):
+                try:
+                    if self._trie is None or time.monotonic() >= self._expires_at:
+                        self._refresh()
+                finally:
+                    self._lock.release()
+        return self._trie
+
+    def find_locations(self, text):
+        return self._current().find_all(text)
+
+
+location_gazetteer = LocationGazetteer()
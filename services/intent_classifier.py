@@ -0,0 +1,82 @@
+# Intent classification: the pattern table compiled into a single regex
+import re
+
+# Intent và các pattern, theo thứ tự ưu tiên (intent đứng trước thắng khi nhiều intent cùng khớp)
+INTENT_PATTERNS = {
+    'TOUR_SEARCH': [
+        r'tìm tour', r'tour du lịch', r'đi du lịch', r'gói du lịch',
+        r'tour.*nước ngoài', r'tour châu', r'tour.*ưu đãi',
+        r'tour private', r'tour riêng', r'thuê xe', r'xe riêng',
+        r'hướng dẫn viên', r'du lịch.*riêng tư', r'private'
+    ],
+    'VISA_INFO': [
+        r'visa', r'làm visa', r'thủ tục visa', r'xin visa', 
+        r'hồ sơ visa', r'phí visa', r'visa.*nước'
+    ],
+    'PASSPORT_INFO': [
+        r'hộ chiếu', r'passport', r'làm hộ chiếu', r'gia hạn.*hộ chiếu',
+        r'thủ tục.*hộ chiếu', r'passport.*hết hạn'
+    ],
+    'FLIGHT_INFO': [
+        r'vé máy bay', r'chuyến bay', r'đặt vé', r'đặt chỗ bay',
+        r'bay.*nước ngoài', r'giá vé.*bay'
+    ],
+    'WEATHER_INFO': [
+        r'thời tiết', r'dự báo', r'mưa', r'nắng', r'nhiệt độ'
+    ],
+    'BOOKING_ACTION': [
+        r'đặt tour', r'book', r'đặt lịch', r'đăng ký tour',
+        r'thanh toán', r'đặt chỗ'
+    ],
+    'BOOKING_STATUS': [
+        r'kiểm tra.*đặt', r'tình trạng', r'đã đặt.*chưa', 
+        r'xác nhận.*đặt', r'hủy.*đặt'
+    ],
+    'FAQ': [
+        r'câu hỏi', r'thắc mắc', r'hỏi', r'giải đáp', 
+        r'tư vấn', r'làm sao để'
+    ],
+    'GREETING': [
+        r'xin chào', r'hello', r'hi', r'chào', r'hey'
+    ],
+    'PRIVATE_TOUR': [
+        r'tour private', r'tour riêng', r'thuê xe riêng', r'xe riêng',
+        r'hướng dẫn viên riêng', r'du lịch tự túc', r'đi riêng'
+    ]
+}
+
+
+def compile_intent_patterns(patterns):
+    """Gộp bảng pattern thành một regex quét một lượt.
+
+    Lookahead đầu tiên (hợp của mọi pattern) chỉ dừng ở vị trí có pattern bắt đầu; tại đó
+    mỗi intent là một lookahead tùy chọn có named group, nên các intent bắt đầu cùng vị trí
+    (ví dụ 'tour riêng' thuộc cả TOUR_SEARCH và PRIVATE_TOUR) đều được ghi nhận.
+    """
+    any_pattern = "|".join(f"(?:{pattern})" for intent_patterns in patterns.values() for pattern in intent_patterns)
+    per_intent = "".join(
+        f"(?=(?P<{intent}>{'|'.join(f'(?:{pattern})' for pattern in intent_patterns)}))?"
+        for intent, intent_patterns in patterns.items()
+    )
+    return re.compile(f"(?=(?:{any_pattern})){per_intent}")
+
+
+class IntentClassifier:
+    def __init__(self, patterns=None):
+        self.patterns = patterns or INTENT_PATTERNS
+        self.priorities = {intent: index for index, intent in enumerate(self.patterns)}
+        self._regex = compile_intent_patterns(self.patterns)
+
+    def classify_all(self, text):
+        """Trả về [(intent, priority), ...] cho mọi intent khớp, ưu tiên cao nhất trước."""
+        if not text:
+            return []
+        found = set()
+        for match in self._regex.finditer(text.lower()):
+            found.update(intent for intent, value in match.groupdict().items() if value is not None)
+        return [(intent, self.priorities[intent]) for intent in self.patterns if intent in found]
+
+    def classify(self, text):
+        """Intent ưu tiên cao nhất, hoặc UNKNOWN."""
+        matches = self.classify_all(text)
+        return matches[0][0] if matches else "UNKNOWN"
@@ -0,0 +1,180 @@
+# Lead deduplication: normalized phone key and upsert merge operations
+import logging
+import re
+from datetime import datetime
+
+from pymongo import ASCENDING, InsertOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Các trường dạng danh sách được hợp nhất ($addToSet) thay vì ghi đè
+MERGED_LIST_FIELDS = ("customer_needs", "notes", "service_interests", "special_case_types", "descriptions")
+
+# Cờ đã bật thì giữ nguyên: gộp bằng $max (false < true) thay vì ghi đè
+MERGED_FLAG_FIELDS = ("special_concerns",)
+
+# Các trường chỉ ghi khi tạo lead lần đầu
+INSERT_ONLY_FIELDS = ("_id", "created_at", "phone", "source", "status", "assigned_to",
+                      "last_contact_date", "follow_up_date", "original_query")
+
+
+def normalize_phone(phone):
+    """Chuẩn hóa số điện thoại Việt Nam: bỏ ký tự phân cách, đổi +84/84 thành 0."""
+    if not phone:
+        return None
+    phone = str(phone).strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('+84') or (digits.startswith('84') and len(digits) in (11, 12)):
+        digits = '0' + digits[2:]
+    return digits or None
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [item for item in value if item not in (None, "")]
+    return [value] if value != "" else []
+
+
+def _prepare(doc):
+    """Đưa các trường rời rạc (service_type, description) về dạng danh sách để hợp nhất."""
+    doc = dict(doc)
+    for key in MERGED_LIST_FIELDS:
+        doc[key] = _as_list(doc.get(key))
+    if doc.get("special_case_type") and doc["special_case_type"] not in doc["special_case_types"]:
+        doc["special_case_types"].append(doc["special_case_type"])
+    if doc.get("service_type") and doc["service_type"] not in doc["service_interests"]:
+        doc["service_interests"].append(doc["service_type"])
+    if doc.get("description") and doc["description"] not in doc["descriptions"]:
+        doc["descriptions"].append(doc["description"])
+    return doc
+
+
+def merge_lead_docs(base, incoming):
+    """Gộp hai lead cùng số điện thoại: danh sách lấy hợp, giá trị đơn lấy bản mới nhất khác rỗng."""
+    merged = _prepare(base)
+    incoming = _prepare(incoming)
+    for key, value in incoming.items():
+        if key in MERGED_LIST_FIELDS:
+            for item in value:
+                if item not in merged[key]:
+                    merged[key].append(item)
+        elif key in MERGED_FLAG_FIELDS:
+            merged[key] = bool(merged.get(key)) or bool(value)
+        elif key == "created_at":
+            current = merged.get("created_at")
+            if value and (not current or (type(value) is type(current) and value < current)):
+                merged["created_at"] = value
+        elif key in INSERT_ONLY_FIELDS:
+            merged.setdefault(key, value)
+        elif value not in (None, "", []):
+            merged[key] = value
+    return merged
+
+
+def build_lead_upsert(doc):
+    """Tạo thao tác upsert nguyên tử keyed theo phone_normalized cho một lead.
+
+    Lead không có số điện thoại không có khóa để gộp: trả về InsertOne (theo _id của lead).
+    """
+    doc = _prepare(doc)
+    phone_normalized = normalize_phone(doc.get("phone"))
+    if not phone_normalized:
+        doc.pop("phone_normalized", None)
+        doc.setdefault("created_at", datetime.now())
+        doc.setdefault("updated_at", datetime.now())
+        return InsertOne(doc)
+
+    now = datetime.now()
+    on_insert = {"created_at": doc.get("created_at") or now, "phone_normalized": phone_normalized}
+    updates = {"updated_at": now}
+    add_to_set = {}
+    flags = {}
+
+    for key, value in doc.items():
+        if key in ("created_at", "updated_at", "phone_normalized"):
+            continue
+        if key in MERGED_LIST_FIELDS:
+            items = _as_list(value)
+            if items:
+                add_to_set[key] = {"$each": items}
+        elif key in MERGED_FLAG_FIELDS:
+            flags[key] = bool(value)
+        elif key in INSERT_ONLY_FIELDS:
+            if value is not None:
+                on_insert[key] = value
+        elif value not in (None, "", []):
+            updates[key] = value
+
+    operation = {"$setOnInsert": on_insert, "$set": updates}
+    if add_to_set:
+        operation["$addToSet"] = add_to_set
+    if flags:
+        operation["$max"] = flags
+    return UpdateOne({"phone_normalized": phone_normalized}, operation, upsert=True)
+
+
+def ensure_lead_indexes(collection):
+    """Index duy nhất theo số điện thoại chuẩn hóa và các index cho truy vấn danh sách."""
+    collection.create_index(
+        [("phone_normalized", ASCENDING)], unique=True, name="uniq_phone_normalized",
+        partialFilterExpression={"phone_normalized": {"$type": "string"}}
+    )
+    # Khớp với keyset (sort_field, _id) của LeadService để phân trang không cần skip
+    collection.create_index([("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                            name="status_created_at_id")
+    collection.create_index([("assigned_to", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                            name="assigned_created_at_id")
+    collection.create_index([("follow_up_date", ASCENDING), ("_id", ASCENDING)], name="follow_up_date_id")
+    collection.create_index([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_id")
+    # Tra lead theo người dùng Zalo (ưu tiên lượt trong TurnScheduler)
+    collection.create_index([("zalo_user_id", ASCENDING)], name="zalo_user_id")
+
+
+def _parse_created_at(value):
+    """created_at cũ lưu dạng chuỗi ISO: đổi sang datetime để sắp xếp/phân trang keyset đúng kiểu."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.now()
+
+
+def migrate_existing_leads(collection):
+    """Gộp các lead trùng số điện thoại đã có trong DB về một bản ghi, rồi tạo index duy nhất."""
+    groups = {}
+    converted = 0
+    for doc in collection.find({}).sort("created_at", ASCENDING):
+        key = normalize_phone(doc.get("phone"))
+        if key:
+            groups.setdefault(key, []).append(doc)
+        elif isinstance(doc.get("created_at"), str):
+            # Lead không có số điện thoại không được gộp, nhưng vẫn phải đổi created_at sang datetime
+            collection.update_one({"_id": doc["_id"]},
+                                  {"$set": {"created_at": _parse_created_at(doc["created_at"])}})
+            converted += 1
+
+    merged_count = 0
+    for key, docs in groups.items():
+        keeper = docs[0]
+        merged = keeper
+        for duplicate in docs[1:]:
+            merged = merge_lead_docs(merged, duplicate)
+        merged["_id"] = keeper["_id"]
+        merged["phone_normalized"] = key
+        if isinstance(merged.get("created_at"), str):
+            merged["created_at"] = _parse_created_at(merged["created_at"])
+        collection.replace_one({"_id": keeper["_id"]}, merged)
+        if len(docs) > 1:
+            collection.delete_many({"_id": {"$in": [d["_id"] for d in docs[1:]]}})
+            merged_count += len(docs) - 1
+
+    ensure_lead_indexes(collection)
+    logger.info(f"Đã chuẩn hóa {len(groups)} lead, gộp {merged_count} bản ghi trùng, "
+                f"đổi created_at cho {converted} lead không có số điện thoại")
+    return merged_count
+
+
+if __name__ == "__main__":
+    from services.database import db
+    migrate_existing_leads(db.get_collection("leads"))
@@ -1,15 +1,59 @@
 # Service for managing customer leads
+import base64
 from datetime import datetime
 from services.database import db
+from services.lead_writer import lead_writer
+from services.lead_merge import ensure_lead_indexes, normalize_phone
 from models.lead import Lead
-from bson import ObjectId
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, DESCENDING
+
+# Fields needed by staff list views (notes and long descriptions are left out)
+LIST_PROJECTION = {
+    "name": 1, "phone": 1, "status": 1, "country_interest": 1, "service_interests": 1,
+    "assigned_to": 1, "zalo_user_id": 1, "special_concerns": 1,
+    "created_at": 1, "updated_at": 1, "follow_up_date": 1, "last_contact_date": 1
+}
+
+
+class LeadPage(list):
+    """A page of leads; next_cursor is None on the last page"""
+
+    def __init__(self, items=(), next_cursor=None):
+        super().__init__(items)
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(sort_value, doc_id):
+    """Encode a keyset position (sort value, _id) as an opaque string.
+
+    Extended JSON keeps the BSON type of the sort value (date, number, string, null...).
+    """
+    payload = json_util.dumps([sort_value, doc_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    sort_value, doc_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    return sort_value, doc_id
+
 
 class LeadService:
     def __init__(self):
         self.collection = db.get_collection("leads")
+
+    def ensure_indexes(self):
+        """Create the unique normalized-phone index and list-query indexes"""
+        ensure_lead_indexes(self.collection)
         
     def create_lead(self, lead_data):
-        """Create a new lead from data"""
+        """Queue a lead to be created or merged by normalized phone.
+
+        The write happens behind (services.lead_writer), so no id is returned: a lead whose
+        phone already exists is merged into the stored document and keeps that document's id.
+        Returns True once the lead is queued.
+        """
         if isinstance(lead_data, dict):
             lead = Lead.from_dict(lead_data)
         elif isinstance(lead_data, Lead):
@@ -17,8 +61,7 @@ class LeadService:
         else:
             raise ValueError("lead_data must be a dict or Lead object")
             
-        result = self.collection.insert_one(lead.to_dict())
-        return str(result.inserted_id)
+        return lead_writer.submit(lead.to_dict())
         
     def update_lead(self, lead_id, update_data):
         """Update an existing lead"""
@@ -78,8 +121,8 @@ class LeadService:
         return result.modified_count > 0
         
     def get_lead_by_phone(self, phone):
-        """Get a lead by phone number"""
-        data = self.collection.find_one({"phone": phone})
+        """Get a lead by phone number (+84 and 0 prefixes are equivalent)"""
+        data = self.collection.find_one({"phone_normalized": normalize_phone(phone)})
         return Lead.from_dict(data) if data else None
         
     def get_lead_by_id(self, lead_id):
@@ -90,29 +133,85 @@ class LeadService:
         data = self.collection.find_one({"_id": lead_id})
         return Lead.from_dict(data) if data else None
         
-    def get_leads_by_status(self, status, limit=100):
-        """Get leads by status"""
-        data = self.collection.find({"status": status}).sort("created_at", -1).limit(limit)
-        return [Lead.from_dict(item) for item in data]
+    def _keyset_query(self, query, sort_field, direction, cursor):
+        """Add the keyset condition for the page after cursor"""
+        if not cursor:
+            return query
+        sort_value, doc_id = decode_cursor(cursor)
+        op = "$lt" if direction == DESCENDING else "$gt"
+        if sort_value is None:
+            # null sorts before every value and cannot be compared with $gt/$lt
+            past = {sort_field: {"$ne": None}} if direction == ASCENDING else {"_id": {"$in": []}}
+        else:
+            past = {sort_field: {op: sort_value}}
+        after = {"$or": [
+            past,
+            {sort_field: sort_value, "_id": {op: doc_id}}
+        ]}
+        return {"$and": [query, after]} if query else after
+
+    @staticmethod
+    def _with_sort_field(projection, sort_field):
+        """Make sure the projection returns sort_field, which the next cursor is built from"""
+        if not projection:
+            return projection
+        if isinstance(projection, dict):
+            projection = dict(projection)
+            if any(value for key, value in projection.items() if key != "_id"):
+                projection[sort_field] = 1
+            else:
+                projection.pop(sort_field, None)
+            return projection
+        return list(projection) + ([sort_field] if sort_field not in projection else [])
+
+    def _find_page(self, query, sort_field, direction, limit, cursor=None, projection=None):
+        """Fetch one keyset page of raw documents sorted by (sort_field, _id)"""
+        find_query = self._keyset_query(query, sort_field, direction, cursor)
+        projection = self._with_sort_field(projection, sort_field)
+        docs = self.collection.find(find_query, projection).sort([(sort_field, direction), ("_id", direction)])
+        if limit:
+            docs = docs.limit(limit)
+        docs = list(docs)
+
+        next_cursor = None
+        if limit and len(docs) == limit:
+            # A missing field sorts like null, so the cursor position is (None, _id)
+            next_cursor = encode_cursor(docs[-1].get(sort_field), docs[-1]["_id"])
+        return docs, next_cursor
+
+    def _lead_page(self, query, sort_field, direction, limit, cursor=None, projection=None):
+        docs, next_cursor = self._find_page(query, sort_field, direction, limit, cursor, projection)
+        return LeadPage((Lead.from_dict(item) for item in docs), next_cursor)
+
+    def get_leads_by_status(self, status, limit=100, cursor=None, projection=LIST_PROJECTION):
+        """Get leads by status, newest first; pass page.next_cursor to get the next page"""
+        return self._lead_page({"status": status}, "created_at", DESCENDING, limit, cursor, projection)
         
-    def get_leads_for_staff(self, staff_id, limit=100):
-        """Get leads assigned to a staff member"""
-        data = self.collection.find({"assigned_to": staff_id}).sort("created_at", -1).limit(limit)
-        return [Lead.from_dict(item) for item in data]
+    def get_leads_for_staff(self, staff_id, limit=100, cursor=None, projection=LIST_PROJECTION):
+        """Get leads assigned to a staff member, newest first"""
+        return self._lead_page({"assigned_to": staff_id}, "created_at", DESCENDING, limit, cursor, projection)
         
-    def get_leads_to_follow_up_today(self):
+    def get_leads_to_follow_up_today(self, limit=None, cursor=None, projection=LIST_PROJECTION):
         """Get leads that need to be followed up today"""
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         today_end = today_start.replace(hour=23, minute=59, second=59)
         
-        data = self.collection.find({
+        query = {
             "follow_up_date": {
                 "$gte": today_start,
                 "$lte": today_end
             }
-        }).sort("follow_up_date", 1)
-        
-        return [Lead.from_dict(item) for item in data]
+        }
+        return self._lead_page(query, "follow_up_date", ASCENDING, limit, cursor, projection)
+
+    def iter_leads(self, query=None, projection=LIST_PROJECTION, batch_size=500, sort_field="created_at"):
+        """Stream raw lead documents page by page for exports (constant memory)"""
+        cursor = None
+        while True:
+            docs, cursor = self._find_page(query or {}, sort_field, ASCENDING, batch_size, cursor, projection)
+            yield from docs
+            if not cursor:
+                break
     
     def create_lead_with_description(self, lead_data, description):
         """Create a new lead with detailed description"""
@@ -0,0 +1,249 @@
+# Service for write-behind lead persistence
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import redis
+from bson import json_util
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from services.lead_merge import build_lead_upsert, ensure_lead_indexes, merge_lead_docs, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Redis lưu hàng đợi lead bền vững qua các lần restart.
+# Timeout ngắn: khi Redis sập, submit() rơi về bộ đệm cục bộ ngay thay vì treo request
+redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True,
+                           socket_connect_timeout=0.5, socket_timeout=1)
+
+
+class LeadWriteBuffer:
+    """Ghi lead theo kiểu write-behind: xác nhận ngay, gom lô và upsert vào Mongo ở luồng nền.
+
+    Lead được XADD vào Redis stream trước khi trả về cho caller, nên không bị mất khi
+    tiến trình restart; luồng nền đọc stream qua consumer group, gộp theo số điện thoại
+    chuẩn hóa (xem services.lead_merge) và ghi bằng một lệnh bulk_write khi đủ
+    `batch_size` hoặc sau `flush_interval` giây.
+    Khi Redis không khả dụng, lead được giữ trong bộ đệm cục bộ của tiến trình.
+    """
+
+    STREAM_KEY = "leads:pending"
+    GROUP = "lead-writers"
+    STALE_CLAIM_MS = 60000  # Nhận lại entry của worker đã chết sau 60 giây
+    MAX_READ_BACKOFF = 5.0  # Giây chờ tối đa giữa hai lần đọc stream khi Redis lỗi
+    MAX_BLOCK_MS = 500  # XREADGROUP block phải ngắn hơn socket_timeout của client
+
+    def __init__(self, redis_client=None, collection_name="leads", batch_size=50, flush_interval=2.0,
+                 collection=None):
+        self.redis_client = redis_client
+        self.collection_name = collection_name
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._local = deque()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._group_ready = False
+        self._recovered = False
+        self._last_claim = 0.0
+        self._read_failures = 0
+        self._indexes_ready = False
+
+    def submit(self, lead_doc):
+        """Đưa lead vào hàng đợi và trả về ngay, không chờ Mongo."""
+        self.start()
+        payload = json_util.dumps(lead_doc)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.xadd(self.STREAM_KEY, {"data": payload})
+                return True
+            except Exception as e:
+                logger.warning(f"Không ghi được lead vào Redis stream, dùng bộ đệm cục bộ: {e}")
+        self._local.append((None, payload))
+        if len(self._local) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        """Khởi động luồng flush nền (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="lead-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Dừng luồng nền và ghi nốt phần còn lại."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        while self._local:
+            self._flush(self._drain_local())
+
+    def _ensure_group(self):
+        if self._group_ready or self.redis_client is None:
+            return self._group_ready
+        try:
+            self.redis_client.xgroup_create(self.STREAM_KEY, self.GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+        return True
+
+    def _read_stream(self, block_ms):
+        """Đọc entry từ stream: entry còn treo của chính worker này trước, sau đó entry mới."""
+        if self.redis_client is None:
+            return []
+        try:
+            if not self._ensure_group():
+                return []
+            entries = []
+            if not self._recovered:
+                # Entry đã giao cho consumer này nhưng chưa ACK (ví dụ trước khi restart)
+                pending = self.redis_client.xreadgroup(
+                    self.GROUP, self.consumer, {self.STREAM_KEY: "0"}, count=self.batch_size
+                )
+                for _, items in pending or []:
+                    entries.extend(items)
+                if len(entries) < self.batch_size:
+                    self._recovered = True
+            now = time.monotonic()
+            if not entries and now - self._last_claim >= self.STALE_CLAIM_MS / 2000:
+                # Entry bị treo quá lâu bởi worker khác đã dừng
+                self._last_claim = now
+                claimed = self.redis_client.xautoclaim(
+                    self.STREAM_KEY, self.GROUP, self.consumer,
+                    min_idle_time=self.STALE_CLAIM_MS, start_id="0-0", count=self.batch_size
+                )
+                if claimed and len(claimed) > 1:
+                    entries.extend(claimed[1])
+            if not entries:
+                fresh = self.redis_client.xreadgroup(
+                    self.GROUP, self.consumer, {self.STREAM_KEY: ">"},
+                    count=self.batch_size, block=block_ms
+                )
+                for _, items in fresh or []:
+                    entries.extend(items)
+            self._read_failures = 0
+            return [(entry_id, fields.get("data")) for entry_id, fields in entries if fields]
+        except Exception as e:
+            self._group_ready = False
+            self._read_failures += 1
+            backoff = min(0.1 * 2 ** (self._read_failures - 1), self.MAX_READ_BACKOFF)
+            if self._read_failures == 1 or backoff == self.MAX_READ_BACKOFF:
+                logger.error(f"Lỗi khi đọc lead stream, thử lại sau {backoff:.1f}s: {e}")
+            # Redis không khả dụng: chờ trước khi đọc lại (lead mới vẫn vào bộ đệm cục bộ qua submit)
+            self._stopped.wait(backoff)
+            return []
+
+    def _drain_local(self):
+        entries = []
+        while self._local and len(entries) < self.batch_size:
+            entries.append(self._local.popleft())
+        return entries
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stopped.is_set():
+            remaining = max(deadline - time.monotonic(), 0)
+            if self.redis_client is not None:
+                batch.extend(self._read_stream(block_ms=min(int(remaining * 1000), self.MAX_BLOCK_MS) or 1))
+            else:
+                self._wakeup.wait(remaining)
+                self._wakeup.clear()
+            batch.extend(self._drain_local())
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            self._flush(batch)
+
+    def _coalesce(self, docs):
+        """Gộp các lead cùng số điện thoại (đã chuẩn hóa) trong một lô thành một bản ghi.
+
+        Lead không có số điện thoại không gộp được, mỗi lead được ghi thành một bản ghi riêng.
+        """
+        merged = {}
+        for i, doc in enumerate(docs):
+            phone = normalize_phone(doc.get("phone"))
+            if not phone:
+                logger.info(f"Lead không có số điện thoại (zalo_user_id={doc.get('zalo_user_id')}), ghi riêng")
+                merged[("no_phone", i)] = doc
+                continue
+            merged[phone] = merge_lead_docs(merged[phone], doc) if phone in merged else doc
+        return merged
+
+    def _write(self, collection, operations):
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if not errors or any(err.get("code") != 11000 for err in errors):
+                raise
+            # Hai worker cùng upsert một số mới: bên thua gặp E11000, thử lại sẽ khớp bản ghi đã có.
+            # InsertOne trùng _id nghĩa là lead đã được ghi ở lần flush trước (chưa kịp ACK): bỏ qua
+            retry = [operations[err["index"]] for err in errors if not isinstance(operations[err["index"]], InsertOne)]
+            if retry:
+                collection.bulk_write(retry, ordered=False)
+
+    def _collection(self):
+        if self.collection is None:
+            from services.database import db
+            self.collection = db.get_collection(self.collection_name)
+        return self.collection
+
+    def _flush(self, entries):
+        if not entries:
+            return
+        docs = []
+        for _, payload in entries:
+            try:
+                docs.append(json_util.loads(payload))
+            except Exception as e:
+                logger.error(f"Bỏ qua lead không đọc được: {e}")
+
+        operations = [build_lead_upsert(doc) for doc in self._coalesce(docs).values()]
+        try:
+            if operations:
+                collection = self._collection()
+                if not self._indexes_ready:
+                    ensure_lead_indexes(collection)
+                    self._indexes_ready = True
+                self._write(collection, operations)
+                logger.info(f"Đã ghi {len(operations)} lead ({len(entries)} yêu cầu) vào Mongo")
+        except Exception as e:
+            logger.error(f"Lỗi khi ghi lô lead, sẽ thử lại: {e}")
+            # Không ACK: entry trong stream sẽ được đọc lại; entry cục bộ được đưa lại hàng đợi
+            for entry in entries:
+                if entry[0] is None:
+                    self._local.append(entry)
+            return
+
+        stream_ids = [entry_id for entry_id, _ in entries if entry_id is not None]
+        if stream_ids and self.redis_client is not None:
+            try:
+                self.redis_client.xack(self.STREAM_KEY, self.GROUP, *stream_ids)
+                self.redis_client.xdel(self.STREAM_KEY, *stream_ids)
+            except Exception as e:
+                logger.error(f"Lỗi khi ACK lead stream: {e}")
+
+
+lead_writer = LeadWriteBuffer(redis_client)
+atexit.register(lead_writer.stop)
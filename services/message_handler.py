@@ -3,30 +3,40 @@ import asyncio
 import json
 import logging
 import traceback
-import redis
 import re
 import time
-from .tour_processor import TourPriceProcessor
-from services.zalo_api import ZaloAPI
+from services.registry import registry
+from services.tour_processor import tour_processor
 from services.ai_processor import ai_processor  # Thêm import ai_processor
 from services.admin_commands import admin_handler  # Thêm import admin_commands
+from services.conversation_store import conversation_store
+from models.conversation import Turn
+from services.admission import HOTLINE_FALLBACK, admission_controller, template_answer
+from services.turn_scheduler import turn_schedulers
+from services.faq_index import faq_index
+from services.gazetteer import location_gazetteer
+from services.message_packer import pack_message
+from services.oa_registry import oa_registry, set_current_oa
 
-# Initialize Redis client
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class MessageHandler:
-    def __init__(self):
-        self.tour_processor = TourPriceProcessor()
-        self.zalo_api = ZaloAPI()
+    def __init__(self, oa_id=None):
+        # Dùng chung singleton với phần còn lại của app thay vì tạo bản sao
+        self.tour_processor = tour_processor
+        self.oa_id = oa_id
+        self.zalo_api = oa_registry.client(oa_id) if oa_id else registry.lazy("zalo_api")
         self.pending_messages = {}  # {user_id: {'messages': [], 'last_time': timestamp}}
         self.waiting_time = 5  # Thời gian chờ 5 giây để gộp tin nhắn
 
     async def process_message(self, message, sender_id):
         """Thêm tin nhắn vào hàng đợi và lên lịch xử lý sau thời gian chờ."""
+        if self.oa_id:
+            # Task xử lý tạo bên dưới kế thừa OA hiện tại (namespace key, pool scheduler)
+            set_current_oa(self.oa_id)
         try:
             # Kiểm tra nếu là lệnh admin
             text = message.get('text', '')
@@ -97,55 +107,91 @@ class MessageHandler:
             detailed_itinerary_keywords = ["lịch trình chi tiết", "chi tiết từng ngày", "lịch trình cụ thể", "có", "cần", "muốn", "đồng ý", "ok", "được"]
             upgrade_keywords = ["nâng cấp", "khách sạn", "vé máy bay", "phòng", "5 sao", "4 sao"]
             
-            context = json.loads(redis_client.get(f"context:{user_id}") or '{}')
+            context = conversation_store.get_context(user_id)
             
             # Phát hiện intent
             intent = await self._detect_intent(combined_text, user_id)
             
-            # Xử lý dựa trên intent
-            if intent == "visa":
-                response = await self._handle_visa_query(combined_text, user_id)
-                
-                # Kiểm tra kiểu phản hồi trước khi xử lý
-                if isinstance(response, dict) and response.get("type") == "multi_part":
-                    # Xử lý tin nhắn nhiều phần - CHỈ gửi qua hàm _send_multi_part_response
-                    await self._send_multi_part_response(user_id, response.get("messages", []))
-                    # QUAN TRỌNG: Không thực hiện thêm bất kỳ xử lý nào với response sau khi gửi
-                    return  # Kết thúc hàm ở đây để tránh xử lý thêm
-                else:
-                    # Xử lý tin nhắn đơn như trước
-                    await self._send_response(user_id, response if response else ["Dạ, em chưa hiểu rõ yêu cầu. Anh/chị vui lòng cung cấp thêm thông tin nhé!"])
-            else:  # intent == "tour" hoặc khác
-                if any(keyword in combined_text.lower() for keyword in detailed_itinerary_keywords) and context.get("country"):
-                    # Xử lý yêu cầu lịch trình chi tiết
-                    response = (
-                        f"Dạ, với tour {context.get('country', '')} {context.get('days', '')} ngày, em có thể chia sẻ lịch trình chi tiết từng ngày đã được chuyên gia du lịch thiết kế. "
-                        f"Anh/chị vui lòng để lại tên và số điện thoại hoặc gọi hotline 1900 636563, nhân viên tư vấn sẽ gửi chi tiết lịch trình và tư vấn cụ thể theo nhu cầu của gia đình mình ạ!"
-                    )
-                    responses = [response]
-                elif any(keyword in combined_text.lower() for keyword in upgrade_keywords):
-                    # Xử lý yêu cầu nâng cấp dịch vụ
-                    response = (
-                        f"Dạ, để nâng cấp dịch vụ cho tour, chúng tôi có nhiều lựa chọn phù hợp với nhu cầu của gia đình anh/chị. "
-                        f"Anh/chị vui lòng để lại tên và số điện thoại hoặc gọi hotline 1900 636563, nhân viên tư vấn sẽ liên hệ ngay với các gói dịch vụ nâng cấp tốt nhất ạ!"
+            # Câu hỏi thường gặp khớp chắc chắn một FAQ: trả lời từ collection faqs, không gọi Gemini.
+            # Khách đang hỏi về một điểm đến cụ thể thì để luồng visa/tour trả lời bằng dữ liệu sản phẩm
+            faq_answer = None if self._in_destination_flow(combined_text, context) else faq_index.answer(combined_text)
+            if faq_answer:
+                conversation_store.append_history(
+                    user_id, Turn.user(combined_text, intent=intent), Turn.bot(faq_answer, intent=intent)
+                )
+                await self._send_response(user_id, pack_message(faq_answer))
+                return
+            
+            # Backlog Gemini lớn: trả lời bằng mẫu (catalog visa, bảng giá tour) hoặc hotline
+            level = admission_controller.admit()
+            if level != "normal":
+                response = template_answer(intent, combined_text, context, ai_processor, self.tour_processor)
+                if response or level == "shed":
+                    response = response or HOTLINE_FALLBACK
+                    logger.info(f"Admission {level}: trả lời mẫu cho user {user_id}")
+                    conversation_store.append_history(
+                        user_id, Turn.user(combined_text, intent=intent), Turn.bot(response, intent=intent)
                     )
-                    responses = [response]
-                else:
-                    responses = await self._handle_tour_query(combined_text, user_id)
+                    await self._send_response(user_id, [response])
+                    return
+            
+            with admission_controller.track():
+                # Lượt của khách nóng (đã để SĐT, có booking/lead) được phục vụ trước khi tranh slot
+                async with turn_schedulers.get().slot(user_id, context):
+                    # Xử lý dựa trên intent
+                    if intent == "visa":
+                        response = await self._handle_visa_query(combined_text, user_id)
+                
+                        # Kiểm tra kiểu phản hồi trước khi xử lý
+                        if isinstance(response, dict) and response.get("type") == "multi_part":
+                            # Xử lý tin nhắn nhiều phần - CHỈ gửi qua hàm _send_multi_part_response
+                            await self._send_multi_part_response(user_id, response.get("messages", []))
+                            # QUAN TRỌNG: Không thực hiện thêm bất kỳ xử lý nào với response sau khi gửi
+                            return  # Kết thúc hàm ở đây để tránh xử lý thêm
+                        else:
+                            # Xử lý tin nhắn đơn như trước
+                            await self._send_response(user_id, response if response else ["Dạ, em chưa hiểu rõ yêu cầu. Anh/chị vui lòng cung cấp thêm thông tin nhé!"])
+                    else:  # intent == "tour" hoặc khác
+                        if any(keyword in combined_text.lower() for keyword in detailed_itinerary_keywords) and context.get("country"):
+                            # Xử lý yêu cầu lịch trình chi tiết
+                            response = (
+                                f"Dạ, với tour {context.get('country', '')} {context.get('days', '')} ngày, em có thể chia sẻ lịch trình chi tiết từng ngày đã được chuyên gia du lịch thiết kế. "
+                                f"Anh/chị vui lòng để lại tên và số điện thoại hoặc gọi hotline 1900 636563, nhân viên tư vấn sẽ gửi chi tiết lịch trình và tư vấn cụ thể theo nhu cầu của gia đình mình ạ!"
+                            )
+                            responses = [response]
+                        elif any(keyword in combined_text.lower() for keyword in upgrade_keywords):
+                            # Xử lý yêu cầu nâng cấp dịch vụ
+                            response = (
+                                f"Dạ, để nâng cấp dịch vụ cho tour, chúng tôi có nhiều lựa chọn phù hợp với nhu cầu của gia đình anh/chị. "
+                                f"Anh/chị vui lòng để lại tên và số điện thoại hoặc gọi hotline 1900 636563, nhân viên tư vấn sẽ liên hệ ngay với các gói dịch vụ nâng cấp tốt nhất ạ!"
+                            )
+                            responses = [response]
+                        else:
+                            responses = await self._handle_tour_query(combined_text, user_id)
             
-            # Gửi phản hồi
-            await self._send_response(user_id, responses if responses else ["Dạ, em chưa hiểu rõ yêu cầu. Anh/chị vui lòng cung cấp thêm thông tin nhé!"])
+                    # Gửi phản hồi
+                    await self._send_response(user_id, responses if responses else ["Dạ, em chưa hiểu rõ yêu cầu. Anh/chị vui lòng cung cấp thêm thông tin nhé!"])
             
         except Exception as e:
             logger.error(f"Lỗi khi xử lý hàng đợi tin nhắn: {e}")
             await self._send_response(user_id, ["Xin lỗi, đã xảy ra lỗi. Vui lòng thử lại sau."])
 
+    def _in_destination_flow(self, text, context):
+        """Khách đã chọn điểm đến trong hội thoại hoặc tin nhắn nêu tên một địa điểm."""
+        if context.get("country"):
+            return True
+        try:
+            return bool(location_gazetteer.find_locations(text))
+        except Exception as e:
+            logger.warning(f"Không tra được địa điểm trong tin nhắn: {e}")
+            return False
+
     async def _detect_intent(self, text, user_id):
         """Phát hiện ý định của người dùng sử dụng logic đơn giản."""
         text_lower = text.lower()
         
         # Lấy context hiện tại từ Redis
-        context = json.loads(redis_client.get(f"context:{user_id}") or '{}')
+        context = conversation_store.get_context(user_id)
         previous_intent = context.get("service_type")
         
         # Từ khóa liên quan đến visa
@@ -181,7 +227,7 @@ class MessageHandler:
             
         # Cập nhật intent vào context
         context["service_type"] = intent
-        redis_client.set(f"context:{user_id}", json.dumps(context))
+        conversation_store.set_context(user_id, context)
         
         return intent
 
@@ -210,42 +256,36 @@ class MessageHandler:
         """Xử lý yêu cầu visa bằng AIProcessor."""
         try:
             # Lấy context hiện tại từ Redis
-            context = json.loads(redis_client.get(f"context:{user_id}") or '{}')
+            context = conversation_store.get_context(user_id)
             
             # Thêm user_id vào context
             context['user_id'] = user_id
             
             # Lấy lịch sử hội thoại
-            previous_messages = json.loads(redis_client.get(f"history:{user_id}") or '[]')
+            previous_messages = conversation_store.get_history(user_id)
             if previous_messages:
-                formatted_messages = []
-                for msg in previous_messages:
-                    if msg.startswith("User:"):
-                        formatted_messages.append({"sender": "user", "message": msg[5:].strip()})
-                    elif msg.startswith("Bot:"):
-                        formatted_messages.append({"sender": "bot", "message": msg[4:].strip()})
-                context['previous_messages'] = formatted_messages
+                context['previous_messages'] = [{"sender": turn.role, "message": turn.text} for turn in previous_messages]
             
             # Gọi AI Processor để xử lý yêu cầu visa
             response, new_context = await ai_processor.process_visa_query(text, context)
             
             # Cập nhật context mới vào Redis
-            redis_client.set(f"context:{user_id}", json.dumps(new_context))
+            conversation_store.set_context(user_id, new_context)
             
             # Lưu vào lịch sử nếu là phản hồi đơn
-            history = json.loads(redis_client.get(f"history:{user_id}") or '[]')
-            history.append(f"User: {text}")
+            history = previous_messages
+            history.append(Turn.user(text, intent="visa"))
             
             if isinstance(response, dict) and response.get("type") == "multi_part":
                 # Nếu là phản hồi nhiều phần, ghép lại để lưu vào lịch sử
                 combined_response = " ".join(response.get("messages", []))
-                history.append(f"Bot: {combined_response}")
-                redis_client.set(f"history:{user_id}", json.dumps(history[-10:]))
+                history.append(Turn.bot(combined_response, intent="visa"))
+                conversation_store.set_history(user_id, history)
                 return response
             else:
                 # Nếu là phản hồi đơn lẻ
-                history.append(f"Bot: {response}")
-                redis_client.set(f"history:{user_id}", json.dumps(history[-10:]))
+                history.append(Turn.bot(response, intent="visa"))
+                conversation_store.set_history(user_id, history)
                 return [response]
             
         except Exception as e:
@@ -261,7 +301,7 @@ class MessageHandler:
         for msg in responses:
             if msg and msg.strip():
                 try:
-                    result = self.zalo_api.send_text_message(user_id, msg.strip())
+                    result = await self.zalo_api.send_text_message_async(user_id, msg.strip())
                     logger.info(f"Sent response to {user_id}: {msg.strip()} - Result: {result}")
                     if result.get("error", 0) != 0:
                         logger.error(f"Failed to send message '{msg.strip()}': {result}")
@@ -278,11 +318,23 @@ class MessageHandler:
         for msg in messages:
             if msg and isinstance(msg, str) and msg.strip():
                 try:
-                    result = self.zalo_api.send_text_message(user_id, msg.strip())
+                    result = await self.zalo_api.send_text_message_async(user_id, msg.strip())
                     logger.info(f"Sent part response to {user_id}: {msg.strip()} - Result: {result}")
                     await asyncio.sleep(0.8)  # Đợi 0.8 giây giữa các tin nhắn
                 except Exception as e:
                     logger.error(f"Error sending part message: {e}")
 
-message_handler = MessageHandler()
+message_handler = registry.lazy("message_handler")
+
+
+_oa_handlers = {}
+
 
+def get_message_handler(oa_id=None):
+    """MessageHandler của một OA; OA mặc định dùng singleton "message_handler" của registry."""
+    if not oa_id or oa_id == oa_registry.default_id:
+        return message_handler
+    handler = _oa_handlers.get(oa_id)
+    if handler is None:
+        handler = _oa_handlers.setdefault(oa_id, MessageHandler(oa_id))
+    return handler
@@ -0,0 +1,109 @@
+# Service for packing long replies into as few outbound messages as possible
+import regex
+
+from config import Config
+
+# Giới hạn ký tự mỗi tin nhắn theo kênh gửi
+CHANNEL_LIMITS = {
+    "zalo": Config.ZALO_MESSAGE_LIMIT,
+}
+
+# Chi phí khi ngắt tin nhắn tại từng loại ranh giới: ưu tiên ngắt giữa dòng, rồi giữa câu,
+# giữa từ; cắt giữa từ (theo grapheme) chỉ khi một từ dài hơn cả giới hạn
+BREAK_COSTS = {"line": 0, "sentence": 1, "word": 4, "grapheme": 16}
+
+_SENTENCE_END = regex.compile(r"(?<=[.!?…:;])\s+")
+_WORD_GAP = regex.compile(r"\s+")
+_GRAPHEME = regex.compile(r"\X")
+
+
+class _Piece:
+    """Đoạn không chia nhỏ hơn được ở mức đang xét, kèm ký tự nối với đoạn trước và loại ranh giới."""
+
+    __slots__ = ("text", "sep", "kind")
+
+    def __init__(self, text, sep, kind):
+        self.text = text
+        self.sep = sep
+        self.kind = kind
+
+
+def _split_long(text, sep, kind, limit):
+    """Chia một dòng quá dài thành câu, câu quá dài thành từ, từ quá dài thành các cụm grapheme."""
+    if len(text) <= limit:
+        return [_Piece(text, sep, kind)]
+    for pattern, joiner, inner_kind in ((_SENTENCE_END, " ", "sentence"), (_WORD_GAP, " ", "word")):
+        parts = [part for part in pattern.split(text) if part]
+        if len(parts) > 1:
+            pieces = []
+            for i, part in enumerate(parts):
+                pieces.extend(_split_long(part, sep if i == 0 else joiner, kind if i == 0 else inner_kind, limit))
+            return pieces
+    # Một "từ" dài hơn giới hạn (URL, chuỗi không dấu cách): cắt theo grapheme để không tách dấu/emoji
+    pieces = []
+    chunk = ""
+    for grapheme in _GRAPHEME.findall(text):
+        if chunk and len(chunk) + len(grapheme) > limit:
+            pieces.append(_Piece(chunk, sep if not pieces else "", kind if not pieces else "grapheme"))
+            chunk = ""
+        chunk += grapheme
+    pieces.append(_Piece(chunk, sep if not pieces else "", kind if not pieces else "grapheme"))
+    return pieces
+
+
+def _pieces(text, limit):
+    pieces = []
+    newlines = 0
+    for line in text.split("\n"):
+        line = line.rstrip()
+        if not line.strip():
+            newlines += 1
+            continue
+        sep = "\n" * (newlines + 1) if pieces else ""
+        pieces.extend(_split_long(line, sep, "line", limit))
+        newlines = 0
+    return pieces
+
+
+def pack_message(text, limit=None, channel="zalo"):
+    """Chia câu trả lời thành ít tin nhắn nhất có thể, mỗi tin không quá `limit` ký tự.
+
+    Các đoạn giữ nguyên thứ tự; trong các cách chia có cùng số tin nhắn, chọn cách ngắt ở
+    ranh giới "mạnh" nhất (xuống dòng > hết câu > giữa từ > giữa từ dài) theo BREAK_COSTS.
+    """
+    limit = limit or CHANNEL_LIMITS[channel]
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return [text] if text else []
+
+    pieces = _pieces(text, limit)
+    n = len(pieces)
+    # offsets[i]: độ dài nội dung pieces[:i] tính cả ký tự nối
+    offsets = [0] * (n + 1)
+    for i, piece in enumerate(pieces):
+        offsets[i + 1] = offsets[i] + len(piece.sep) + len(piece.text)
+
+    # best[i] = (số tin nhắn, tổng chi phí ngắt, điểm bắt đầu tin cuối) cho pieces[:i]
+    best = [(0, 0, 0)] + [None] * n
+    for end in range(1, n + 1):
+        for start in range(end - 1, -1, -1):
+            length = offsets[end] - offsets[start] - len(pieces[start].sep)
+            if length > limit:
+                break
+            previous = best[start]
+            if previous is None:
+                continue
+            cost = previous[1] + (BREAK_COSTS[pieces[start].kind] if start else 0)
+            candidate = (previous[0] + 1, cost, start)
+            if best[end] is None or candidate[:2] < best[end][:2]:
+                best[end] = candidate
+
+    messages = []
+    end = n
+    while end:
+        start = best[end][2]
+        parts = [pieces[start].text] + [piece.sep + piece.text for piece in pieces[start + 1:end]]
+        messages.append("".join(parts))
+        end = start
+    messages.reverse()
+    return messages
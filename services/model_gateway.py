@@ -0,0 +1,185 @@
+# Service for shared access to Gemini models
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-2.0-flash'
+
+
+class ModelStats:
+    """Số lời gọi, lỗi, số request đang chạy/đang chờ slot và độ trễ gần đây của một model."""
+
+    def __init__(self, window=200):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def enqueued(self):
+        with self._lock:
+            self.queued += 1
+
+    def dequeued(self):
+        """Lời gọi bị hủy trước khi chạy."""
+        with self._lock:
+            self.queued -= 1
+
+    def started(self):
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+
+    def finished(self, latency, ok):
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.latencies.append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            in_flight, queued, calls, errors = self.in_flight, self.queued, self.calls, self.errors
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "in_flight": in_flight,
+            "queued": queued,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+class ModelGateway:
+    """Điểm duy nhất gọi Gemini: configure một lần, dùng chung client/transport cho mọi model.
+
+    Mỗi model có giới hạn số request đồng thời (semaphore) và thống kê độ trễ; các
+    processor gọi `await generate_async(prompt)` thay vì tự tạo GenerativeModel.
+    """
+
+    def __init__(self, api_key=None, default_model=DEFAULT_MODEL, max_concurrency=8, limits=None,
+                 model_factory=None):
+        self.api_key = api_key or Config.GEMINI_API_KEY
+        self.model_factory = model_factory or self._create_model
+        self.default_model = default_model
+        self.max_concurrency = max_concurrency
+        self.limits = dict(limits or {})
+        self._models = {}
+        self._semaphores = {}
+        self._stats = {}
+        self._configured = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(self.limits.values(), default=max_concurrency) * 2,
+                                            thread_name_prefix="model-gateway")
+
+    def _create_model(self, name):
+        import google.generativeai as genai
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+        return genai.GenerativeModel(name)
+
+    def model(self, name=None):
+        """GenerativeModel dùng chung theo tên (tạo một lần)."""
+        name = name or self.default_model
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self.model_factory(name)
+                    self._models[name] = model
+                    self._semaphores[name] = threading.BoundedSemaphore(self.limits.get(name, self.max_concurrency))
+                    self._stats[name] = ModelStats()
+        return model
+
+    def generate(self, prompt, model=None, **kwargs):
+        """Gọi generate_content đồng bộ, tôn trọng giới hạn đồng thời của model."""
+        name = model or self.default_model
+        generative_model = self.model(name)
+        self._stats[name].enqueued()
+        return self._generate_enqueued(name, generative_model, prompt, **kwargs)
+
+    def _generate_enqueued(self, name, generative_model, prompt, **kwargs):
+        """Chờ slot rồi gọi model; lời gọi đã được tính vào `queued` bởi người gọi."""
+        stats = self._stats[name]
+        with self._semaphores[name]:
+            stats.started()
+            start = time.perf_counter()
+            ok = False
+            try:
+                response = generative_model.generate_content(prompt, **kwargs)
+                ok = True
+                return response
+            finally:
+                stats.finished(time.perf_counter() - start, ok)
+
+    async def generate_async(self, prompt, model=None, **kwargs):
+        """Như generate() nhưng chạy trên thread pool của gateway, không chặn event loop.
+
+        Lời gọi được tính vào backlog ngay khi gửi, kể cả lúc còn chờ thread trống trong pool,
+        để admission control thấy đúng số request đang đợi Gemini.
+        """
+        name = model or self.default_model
+        generative_model = self.model(name)
+        stats = self._stats[name]
+        stats.enqueued()
+        try:
+            future = self._executor.submit(lambda: self._generate_enqueued(name, generative_model, prompt, **kwargs))
+        except BaseException:
+            stats.dequeued()
+            raise
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # cancel() thành công nghĩa là hàm chưa chạy (và sẽ không chạy): tự trừ khỏi hàng đợi
+            if future.cancel():
+                stats.dequeued()
+            raise
+
+    def warm_up(self, models=None):
+        """Gửi một request nhỏ để mở sẵn kết nối TLS và xác thực trước khi có người dùng."""
+        for name in models or [self.default_model]:
+            start = time.perf_counter()
+            try:
+                self.generate("ping", model=name, generation_config={"max_output_tokens": 1})
+                logger.info(f"Warm-up {name}: {(time.perf_counter() - start) * 1000:.0f} ms")
+            except Exception as e:
+                logger.warning(f"Warm-up {name} thất bại: {e}")
+        return self
+
+    def in_flight(self, model=None):
+        stats = self._stats.get(model or self.default_model)
+        return stats.in_flight if stats else 0
+
+    def backlog(self, model=None):
+        """Số lời gọi đang chạy cộng số lời gọi đang chờ semaphore."""
+        stats = self._stats.get(model or self.default_model)
+        return stats.in_flight + stats.queued if stats else 0
+
+    def stats(self):
+        """Thống kê theo model: calls, errors, in_flight, queued, p50_ms, p95_ms."""
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+
+model_gateway = ModelGateway(max_concurrency=Config.GEMINI_MAX_CONCURRENCY)
+
+
+def warm_up():
+    return model_gateway.warm_up()
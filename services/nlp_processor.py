@@ -10,14 +10,22 @@ import re
 import os
 import pickle
 import numpy as np
-from services.database import db
+from services.registry import registry
+from services.gazetteer import location_gazetteer
+from services.intent_classifier import INTENT_PATTERNS, IntentClassifier
 
-# Tải các resources cần thiết
-nltk.download('punkt')
-nltk.download('stopwords')
+
+def _ensure_nltk_data():
+    """Tải các resources cần thiết nếu máy chưa có (chỉ gọi mạng khi thiếu)"""
+    for resource, path in (('punkt', 'tokenizers/punkt'), ('stopwords', 'corpora/stopwords')):
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(resource)
 
 class NLPProcessor:
     def __init__(self):
+        _ensure_nltk_data()
         self.stemmer = PorterStemmer()
         
         # Fix: Use only English stopwords since Vietnamese isn't included in NLTK
@@ -31,49 +39,9 @@ class NLPProcessor:
         }
         self.stop_words.update(vietnamese_stopwords)
         
-        # Dictionary lưu trữ các patterns và intents
-        self.patterns = {
-            'TOUR_SEARCH': [
-                r'tìm tour', r'tour du lịch', r'đi du lịch', r'gói du lịch',
-                r'tour.*nước ngoài', r'tour châu', r'tour.*ưu đãi',
-                r'tour private', r'tour riêng', r'thuê xe', r'xe riêng',
-                r'hướng dẫn viên', r'du lịch.*riêng tư', r'private'
-            ],
-            'VISA_INFO': [
-                r'visa', r'làm visa', r'thủ tục visa', r'xin visa', 
-                r'hồ sơ visa', r'phí visa', r'visa.*nước'
-            ],
-            'PASSPORT_INFO': [
-                r'hộ chiếu', r'passport', r'làm hộ chiếu', r'gia hạn.*hộ chiếu',
-                r'thủ tục.*hộ chiếu', r'passport.*hết hạn'
-            ],
-            'FLIGHT_INFO': [
-                r'vé máy bay', r'chuyến bay', r'đặt vé', r'đặt chỗ bay',
-                r'bay.*nước ngoài', r'giá vé.*bay'
-            ],
-            'WEATHER_INFO': [
-                r'thời tiết', r'dự báo', r'mưa', r'nắng', r'nhiệt độ'
-            ],
-            'BOOKING_ACTION': [
-                r'đặt tour', r'book', r'đặt lịch', r'đăng ký tour',
-                r'thanh toán', r'đặt chỗ'
-            ],
-            'BOOKING_STATUS': [
-                r'kiểm tra.*đặt', r'tình trạng', r'đã đặt.*chưa', 
-                r'xác nhận.*đặt', r'hủy.*đặt'
-            ],
-            'FAQ': [
-                r'câu hỏi', r'thắc mắc', r'hỏi', r'giải đáp', 
-                r'tư vấn', r'làm sao để'
-            ],
-            'GREETING': [
-                r'xin chào', r'hello', r'hi', r'chào', r'hey'
-            ],
-            'PRIVATE_TOUR': [
-                r'tour private', r'tour riêng', r'thuê xe riêng', r'xe riêng',
-                r'hướng dẫn viên riêng', r'du lịch tự túc', r'đi riêng'
-            ]
-        }
+        # Dictionary lưu trữ các patterns và intents, biên dịch một lần thành một regex
+        self.patterns = INTENT_PATTERNS
+        self.intent_classifier = IntentClassifier(self.patterns)
         
     def preprocess_text(self, text):
         """Tiền xử lý văn bản"""
@@ -99,23 +67,8 @@ class NLPProcessor:
             "people_count": None
         }
         
-        # Extract locations (with error handling)
-        try:
-            locations = list(db.locations.find({}, {"name": 1}))
-            location_names = [loc["name"] for loc in locations]
-            
-            # Rest of your location extraction code
-            for word in message.lower().split():
-                if word in location_names:
-                    entities["locations"].append(word)
-        except Exception as e:
-            import logging
-            logging.warning(f"Could not access locations collection: {str(e)}. Using fallback method.")
-            # Fallback method - hardcoded popular locations
-            common_locations = ["nhật bản", "hàn quốc", "thái lan", "singapore", "mỹ", "pháp"]
-            for location in common_locations:
-                if location in message.lower():
-                    entities["locations"].append(location)
+        # Extract locations (gazetteer được cache, không truy vấn DB mỗi tin nhắn)
+        entities["locations"] = location_gazetteer.find_locations(message)
         
         # Extract dates 
         # ... rest of your existing code ...
@@ -124,12 +77,11 @@ class NLPProcessor:
         
     def classify_intent(self, text):
         """Phân loại ý định từ văn bản"""
-        for intent, patterns in self.patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text.lower()):
-                    return intent
-        
-        return "UNKNOWN"
+        return self.intent_classifier.classify(text)
+    
+    def classify_intents(self, text):
+        """Tất cả ý định khớp với văn bản, kèm độ ưu tiên (0 = cao nhất)"""
+        return self.intent_classifier.classify_all(text)
     
     def analyze_message(self, message):
         """Phân tích tin nhắn để xác định ý định và thực thể"""
@@ -146,4 +98,5 @@ class NLPProcessor:
         }
     
 
-nlp_processor = NLPProcessor()
\ No newline at end of file
+# Khởi tạo khi dùng lần đầu (xem services.registry)
+nlp_processor = registry.lazy("nlp_processor")
\ No newline at end of file
@@ -0,0 +1,176 @@
+# Service for multiple Zalo Official Accounts: per-OA config, clients, key namespaces and worker shards
+import json
+import logging
+import os
+import threading
+import zlib
+from contextvars import ContextVar
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT = 10  # tin nhắn/giây mỗi OA
+
+
+class OAConfig:
+    """Cấu hình một Official Account: thông tin app Zalo, token, giới hạn gửi và số lượt đồng thời."""
+
+    def __init__(self, oa_id, name=None, app_id=None, app_secret=None, access_token=None, refresh_token=None,
+                 rate_limit=DEFAULT_RATE_LIMIT, max_concurrency=None):
+        self.oa_id = str(oa_id)
+        self.name = name or self.oa_id
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.rate_limit = rate_limit
+        self.max_concurrency = max_concurrency
+
+    @staticmethod
+    def from_dict(data):
+        return OAConfig(
+            oa_id=data["oa_id"],
+            name=data.get("name"),
+            app_id=data.get("app_id"),
+            app_secret=data.get("app_secret"),
+            access_token=data.get("access_token"),
+            refresh_token=data.get("refresh_token"),
+            rate_limit=data.get("rate_limit", DEFAULT_RATE_LIMIT),
+            max_concurrency=data.get("max_concurrency"),
+        )
+
+
+def load_oa_configs(path=None):
+    """Đọc danh sách OA từ file JSON (ZALO_OA_CONFIG); không có file thì dùng một OA từ biến môi trường."""
+    path = path or Config.ZALO_OA_CONFIG
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [OAConfig.from_dict(item) for item in json.load(f)]
+    return [OAConfig(
+        oa_id=Config.ZALO_OA_ID,
+        app_id=os.environ.get("ZALO_APP_ID"),
+        app_secret=os.environ.get("ZALO_APP_SECRET"),
+        access_token=os.environ.get("ZALO_ACCESS_TOKEN"),
+        refresh_token=os.environ.get("ZALO_REFRESH_TOKEN"),
+    )]
+
+
+def shard_of(oa_id, shard_count):
+    return zlib.crc32(str(oa_id).encode("utf-8")) % shard_count
+
+
+class OARegistry:
+    """Danh bạ OA của deployment. OA đầu tiên là OA mặc định: giữ nguyên route /webhook và
+    các key Redis cũ (không tiền tố), các OA khác dùng id hội thoại dạng "{oa_id}:{user_id}".
+
+    Worker chỉ nhận webhook của các OA thuộc shard của mình (crc32(oa_id) % shard_count).
+    """
+
+    def __init__(self, configs=None, shard_index=None, shard_count=None):
+        self._configs = configs
+        self.shard_index = Config.WORKER_SHARD_INDEX if shard_index is None else shard_index
+        self.shard_count = Config.WORKER_SHARD_COUNT if shard_count is None else shard_count
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @property
+    def configs(self):
+        if self._configs is None:
+            self._configs = {config.oa_id: config for config in load_oa_configs()}
+        return self._configs
+
+    @property
+    def default_id(self):
+        return next(iter(self.configs))
+
+    def get(self, oa_id):
+        return self.configs.get(str(oa_id))
+
+    def all(self):
+        return list(self.configs.values())
+
+    def owns(self, oa_id):
+        """OA có thuộc shard của worker này không."""
+        return self.shard_count <= 1 or shard_of(oa_id, self.shard_count) == self.shard_index
+
+    def client(self, oa_id=None):
+        """ZaloAPI của OA (tạo một lần). OA mặc định dùng chung instance "zalo_api" của registry."""
+        oa_id = str(oa_id or self.default_id)
+        if oa_id == self.default_id:
+            from services.registry import registry
+            return registry.get("zalo_api")
+        client = self._clients.get(oa_id)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(oa_id)
+                if client is None:
+                    client = build_client(self.configs[oa_id])
+                    self._clients[oa_id] = client
+        return client
+
+    def max_concurrency(self, oa_id):
+        """Số lượt đồng thời của OA: theo cấu hình, mặc định chia đều GEMINI_MAX_CONCURRENCY."""
+        config = self.get(oa_id)
+        if config and config.max_concurrency:
+            return config.max_concurrency
+        return max(1, Config.GEMINI_MAX_CONCURRENCY // max(1, len(self.configs)))
+
+
+oa_registry = OARegistry()
+
+
+def build_client(config):
+    """ZaloAPI cho một OA. Có refresh token thì access token do TokenManager (Redis) quản lý."""
+    from services.zalo_api import ZaloAPI
+    token_manager = None
+    if config.refresh_token:
+        from services.token_manager import TokenManager, redis_client
+        token_manager = TokenManager(config.oa_id, config.app_id, config.app_secret, redis_client,
+                                     access_token=config.access_token, refresh_token=config.refresh_token)
+    return ZaloAPI(app_id=config.app_id, secret_key=config.app_secret, access_token=config.access_token,
+                   rate_limit=config.rate_limit, token_manager=token_manager)
+
+
+def create_default_client():
+    """ZaloAPI của OA mặc định (đăng ký trong services.registry với tên "zalo_api")."""
+    return build_client(oa_registry.get(oa_registry.default_id))
+
+
+def _refresh_tokens(interval, stop):
+    while not stop.wait(interval):
+        for config in oa_registry.all():
+            if not (config.refresh_token and oa_registry.owns(config.oa_id)):
+                continue
+            try:
+                # get_token tự làm mới khi token sắp hết hạn, kể cả lúc OA không có tin nhắn
+                oa_registry.client(config.oa_id).token_manager.get_token()
+            except Exception as e:
+                logger.error(f"Không làm mới được access token OA {config.oa_id}: {e}")
+
+
+def start_token_refresher(interval=60):
+    """Thread nền giữ access token của các OA thuộc worker này luôn còn hạn."""
+    stop = threading.Event()
+    threading.Thread(target=_refresh_tokens, args=(interval, stop), name="token-refresher", daemon=True).start()
+    return stop
+
+
+# OA của request/lượt đang xử lý; task asyncio tạo trong request kế thừa giá trị này
+_current_oa = ContextVar("current_oa", default=None)
+
+
+def set_current_oa(oa_id):
+    return _current_oa.set(str(oa_id) if oa_id else None)
+
+
+def current_oa_id():
+    return _current_oa.get() or oa_registry.default_id
+
+
+def scoped_id(user_id):
+    """Id hội thoại dùng cho key Redis/Mongo: giữ nguyên với OA mặc định, thêm tiền tố OA với OA khác."""
+    oa_id = current_oa_id()
+    if oa_id == oa_registry.default_id:
+        return str(user_id)
+    return f"{oa_id}:{user_id}"
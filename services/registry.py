@@ -0,0 +1,138 @@
+# Service registry: lazy singletons, warm-up phases and startup profiling
+import importlib
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự khởi động: kết nối hạ tầng trước, sau đó model AI, cuối cùng là tầng ứng dụng
+PHASES = ("core", "ai", "app")
+
+
+class LazyService:
+    """Proxy trỏ tới một service trong registry; service chỉ được tạo ở lần truy cập đầu tiên."""
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry, name):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def _resolve(self):
+        return self._registry.get(self._name)
+
+    def __getattr__(self, attr):
+        # Thăm dò dunder (copy, mock, inspect) không được kích hoạt khởi tạo service
+        if attr.startswith("__") and attr.endswith("__"):
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._resolve(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._resolve(), attr)
+
+    def __repr__(self):
+        state = "ready" if self._registry.is_initialized(self._name) else "lazy"
+        return f"<LazyService {self._name} ({state})>"
+
+
+class ServiceRegistry:
+    """Đăng ký service theo tên và khởi tạo theo yêu cầu.
+
+    `target` là chuỗi "module:attr" (module chỉ được import khi cần) hoặc một callable.
+    Thời gian import module và thời gian khởi tạo của từng service được ghi lại để
+    `report()` cho biết phần nào làm chậm khởi động.
+    """
+
+    def __init__(self):
+        self._entries = {}  # {name: (target, phase)}
+        self._instances = {}
+        self._lock = threading.RLock()
+        self.timings = {}  # {name: {"phase", "import", "init"}}
+
+    def register(self, name, target, phase="app"):
+        if phase not in PHASES:
+            raise ValueError(f"Unknown phase: {phase}")
+        with self._lock:
+            self._entries[name] = (target, phase)
+        return self.lazy(name)
+
+    def lazy(self, name):
+        return LazyService(self, name)
+
+    def is_initialized(self, name):
+        return name in self._instances
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name not in self._entries:
+                raise KeyError(f"Service '{name}' is not registered")
+            target, phase = self._entries[name]
+
+            import_time = 0.0
+            if isinstance(target, str):
+                module_name, attr = target.split(":")
+                start = time.perf_counter()
+                already_loaded = module_name in sys.modules
+                module = importlib.import_module(module_name)
+                if not already_loaded:
+                    import_time = time.perf_counter() - start
+                factory = getattr(module, attr)
+            else:
+                factory = target
+
+            start = time.perf_counter()
+            instance = factory()
+            init_time = time.perf_counter() - start
+
+            self._instances[name] = instance
+            self.timings[name] = {"phase": phase, "import": import_time, "init": init_time}
+            logger.info(f"Khởi tạo service '{name}': import {import_time * 1000:.0f} ms, init {init_time * 1000:.0f} ms")
+            return instance
+
+    def warm_up(self, *phases):
+        """Khởi tạo trước các service theo phase (mặc định tất cả, theo thứ tự PHASES)."""
+        for phase in phases or PHASES:
+            for name, (_, entry_phase) in list(self._entries.items()):
+                if entry_phase == phase:
+                    try:
+                        self.get(name)
+                    except Exception as e:
+                        logger.error(f"Không khởi tạo được service '{name}': {e}")
+        return self.report()
+
+    def report(self):
+        """Bảng thời gian import/init theo service, chậm nhất trước."""
+        rows = sorted(self.timings.items(), key=lambda item: item[1]["import"] + item[1]["init"], reverse=True)
+        lines = [f"{'service':<28}{'phase':<8}{'import':>10}{'init':>10}"]
+        total = 0.0
+        for name, timing in rows:
+            total += timing["import"] + timing["init"]
+            lines.append(
+                f"{name:<28}{timing['phase']:<8}"
+                f"{timing['import'] * 1000:>8.0f}ms{timing['init'] * 1000:>8.0f}ms"
+            )
+        lines.append(f"{'total':<36}{total * 1000:>18.0f}ms")
+        return "\n".join(lines)
+
+
+registry = ServiceRegistry()
+
+registry.register("db", "services.database:connect", phase="core")
+registry.register("zalo_api", "services.oa_registry:create_default_client", phase="core")
+registry.register("model_gateway", "services.model_gateway:warm_up", phase="ai")
+registry.register("tour_processor", "services.tour_processor:TourPriceProcessor", phase="ai")
+registry.register("ai_processor", "services.ai_processor:AIProcessor", phase="ai")
+registry.register("nlp_processor", "services.nlp_processor:NLPProcessor", phase="ai")
+registry.register("message_handler", "services.message_handler:MessageHandler", phase="app")
+registry.register("conversation_archiver", "services.conversation_store:start_archiver", phase="app")
+registry.register("token_refresher", "services.oa_registry:start_token_refresher", phase="app")
@@ -0,0 +1,92 @@
+# Service for in-memory BM25 retrieval over short Vietnamese texts
+import re
+import unicodedata
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_text(text):
+    """Chữ thường, bỏ dấu tiếng Việt, bỏ dấu câu ('Làm hộ chiếu?' -> 'lam ho chieu'); khách hay gõ không dấu."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(_TOKEN.findall(text))
+
+
+def tokenize(text):
+    """Âm tiết và cặp âm tiết liền nhau (từ tiếng Việt thường gồm hai âm tiết: 'ho chieu')."""
+    syllables = normalize_text(text).split()
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class BM25Index:
+    """Chỉ mục BM25 trong bộ nhớ cho vài chục đến vài nghìn đoạn văn ngắn.
+
+    Trọng số BM25 của mọi (đoạn, term) được tính sẵn thành ma trận dày float32, nên chấm điểm
+    một câu hỏi chỉ là một phép nhân ma trận-vector. `confidence` (0..1) là trung bình nhân của
+    phần trọng số câu hỏi tìm thấy trong đoạn và phần trọng số của đoạn được câu hỏi nhắc tới,
+    dùng để so với ngưỡng thay cho điểm BM25 thô (không có thang cố định).
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.size = len(documents)
+        self.vocabulary = {}
+        rows = []
+        for document in documents:
+            counts = {}
+            for term in tokenize(document):
+                column = self.vocabulary.setdefault(term, len(self.vocabulary))
+                counts[column] = counts.get(column, 0) + 1
+            rows.append(counts)
+
+        tf = np.zeros((self.size, max(1, len(self.vocabulary))), dtype=np.float32)
+        for i, counts in enumerate(rows):
+            if counts:
+                tf[i, list(counts)] = list(counts.values())
+
+        lengths = tf.sum(axis=1)
+        average = lengths.mean() if self.size else 0.0
+        df = (tf > 0).sum(axis=0)
+        self.idf = np.log1p((self.size - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / average) if average else np.full(self.size, k1, dtype=np.float32)
+        self.weights = (self.idf * tf * (k1 + 1) / (tf + norm[:, None])).astype(np.float32)
+        self._document_mass = self.weights.sum(axis=1)
+        # Term không có trong chỉ mục được tính như term hiếm nhất khi đo độ phủ của câu hỏi
+        self._unknown_idf = float(self.idf.max()) if self.size else 1.0
+
+    def _query(self, text):
+        vector = np.zeros(self.weights.shape[1], dtype=np.float32)
+        unknown = 0
+        for term in set(tokenize(text)):
+            column = self.vocabulary.get(term)
+            if column is None:
+                unknown += 1
+            else:
+                vector[column] = 1.0
+        return vector, unknown
+
+    def search(self, text, k=3):
+        """Top-k đoạn khớp nhất: danh sách (chỉ số, điểm BM25, confidence), bỏ đoạn điểm 0."""
+        if not self.size:
+            return []
+        query, unknown = self._query(text)
+        if not query.any():
+            return []
+        scores = self.weights @ query
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        query_mass = float(self.idf @ query) + unknown * self._unknown_idf
+        matched_idf = (self.weights > 0).astype(np.float32)[top] @ (self.idf * query)
+        results = []
+        for index, matched in zip(top, matched_idf):
+            score = float(scores[index])
+            if score <= 0:
+                break
+            confidence = np.sqrt((matched / query_mass) * (score / self._document_mass[index]))
+            results.append((int(index), score, float(confidence)))
+        return results
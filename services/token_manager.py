@@ -0,0 +1,225 @@
+# Service for sharing and refreshing Zalo OA access tokens across workers
+import logging
+import threading
+import time
+import uuid
+
+import redis
+import requests
+
+logger = logging.getLogger(__name__)
+
+redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+
+OAUTH_URL = "https://oauth.zaloapp.com/v4/oa/access_token"
+
+# Lỗi Zalo trả về khi access token hết hạn/không hợp lệ
+INVALID_TOKEN_ERRORS = (-216, -124)
+
+# Chỉ xóa lock nếu vẫn là lock của worker này
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TokenError(Exception):
+    pass
+
+
+class TokenManager:
+    """Access token của một OA, lưu trong Redis (hash `zalo:token:{oa_id}`) cùng refresh token và hạn dùng.
+
+    Mỗi worker đọc token từ bản sao cục bộ, kiểm tra lại Redis sau `local_ttl` giây. Khi token
+    còn dưới `refresh_margin` giây, một worker (giữ lock SET NX) đổi refresh token lấy token mới;
+    các worker khác tiếp tục dùng token cũ (vẫn còn hạn) hoặc chờ token mới nếu đã hết hạn.
+    Refresh token của Zalo chỉ dùng được một lần nên không được để hai worker cùng refresh.
+    """
+
+    KEY_PREFIX = "zalo:token:"
+
+    def __init__(self, oa_id, app_id, secret_key, redis_client=None, access_token=None, refresh_token=None,
+                 refresh_margin=600, initial_expires_in=3600, lock_ttl=30, local_ttl=60, http_post=None,
+                 clock=time.time):
+        self.oa_id = oa_id
+        self.app_id = app_id
+        self.secret_key = secret_key
+        self.redis_client = redis_client
+        self.refresh_margin = refresh_margin
+        self.initial_expires_in = initial_expires_in
+        self.lock_ttl = lock_ttl
+        self.local_ttl = local_ttl
+        self.http_post = http_post or requests.post
+        self.clock = clock
+        self.key = f"{self.KEY_PREFIX}{oa_id}"
+        self.lock_key = f"{self.key}:lock"
+        self._seed = {"access_token": access_token, "refresh_token": refresh_token}
+        self._state = None  # {"access_token", "refresh_token", "expires_at"}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._release_lock = redis_client.register_script(_RELEASE_LOCK) if redis_client is not None else None
+
+    # --- trạng thái -------------------------------------------------------
+
+    def _read_shared(self):
+        if self.redis_client is None:
+            return None
+        try:
+            data = self.redis_client.hgetall(self.key)
+        except Exception as e:
+            logger.warning(f"Không đọc được token OA {self.oa_id} từ Redis: {e}")
+            return None
+        if not data or not data.get("access_token"):
+            return None
+        return {
+            "access_token": data["access_token"],
+            "refresh_token": data.get("refresh_token") or None,
+            "expires_at": float(data.get("expires_at") or 0),
+        }
+
+    def _write_shared(self, state, only_if_missing=False):
+        if self.redis_client is None:
+            return
+        mapping = {
+            "access_token": state["access_token"],
+            "refresh_token": state.get("refresh_token") or "",
+            "expires_at": state["expires_at"],
+        }
+        try:
+            if only_if_missing:
+                # Chỉ seed khi Redis chưa có token (worker khác có thể đã refresh)
+                if self.redis_client.hsetnx(self.key, "access_token", mapping["access_token"]):
+                    self.redis_client.hset(self.key, mapping=mapping)
+            else:
+                self.redis_client.hset(self.key, mapping=mapping)
+        except Exception as e:
+            logger.warning(f"Không ghi được token OA {self.oa_id} vào Redis: {e}")
+
+    def _load(self):
+        state = self._read_shared()
+        if state is None and self._seed["access_token"]:
+            state = dict(self._seed, expires_at=self.clock() + self.initial_expires_in)
+            self._write_shared(state, only_if_missing=True)
+            state = self._read_shared() or state
+        if state is None and self._seed["refresh_token"]:
+            state = {"access_token": "", "refresh_token": self._seed["refresh_token"], "expires_at": 0}
+        self._state = state
+        self._checked_at = self.clock()
+        return state
+
+    # --- refresh ----------------------------------------------------------
+
+    def _request_token(self, refresh_token):
+        try:
+            response = self.http_post(
+                OAUTH_URL,
+                headers={"secret_key": self.secret_key, "Content-Type": "application/x-www-form-urlencoded"},
+                data={"refresh_token": refresh_token, "app_id": self.app_id, "grant_type": "refresh_token"},
+                timeout=10,
+            )
+            data = response.json()
+            expires_in = int(data.get("expires_in") or 3600)
+        except Exception as e:
+            # Lỗi mạng/timeout/JSON hỏng: báo như lỗi refresh để người gọi dùng tiếp token còn hạn
+            raise TokenError(f"Không gọi được OAuth Zalo cho OA {self.oa_id}: {e}") from e
+        if not data.get("access_token"):
+            raise TokenError(f"Zalo từ chối refresh token OA {self.oa_id}: {data}")
+        return {
+            "access_token": data["access_token"],
+            "refresh_token": data.get("refresh_token") or refresh_token,
+            "expires_at": self.clock() + expires_in,
+        }
+
+    def _acquire_lock(self):
+        if self.redis_client is None:
+            return "local"
+        token = uuid.uuid4().hex
+        try:
+            return token if self.redis_client.set(self.lock_key, token, nx=True, ex=self.lock_ttl) else None
+        except Exception as e:
+            logger.warning(f"Không lấy được lock refresh token OA {self.oa_id}, refresh cục bộ: {e}")
+            return "local"
+
+    def _unlock(self, token):
+        if token == "local" or self._release_lock is None:
+            return
+        try:
+            self._release_lock(keys=[self.lock_key], args=[token])
+        except Exception as e:
+            logger.warning(f"Không nhả được lock refresh token OA {self.oa_id}: {e}")
+
+    def _needs_refresh(self, state, now):
+        return not state or not state["access_token"] or state["expires_at"] - self.refresh_margin <= now
+
+    def _refresh(self, force=False):
+        lock = self._acquire_lock()
+        if lock is None:
+            return self._wait_for_refresh()
+        try:
+            # Đọc lại sau khi có lock: worker khác có thể vừa refresh xong
+            state = self._read_shared() or self._state
+            if not force and not self._needs_refresh(state, self.clock()):
+                self._state = state
+                return state
+            if not state or not state.get("refresh_token"):
+                raise TokenError(f"OA {self.oa_id} không có refresh token để làm mới access token")
+            new_state = self._request_token(state["refresh_token"])
+            self._write_shared(new_state)
+            self._state = new_state
+            self._checked_at = self.clock()
+            logger.info(f"Đã làm mới access token OA {self.oa_id}, hết hạn sau "
+                        f"{new_state['expires_at'] - self.clock():.0f}s")
+            return new_state
+        finally:
+            self._unlock(lock)
+
+    def _wait_for_refresh(self):
+        """Worker khác đang refresh: dùng token cũ nếu còn hạn, không thì chờ token mới."""
+        state = self._state
+        if state and state["access_token"] and state["expires_at"] > self.clock():
+            return state
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            shared = self._read_shared()
+            if shared and shared["expires_at"] > self.clock():
+                self._state = shared
+                self._checked_at = self.clock()
+                return shared
+        raise TokenError(f"Hết thời gian chờ access token mới cho OA {self.oa_id}")
+
+    # --- API --------------------------------------------------------------
+
+    def get_token(self):
+        now = self.clock()
+        state = self._state
+        if state and now - self._checked_at < self.local_ttl and not self._needs_refresh(state, now):
+            return state["access_token"]
+        with self._lock:
+            state = self._load() if now - self._checked_at >= self.local_ttl or self._state is None else self._state
+            if self._needs_refresh(state, now):
+                try:
+                    state = self._refresh()
+                except TokenError:
+                    # Còn hạn thì vẫn dùng token cũ, lần gọi sau sẽ thử refresh lại
+                    if state and state["access_token"] and state["expires_at"] > now:
+                        logger.exception(f"Refresh token OA {self.oa_id} thất bại, dùng token hiện tại")
+                    else:
+                        raise
+            return state["access_token"]
+
+    def invalidate(self, rejected_token=None):
+        """Zalo báo token không hợp lệ: refresh ngay (một worker), trả về token mới."""
+        with self._lock:
+            shared = self._read_shared()
+            if shared and rejected_token and shared["access_token"] != rejected_token:
+                # Worker khác đã thay token
+                self._state, self._checked_at = shared, self.clock()
+                return shared["access_token"]
+            return self._refresh(force=True)["access_token"]
+
+    def status(self):
+        state = self._state or {}
+        return {"oa_id": self.oa_id, "expires_in": round(state.get("expires_at", 0) - self.clock())}
@@ -9,25 +9,22 @@ import logging
 import re
 from datetime import datetime
 
-import google.generativeai as genai
-import redis
 from config import Config  # Assumes Config contains API key
+from models.conversation import Turn
+from services.conversation_store import conversation_store
+from services.faq_index import faq_index
+from services.message_packer import pack_message
+from services.model_gateway import model_gateway
+from services.registry import registry
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Redis for persistent storage
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-
-# Giới hạn ký tự tối đa cho một tin nhắn Zalo (160 ký tự)
-ZALO_MESSAGE_LIMIT = 160
-
 class TourPriceProcessor:
     def __init__(self):
         """Khởi tạo processor với cấu hình AI và dữ liệu giá tour."""
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = model_gateway.model('gemini-2.0-flash')
         self.tour_pricing = self._load_tour_pricing_data()
 
     def _load_tour_pricing_data(self):
@@ -124,18 +121,17 @@ class TourPriceProcessor:
     async def _analyze_conversation(self, user_query, user_id):
         """Phân tích hội thoại tour bằng AI với sự linh hoạt và chuyên nghiệp."""
         try:
-            context_key = f"context:{user_id}"
-            history_key = f"history:{user_id}"
-            current_context = json.loads(redis_client.get(context_key) or '{}')
-            history = json.loads(redis_client.get(history_key) or '[]')[-10:]
+            current_context = conversation_store.get_context(user_id)
+            history = conversation_store.get_history(user_id)[-10:]
 
             # Định dạng lịch sử để AI dễ đọc
-            history_formatted = ""
-            for msg in history:
-                if msg.startswith("User:"):
-                    history_formatted += f"Khách: {msg[5:].strip()}\n"
-                elif msg.startswith("Bot:"):
-                    history_formatted += f"Bot: {msg[4:].strip()}\n"
+            history_formatted = "".join(
+                f"{'Khách' if turn.role == 'user' else 'Bot'}: {turn.text}\n" for turn in history
+            )
+
+            # FAQ liên quan (chưa đủ chắc để trả lời thẳng) làm tài liệu tham khảo cho AI
+            faq_snippets = faq_index.snippets(user_query)
+            faq_section = ("**FAQ liên quan:**\n" + "\n\n".join(faq_snippets) + "\n\n") if faq_snippets else ""
 
             # Prompt AI cải tiến để tự nhiên và linh hoạt hơn
             prompt = (
@@ -144,6 +140,7 @@ class TourPriceProcessor:
                 
                 f"**Lịch sử hội thoại:**\n{history_formatted}\n\n"
                 f"**Thông tin đã thu thập:**\n{json.dumps(current_context, ensure_ascii=False)}\n\n"
+                f"{faq_section}"
                 f"**Tin nhắn hiện tại:**\n{user_query}\n\n"
                 
                 "**Nhiệm vụ của bạn:**\n"
@@ -182,7 +179,7 @@ class TourPriceProcessor:
                 "}"
             )
             
-            response = self.model.generate_content(prompt)
+            response = await model_gateway.generate_async(prompt)
             result = json.loads(response.text.strip().replace("```json", "").replace("```", ""))
             
             # Cập nhật context từ kết quả AI
@@ -191,9 +188,9 @@ class TourPriceProcessor:
                     current_context[key] = value
 
             # Lưu context và lịch sử vào Redis
-            redis_client.set(context_key, json.dumps(current_context))
-            history.append(f"User: {user_query}")
-            redis_client.set(history_key, json.dumps(history[-10:]))
+            conversation_store.set_context(user_id, current_context)
+            history.append(Turn.user(user_query, intent="tour"))
+            conversation_store.set_history(user_id, history)
 
             return result
 
@@ -209,43 +206,26 @@ class TourPriceProcessor:
 
     def _split_message(self, message):
         """Chia nhỏ tin nhắn nếu vượt quá giới hạn ký tự của Zalo."""
-        if len(message) <= ZALO_MESSAGE_LIMIT:
-            return [message]
-        
-        messages = []
-        lines = message.split('\n')
-        current_message = ""
-        
-        for line in lines:
-            if len(current_message) + len(line) + 1 > ZALO_MESSAGE_LIMIT:
-                if current_message:
-                    messages.append(current_message.strip())
-                current_message = line
-            else:
-                current_message += f"\n{line}" if current_message else line
-        
-        if current_message:
-            messages.append(current_message.strip())
-        
-        return messages
+        return pack_message(message)
 
     async def process_tour_query(self, user_id, user_query):
         """Xử lý truy vấn của người dùng với sự chuyên nghiệp và linh hoạt."""
         try:
             analysis = await self._analyze_conversation(user_query, user_id)
-            context = json.loads(redis_client.get(f"context:{user_id}") or '{}')
+            context = conversation_store.get_context(user_id)
             
             # Cập nhật context từ analysis
             for key, value in analysis.get("context", {}).items():
                 if value is not None:
                     context[key] = value
-            redis_client.set(f"context:{user_id}", json.dumps(context))
+            # Tín hiệu ưu tiên cho TurnScheduler ở lượt sau
+            context["ready_for_price"] = bool(analysis.get("ready_for_price"))
+            conversation_store.set_context(user_id, context)
             
             # Xử lý reset
             if context.get("reset"):
                 new_context = {"country": None, "days": None, "pax": None, "no_meal": False, "phone": None, "reset": False, "special_request": None}
-                redis_client.set(f"context:{user_id}", json.dumps(new_context))
-                redis_client.delete(f"history:{user_id}")
+                conversation_store.reset(user_id, new_context)
                 return ["Dạ, em đã reset thông tin. Anh/chị có thể bắt đầu lại nhé!"], new_context
             
             # Xử lý số điện thoại
@@ -265,9 +245,7 @@ class TourPriceProcessor:
                     "Nhân viên tư vấn sẽ liên hệ ngay để giải đáp và thiết kế tour theo nhu cầu của mình ạ!"
                 )
                 messages = self._split_message(response)
-                redis_client.set(f"history:{user_id}", json.dumps(
-                    json.loads(redis_client.get(f"history:{user_id}") or '[]')[-4:] + [f"Bot: {response}"]
-                ))
+                conversation_store.append_history(user_id, Turn.bot(response, intent="tour"), keep=5)
                 return messages, context
             
             # Tính giá khi đủ thông tin
@@ -280,9 +258,7 @@ class TourPriceProcessor:
                 )
                 response = self._build_price_response(price_info, context)
                 messages = self._split_message(response)
-                redis_client.set(f"history:{user_id}", json.dumps(
-                    json.loads(redis_client.get(f"history:{user_id}") or '[]')[-4:] + [f"Bot: {response}"]
-                ))
+                conversation_store.append_history(user_id, Turn.bot(response, intent="tour"), keep=5)
                 return messages, context
             
             # Phản hồi mặc định từ AI
@@ -292,7 +268,7 @@ class TourPriceProcessor:
 
         except Exception as e:
             logger.error(f"Error in process_tour_query: {e}")
-            return ["Dạ, hệ thống gặp chút trục trặc. Anh/chị vui lòng thử lại nhé!"], json.loads(redis_client.get(f"context:{user_id}") or '{}')
+            return ["Dạ, hệ thống gặp chút trục trặc. Anh/chị vui lòng thử lại nhé!"], conversation_store.get_context(user_id)
 
     def _calculate_tour_price(self, country, pax, days, no_meal):
         """Tính toán giá tour dựa trên giá cơ bản 1 người/ngày."""
@@ -321,18 +297,18 @@ class TourPriceProcessor:
     def _save_customer_lead(self, user_id, context):
         """Lưu thông tin khách hàng tiềm năng vào cơ sở dữ liệu."""
         try:
-            from services.database import db
+            from services.lead_writer import lead_writer
             lead_data = {
                 "phone": context["phone"],
                 "zalo_user_id": user_id,
                 "source": "zalo_bot",
-                "created_at": datetime.now().isoformat(),
+                "created_at": datetime.now(),
                 "service_type": context.get("service_type", "tour"),
                 "country_interest": context.get("country", ""),
                 "description": f"{context.get('country', '')}, {context.get('days', 'chưa xác định')} ngày, {context.get('pax', 'chưa xác định')} người, yêu cầu đặc biệt: {context.get('special_request', 'không')}"
             }
-            db.get_collection("leads").insert_one(lead_data)
-            logger.info(f"Đã lưu lead: {context['phone']}")
+            lead_writer.submit(lead_data)
+            logger.info(f"Đã ghi nhận lead: {context['phone']}")
         except Exception as e:
             logger.error(f"Error saving lead: {e}")
 
@@ -351,4 +327,5 @@ class TourPriceProcessor:
             f"Đây là giá ước tính dựa trên thông tin anh/chị cung cấp. Nếu cần lịch trình chi tiết hoặc điều chỉnh theo nhu cầu riêng, anh/chị có muốn em hỗ trợ thêm không ạ?"
         )
 
-tour_processor = TourPriceProcessor()
\ No newline at end of file
+# Khởi tạo khi dùng lần đầu (xem services.registry)
+tour_processor = registry.lazy("tour_processor")
\ No newline at end of file
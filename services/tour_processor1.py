@@ -2,7 +2,6 @@
 """
 AI Processor for handling private tour pricing and consultation with enhanced flexibility.
 """
-import google.generativeai as genai
 import asyncio
 import logging
 import re
@@ -12,6 +11,7 @@ from functools import lru_cache
 from datetime import datetime
 
 from config import Config
+from services.model_gateway import model_gateway
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,8 +22,7 @@ redis_client = redis.Redis(host='localhost', port=6379, db=0)
 
 class TourPriceProcessor:
     def __init__(self):
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = model_gateway.model('gemini-2.0-flash')
         self.tour_pricing = self._load_tour_pricing_data()
         self.conversation_context = {}
         self.weather_info = {
@@ -111,7 +110,7 @@ class TourPriceProcessor:
                 f"Câu hỏi hiện tại:\n{user_query}\n\n"
                 "Trả về JSON như: {'no_meal': false, 'upgrade_hotel': false, 'ask_guide': false, 'is_consultation': false, ...}. Phân tích tự nhiên, chỉ thay đổi khi có yêu cầu rõ ràng."
             )
-            response = self.model.generate_content(prompt)
+            response = await model_gateway.generate_async(prompt)
             response_text = response.text.strip()
             if response_text.startswith("```json") and response_text.endswith("```"):
                 response_text = response_text[7:-3].strip()
@@ -167,7 +166,7 @@ class TourPriceProcessor:
                 "- Nếu bỏ bữa ăn: 'Vì anh/chị tự túc ăn, mình gợi ý nên thử các nhà hàng địa phương nổi tiếng tại điểm đến nhé!'\n"
                 "Trả về gợi ý dưới dạng văn bản ngắn gọn, không cần định dạng đặc biệt."
             )
-            response = self.model.generate_content(prompt)
+            response = await model_gateway.generate_async(prompt)
             recommendation = response.text.strip()
             if recommendation:
                 return f"💡 {recommendation}"
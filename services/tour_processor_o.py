@@ -9,9 +9,10 @@ import logging
 import re
 from datetime import datetime
 
-import google.generativeai as genai
 import redis
 from config import Config  # Assumes Config contains API key
+from services.message_packer import pack_message
+from services.model_gateway import model_gateway
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,14 +21,10 @@ logger = logging.getLogger(__name__)
 # Initialize Redis for persistent storage
 redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
-# Giới hạn ký tự tối đa cho một tin nhắn Zalo (160 ký tự)
-ZALO_MESSAGE_LIMIT = 160
-
 class TourPriceProcessor:
     def __init__(self):
         """Khởi tạo processor với cấu hình AI và dữ liệu giá tour."""
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = model_gateway.model('gemini-2.0-flash')
         self.tour_pricing = self._load_tour_pricing_data()
 
     def _load_tour_pricing_data(self):
@@ -174,7 +171,7 @@ class TourPriceProcessor:
                 "}\n\n"
             )
             
-            response = self.model.generate_content(prompt)
+            response = await model_gateway.generate_async(prompt)
             response_text = response.text.strip()
             
             # Xử lý kết quả
@@ -238,25 +235,7 @@ class TourPriceProcessor:
 
     def _split_message(self, message):
         """Chia nhỏ tin nhắn nếu vượt quá giới hạn ký tự của Zalo."""
-        if len(message) <= ZALO_MESSAGE_LIMIT:
-            return [message]
-        
-        messages = []
-        lines = message.split('\n')
-        current_message = ""
-        
-        for line in lines:
-            if len(current_message) + len(line) + 1 > ZALO_MESSAGE_LIMIT:
-                if current_message:
-                    messages.append(current_message.strip())
-                current_message = line
-            else:
-                current_message += f"\n{line}" if current_message else line
-        
-        if current_message:
-            messages.append(current_message.strip())
-        
-        return messages
+        return pack_message(message)
 
     async def process_tour_query(self, user_id, user_query):
         """Xử lý truy vấn của người dùng và trả về danh sách phản hồi cùng context mới."""
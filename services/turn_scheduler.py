@@ -0,0 +1,238 @@
+# Service for priority scheduling of conversation turns
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Điểm cộng theo tín hiệu; lớp được suy ra từ tổng điểm
+SIGNAL_SCORES = {
+    "phone": 50,          # khách vừa để lại SĐT (context phone/customer_phone)
+    "open_booking": 40,   # đang có booking chưa hoàn tất
+    "lead": 20,           # đã là lead trong hệ thống
+    "ready_for_price": 10,
+}
+CLASSES = (("hot", 40), ("warm", 10), ("normal", 0))
+
+OPEN_BOOKING_STATUSES = ["pending", "confirmed", "paid"]
+
+# Mỗi giây chờ cộng thêm điểm để lượt điểm thấp không bị đói khi tải cao kéo dài
+AGING_PER_SECOND = 2
+
+
+def classify_score(score):
+    return next(name for name, threshold in CLASSES if score >= threshold)
+
+
+def _load_customer_signals(user_id):
+    from services.database import db
+    lead = db.leads.find_one({"zalo_user_id": user_id}, {"_id": 1})
+    booking = db.bookings.find_one({"user_id": user_id, "status": {"$in": OPEN_BOOKING_STATUSES}}, {"_id": 1})
+    return {"lead": lead is not None, "open_booking": booking is not None}
+
+
+class CustomerSignals:
+    """Cache theo user của các tín hiệu lấy từ Mongo (lead, booking đang mở), TTL `ttl` giây."""
+
+    def __init__(self, loader=None, ttl=600, max_size=10000):
+        self.loader = loader or _load_customer_signals
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache = {}  # {user_id: (signals, expires_at)}
+        self._indexes_ready = loader is not None
+        self._lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        from services.database import db
+        db.bookings.create_index([("user_id", 1), ("status", 1)], name="user_id_status")
+        self._indexes_ready = True
+
+    def get(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        try:
+            if not self._indexes_ready:
+                self._ensure_indexes()
+            signals = self.loader(user_id)
+        except Exception as e:
+            logger.warning(f"Không đọc được lead/booking của {user_id}: {e}")
+            return {}
+        with self._lock:
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            self._cache[user_id] = (signals, time.monotonic() + self.ttl)
+        return signals
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id, None)
+
+
+class LatencyWindow:
+    """Độ trễ gần đây (giây) của một lớp: số lượt, p50/p95 thời gian chờ và tổng thời gian."""
+
+    def __init__(self, window=500):
+        self.count = 0
+        self.waits = deque(maxlen=window)
+        self.totals = deque(maxlen=window)
+
+    def record(self, wait, total):
+        self.count += 1
+        self.waits.append(wait)
+        self.totals.append(total)
+
+    def snapshot(self):
+        def percentile(values, p):
+            values = sorted(values)
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+        return {
+            "turns": self.count,
+            "wait_p50_ms": percentile(self.waits, 0.5),
+            "wait_p95_ms": percentile(self.waits, 0.95),
+            "total_p50_ms": percentile(self.totals, 0.5),
+            "total_p95_ms": percentile(self.totals, 0.95),
+        }
+
+
+class TurnScheduler:
+    """Giới hạn số lượt xử lý đồng thời; khi hết slot, lượt có điểm cao hơn được phục vụ trước.
+
+    Dùng: `async with turn_scheduler.slot(user_id, context): ...`. Trạng thái được bảo vệ bằng
+    threading.Lock và lượt chờ được đánh thức qua call_soon_threadsafe, nên an toàn cả khi
+    các request chạy trên những event loop khác nhau.
+    """
+
+    def __init__(self, max_concurrency=None, signals=None, clock=time.monotonic):
+        self.max_concurrency = max_concurrency or Config.GEMINI_MAX_CONCURRENCY
+        self.signals = signals or CustomerSignals()
+        self.clock = clock
+        self.metrics = {name: LatencyWindow() for name, _ in CLASSES}
+        self._active = 0
+        self._waiting = []  # [(score, enqueued_at, seq, future)]
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def score(self, user_id, context=None):
+        context = context or {}
+        score = 0
+        if context.get("phone") or context.get("customer_phone"):
+            score += SIGNAL_SCORES["phone"]
+        if context.get("ready_for_price"):
+            score += SIGNAL_SCORES["ready_for_price"]
+        signals = self.signals.get(user_id)
+        if signals.get("open_booking"):
+            score += SIGNAL_SCORES["open_booking"]
+        if signals.get("lead"):
+            score += SIGNAL_SCORES["lead"]
+        return score
+
+    def waiting(self):
+        return len(self._waiting)
+
+    def _acquire(self, score, loop):
+        """Lấy slot ngay nếu còn, nếu không trả về future sẽ được đánh thức khi tới lượt."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                return None
+            future = loop.create_future()
+            self._waiting.append((score, self.clock(), next(self._seq), future))
+            return future
+
+    def _release(self):
+        with self._lock:
+            now = self.clock()
+            while self._waiting:
+                # Điểm cao nhất (cộng điểm theo thời gian chờ); bằng điểm thì đến trước phục vụ trước
+                index = max(range(len(self._waiting)),
+                            key=lambda i: (self._waiting[i][0] + (now - self._waiting[i][1]) * AGING_PER_SECOND,
+                                           -self._waiting[i][2]))
+                future = self._waiting.pop(index)[3]
+                if not future.done():
+                    # Chuyển slot thẳng cho lượt được chọn, _active giữ nguyên
+                    future.get_loop().call_soon_threadsafe(self._grant, future)
+                    return
+            self._active -= 1
+
+    def _grant(self, future):
+        if future.cancelled():
+            # Lượt đã bị hủy trước khi nhận slot: chuyển slot cho lượt tiếp theo
+            self._release()
+        else:
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, user_id, context=None):
+        loop = asyncio.get_running_loop()
+        try:
+            score = await loop.run_in_executor(None, self.score, user_id, context)
+        except Exception as e:
+            logger.warning(f"Không tính được điểm ưu tiên cho {user_id}: {e}")
+            score = 0
+        turn_class = classify_score(score)
+        start = self.clock()
+
+        future = self._acquire(score, loop)
+        if future is not None:
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        wait = self.clock() - start
+        if wait > 1:
+            logger.info(f"Lượt của {user_id} ({turn_class}, điểm {score}) chờ {wait:.1f}s")
+
+        try:
+            yield turn_class
+        finally:
+            self._release()
+            self.metrics[turn_class].record(wait, self.clock() - start)
+
+    def status(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "waiting": self.waiting(),
+            "classes": {name: window.snapshot() for name, window in self.metrics.items()},
+        }
+
+
+class SchedulerPool:
+    """Một TurnScheduler cho mỗi OA để lượng khách tăng đột biến ở một OA không chiếm slot của OA khác."""
+
+    def __init__(self, signals=None):
+        self.signals = signals or CustomerSignals()
+        self._schedulers = {}
+        self._lock = threading.Lock()
+
+    def get(self, oa_id=None):
+        from services.oa_registry import current_oa_id, oa_registry
+        oa_id = oa_id or current_oa_id()
+        scheduler = self._schedulers.get(oa_id)
+        if scheduler is None:
+            with self._lock:
+                scheduler = self._schedulers.get(oa_id)
+                if scheduler is None:
+                    scheduler = TurnScheduler(max_concurrency=oa_registry.max_concurrency(oa_id), signals=self.signals)
+                    self._schedulers[oa_id] = scheduler
+        return scheduler
+
+    def waiting(self):
+        return sum(scheduler.waiting() for scheduler in list(self._schedulers.values()))
+
+    def status(self):
+        return {oa_id: scheduler.status() for oa_id, scheduler in list(self._schedulers.items())}
+
+
+turn_schedulers = SchedulerPool()
@@ -0,0 +1,106 @@
+# Service for retrieving only the visa requirement/cost snippets relevant to a question
+from services.text_index import BM25Index, normalize_text
+
+# Tên hiển thị của các nhóm hồ sơ dạng key (data/visa_data.py); seed_visa_data.py dùng sẵn tên tiếng Việt
+CATEGORY_LABELS = {
+    "travel_docs": "Giấy tờ chuyến đi",
+    "financial_docs": "Giấy tờ tài chính",
+    "family_docs": "Giấy tờ gia đình",
+    "personal_docs": "Hồ sơ cá nhân",
+    "employment_docs": "Hồ sơ chứng minh công việc",
+}
+
+# Từ khách hay dùng khi hỏi về từng loại thông tin; chỉ dùng để tìm kiếm, không đưa vào prompt
+TOPIC_HINTS = {
+    "travel": "giấy tờ hồ sơ chuẩn bị hộ chiếu ảnh vé máy bay khách sạn lịch trình bảo hiểm",
+    "financial": "tài chính sao kê số dư tiết kiệm tài khoản ngân hàng thu nhập chứng minh tài sản sổ đỏ",
+    "family": "gia đình vợ chồng con trẻ em bố mẹ cha mẹ kết hôn khai sinh",
+    "personal": "cá nhân hộ chiếu căn cước cccd khai sinh",
+    "employment": "công việc công ty hợp đồng lao động nghỉ phép lương kinh doanh tự do",
+    "cost": "giá phí tiền chi phí nhập cảnh nhiều lần một lần thời hạn",
+    "cost_details": "bao gồm không bao gồm phí phát sinh phụ phí xử lý nhanh",
+    "process": "quy trình các bước bao lâu thời gian nộp hồ sơ kết quả",
+}
+
+# Từ có trong hầu hết câu hỏi visa, bỏ khỏi câu hỏi trước khi chấm điểm
+QUERY_STOPWORDS = set(normalize_text(
+    "visa thị thực anh chị em ạ ơi cho mình tôi cần muốn hỏi đi của và là có không gì nào thế nào với"
+).split())
+
+
+def _topic_of(category):
+    text = normalize_text(f"{category} {CATEGORY_LABELS.get(category, '')}")
+    for topic, words in (("financial", "tai chinh"), ("family", "gia dinh"), ("employment", "cong viec"),
+                         ("personal", "ca nhan")):
+        if words in text or topic in text:
+            return topic
+    return "travel"
+
+
+def build_chunks(visa):
+    """Chia bản ghi visa thành các đoạn: mỗi nhóm hồ sơ, các gói phí, phí bao gồm/không bao gồm, quy trình.
+
+    Trả về danh sách (văn bản đưa vào prompt, văn bản dùng để tìm kiếm).
+    """
+    chunks = []
+    requirements = visa.get("requirements")
+    if isinstance(requirements, dict):
+        for category, docs in requirements.items():
+            if docs:
+                label = CATEGORY_LABELS.get(category, category)
+                text = f"{label}: " + "; ".join(str(doc) for doc in docs)
+                chunks.append((text, f"{text} {TOPIC_HINTS[_topic_of(category)]}"))
+    elif isinstance(requirements, list) and requirements:
+        text = "Hồ sơ cần chuẩn bị: " + "; ".join(str(doc) for doc in requirements)
+        chunks.append((text, f"{text} {TOPIC_HINTS['travel']}"))
+
+    costs = visa.get("costs") if isinstance(visa.get("costs"), dict) else {}
+    options = [opt for opt in costs.get("options", []) if isinstance(opt, dict)]
+    if options:
+        text = "Các gói visa: " + "; ".join(
+            f"{opt.get('type', '')} - {opt.get('price', '')} USD, thời hạn {opt.get('duration', '')}" for opt in options
+        )
+        chunks.append((text, f"{text} {TOPIC_HINTS['cost']}"))
+    details = []
+    if costs.get("includes"):
+        details.append("Phí bao gồm: " + "; ".join(costs["includes"]))
+    if costs.get("excludes"):
+        details.append("Không bao gồm: " + "; ".join(costs["excludes"]))
+    if details:
+        text = ". ".join(details)
+        chunks.append((text, f"{text} {TOPIC_HINTS['cost_details']}"))
+
+    steps = [step for step in visa.get("process_steps", []) if isinstance(step, dict)]
+    if steps:
+        text = "Quy trình: " + " -> ".join(f"{step.get('name', '')} ({step.get('description', '')})" for step in steps)
+        chunks.append((text, f"{text} {TOPIC_HINTS['process']}"))
+    return chunks
+
+
+class VisaChunks:
+    """Chỉ mục BM25 trên các đoạn của một bản ghi visa."""
+
+    def __init__(self, visa):
+        chunks = build_chunks(visa)
+        self.texts = [text for text, _ in chunks]
+        self.index = BM25Index([search_text for _, search_text in chunks])
+        self._stopwords = QUERY_STOPWORDS | set(normalize_text(
+            " ".join([visa.get("country", "")] + list(visa.get("country_aliases", [])))
+        ).split())
+
+    def top(self, query, k=2, relative=0.5):
+        """Tối đa k đoạn liên quan nhất; bỏ đoạn có điểm dưới `relative` lần điểm của đoạn đầu."""
+        terms = [term for term in normalize_text(query).split() if term not in self._stopwords]
+        results = self.index.search(" ".join(terms), k)
+        if not results:
+            return []
+        best = results[0][1]
+        return [self.texts[index] for index, score, _ in results if score >= best * relative]
+
+
+def relevant_chunks(visa, query, k=2):
+    """Các đoạn thông tin visa liên quan tới câu hỏi (chỉ mục được tạo một lần cho mỗi bản ghi đã nạp)."""
+    chunks = visa.get("_chunks")
+    if chunks is None:
+        chunks = visa["_chunks"] = VisaChunks(visa)
+    return chunks.top(query, k)
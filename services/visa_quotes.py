@@ -0,0 +1,104 @@
+# Derived visa catalog fields (duration in days, VND price, customer quote range)
+import re
+
+# Nhóm quốc gia cao cấp: range ±15%
+PREMIUM_COUNTRIES = frozenset(['mỹ', 'anh quốc', 'canada', 'úc', 'new zealand'])
+
+# Nhóm Schengen: range ±10% (hẹp hơn vì giá đồng nhất)
+SCHENGEN_COUNTRIES = frozenset([
+    'đức (visa schengen)', 'ý (visa schengen)', 'pháp (visa schengen)',
+    'tây ban nha (visa schengen)', 'thụy sĩ (visa schengen)',
+    'thụy điển (visa schengen)', 'ch séc (visa schengen)',
+    'phần lan (visa schengen)', 'na uy (visa schengen)',
+    'hy lạp (visa schengen)', 'hà lan (visa schengen)',
+    'đan mạch (visa schengen)', 'bồ đào nha (visa schengen)',
+    'bỉ (visa schengen)', 'áo (visa schengen)'
+])
+
+# Hệ số khoảng giá báo khách theo nhóm quốc gia (nhóm khác: ±12%)
+QUOTE_MARGINS = {"premium": (0.85, 1.15), "schengen": (0.9, 1.1), "standard": (0.88, 1.12)}
+
+_NUMBER = re.compile(r'(\d+)')
+
+
+def duration_to_days(duration_str):
+    """Convert visa duration string to days."""
+    if not duration_str:
+        return 0
+    duration_str = duration_str.lower()
+    match = _NUMBER.search(duration_str)
+    if "ngày" in duration_str:
+        return int(match.group(1)) if match else 30
+    if "tháng" in duration_str:
+        return int(match.group(1)) * 30 if match else 90
+    if "năm" in duration_str:
+        return int(match.group(1)) * 365 if match else 365
+    return 90
+
+
+def region_class(country_name):
+    """Phân loại quốc gia: premium, schengen hoặc standard."""
+    country_name = (country_name or '').lower()
+    if country_name in PREMIUM_COUNTRIES:
+        return "premium"
+    if country_name in SCHENGEN_COUNTRIES:
+        return "schengen"
+    return "standard"
+
+
+def build_quote(price, region, rate):
+    """Tính giá VND và khoảng giá báo khách (triệu VND) cho một mức giá USD."""
+    price_vnd = int(price * rate)
+    price_million = price_vnd / 1000000
+    low_factor, high_factor = QUOTE_MARGINS[region]
+    range_low = round(price_million * low_factor, 1)
+    range_high = round(price_million * high_factor, 1)
+
+    # Điều chỉnh để range không quá rộng (tối đa chênh 2 triệu)
+    if range_high - range_low > 2:
+        range_high = range_low + 2
+
+    # Đảm bảo range hợp lý (ít nhất chênh 0.5 triệu)
+    if range_high - range_low < 0.5:
+        range_high = range_low + 0.5
+
+    return {"rate": rate, "price_vnd": price_vnd, "range_low": range_low, "range_high": range_high}
+
+
+def annotate_visa(visa, rate):
+    """Gắn các trường dẫn xuất vào bản ghi visa (gọi một lần khi nạp catalog)."""
+    options = visa.get("costs", {}).get("options", []) if isinstance(visa.get("costs"), dict) else []
+    option_days = []
+    for opt in options:
+        if isinstance(opt, dict):
+            opt["duration_days"] = duration_to_days(opt.get("duration", ""))
+            option_days.append(opt["duration_days"])
+    visa["max_duration_days"] = max(option_days, default=0)
+    visa["region_class"] = region_class(visa.get("country"))
+    update_quote(visa, rate)
+    return visa
+
+
+def update_quote(visa, rate):
+    """Tính lại phần phụ thuộc tỷ giá. Trả về False nếu quote hiện tại đã đúng tỷ giá."""
+    quote = visa.get("quote")
+    if quote and quote.get("rate") == rate:
+        return False
+    price = visa.get("price", 0)
+    region = visa.get("region_class") or region_class(visa.get("country"))
+    visa["quote"] = build_quote(price, region, rate) if price else None
+    return True
+
+
+def recompute_quotes(visa_data, rate):
+    """Cập nhật quote cho toàn bộ catalog {country: [visa, ...]} khi tỷ giá thay đổi.
+
+    Tỷ giá lấy từ Config.USD_VND_RATE lúc khởi động; khi đổi tỷ giá trong tiến trình đang chạy
+    thì gọi hàm này (cùng với cập nhật AIProcessor.usd_vnd_rate) bằng tay.
+    """
+    updated = 0
+    for visas in visa_data.values():
+        for visa in visas:
+            if update_quote(visa, rate):
+                updated += 1
+    return updated
@@ -5,6 +5,7 @@
 from bson import ObjectId
 from services.database import db
 from services.visa_repository import visa_repository
+from services.lead_writer import lead_writer
 from nltk import word_tokenize
 import re
 from fuzzywuzzy import process, fuzz
@@ -336,11 +337,12 @@ class VisaService:
                     "user_id": user_id,
                     "phone": phone_number,
                     "source": "zalo_chat",
+                    "service_type": "visa",
                     "query": user_query,
                     "status": "new_lead",
                     "created_at": datetime.now()
                 }
-                self.db.leads.insert_one(customer_data)
+                lead_writer.submit(customer_data)
                 
                 return {
                     "success": True,
@@ -3,41 +3,169 @@
 # Author: thuanpony03
 
 import os
+import asyncio
+import threading
+import time
 import aiohttp
 import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+LOCATION_MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "location_mapping.json")
+
+
+def load_prefetch_destinations(path=LOCATION_MAPPING_FILE):
+    """Danh sách điểm đến tour (thành phố trong location_mapping.json) cần làm nóng cache thời tiết"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return list(json.load(f).keys())
+    except Exception as e:
+        print(f"Error loading prefetch destinations: {e}")
+        return []
+
+
 class WeatherService:
-    def __init__(self):
+    """Lấy thời tiết từ OpenWeatherMap qua một ClientSession dùng chung, có cache TTL theo địa điểm.
+
+    Flask chạy mỗi async view trên một event loop riêng, nên session, các request đang
+    chờ (coalescing) và bộ prefetch chạy trên một event loop nền của service; caller
+    ở loop nào cũng await được kết quả.
+    """
+
+    def __init__(self, base_url=None, ttl=1800, prefetch_destinations=None):
         self.api_key = os.environ.get('WEATHER_API_KEY')
         if not self.api_key:
             print("Warning: WEATHER_API_KEY is not set in environment variables")
             self.api_key = "default_key"  # Fallback để tránh lỗi
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        self.base_url = base_url or os.environ.get(
+            'WEATHER_API_URL', "https://api.openweathermap.org/data/2.5/weather"
+        )
+        self.ttl = ttl
+        self.prefetch_destinations = prefetch_destinations
+        self._cache = {}  # {location_key: (weather_data, expires_at)}
+        self._inflight = {}  # {location_key: asyncio.Task} trên loop nền
+        self._session = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._prefetch_task = None
+
+    @staticmethod
+    def _key(location):
+        return " ".join(str(location).lower().split())
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="weather-service", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _run(self, coro):
+        """Chạy coroutine trên loop nền, trả về concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+
+    async def _fetch(self, key, location):
+        params = {
+            'q': location,
+            'appid': self.api_key,
+            'units': 'metric',
+            'lang': 'vi'
+        }
+        session = await self._get_session()
+        async with session.get(self.base_url, params=params) as response:
+            if response.status == 200:
+                weather_data = await response.json()
+                self._cache[key] = (weather_data, time.monotonic() + self.ttl)
+                return weather_data
+            print(f"Error fetching weather: {await response.text()}")
+            return None
+
+    async def _get_or_fetch(self, key, location, force=False):
+        """Chạy trên loop nền: các yêu cầu đồng thời cho cùng địa điểm dùng chung một request"""
+        if not force:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, location))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
         
     async def get_weather(self, location):
         """Lấy thông tin thời tiết cho một địa điểm"""
         try:
-            params = {
-                'q': location,
-                'appid': self.api_key,
-                'units': 'metric',
-                'lang': 'vi'
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.base_url, params=params) as response:
-                    if response.status == 200:
-                        weather_data = await response.json()
-                        return weather_data
-                    else:
-                        print(f"Error fetching weather: {await response.text()}")
-                        return None
+            key = self._key(location)
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            return await asyncio.wrap_future(self._run(self._get_or_fetch(key, location)))
         except Exception as e:
             print(f"Error in get_weather: {e}")
             return None
+
+    async def _prefetch_loop(self, destinations, interval):
+        while True:
+            results = await asyncio.gather(
+                *(self._get_or_fetch(self._key(d), d, force=True) for d in destinations),
+                return_exceptions=True
+            )
+            failed = sum(1 for r in results if r is None or isinstance(r, Exception))
+            if failed:
+                print(f"Weather prefetch: {failed}/{len(destinations)} destinations failed")
+            await asyncio.sleep(interval)
+
+    def start_prefetcher(self, destinations=None, interval=None):
+        """Làm mới định kỳ thời tiết các điểm đến tour trước khi cache hết hạn"""
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            return
+        destinations = destinations or self.prefetch_destinations or load_prefetch_destinations()
+        if not destinations:
+            return
+        interval = interval or self.ttl * 0.8
+
+        async def _start():
+            self._prefetch_task = asyncio.ensure_future(self._prefetch_loop(destinations, interval))
+
+        self._run(_start()).result()
+
+    def close(self, timeout=5):
+        """Dừng prefetch, đóng session và event loop nền"""
+        if self._loop is None:
+            return
+
+        async def _shutdown():
+            if self._prefetch_task is not None:
+                self._prefetch_task.cancel()
+            if self._session is not None:
+                await self._session.close()
+
+        try:
+            self._run(_shutdown()).result(timeout)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._session = None
+            self._prefetch_task = None
             
     def format_weather_message(self, weather_data):
         """Định dạng thông tin thời tiết thành tin nhắn văn bản"""
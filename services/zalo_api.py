@@ -2,35 +2,120 @@
 # Created: 2025-03-04 23:44:55
 # Author: thuanpony03
 
+import asyncio
+import functools
 import requests
 import json
 import hmac
 import hashlib
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from services.token_manager import INVALID_TOKEN_ERRORS
+
 load_dotenv()
 
+
+class RateLimiter:
+    """Token bucket: tối đa `rate` request/giây, cho phép dồn tối đa `burst` request."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Lấy một token (có thể âm) và trả về số giây phải chờ trước khi gửi."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        """Chờ (nếu cần) đến khi được gửi. Trả về số giây đã chờ."""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """Như acquire() nhưng chờ bằng asyncio.sleep, không chặn event loop."""
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
 class ZaloAPI:
-    def __init__(self):
-        self.app_id = os.environ.get('ZALO_APP_ID')
-        self.secret_key = os.environ.get('ZALO_APP_SECRET')
-        # self.access_token = os.environ.get('ZALO_ACCESS_TOKEN')
-        self.access_token = "6QuAGGQI4d8OgGrF0vSHSngl3Ki9Z7aKJFS5MJwJR6PPy6y41RK6Ea7A6M4vyLyYGxOa7LtoU4GYkcK2CCGFUosHTXjnz0aW29fsQtFbDZiZe2bUFVbW1dEd35KIdsGkSlupN0-VK68KsKOyHfmFMGNuSICMeIf3JE1H9m2EHcP9on0v2UjoN6IrR08VoYvGOfTFQnZE2rb1adOy6VLXSMBD93G4eZmEJEL4RmAh1mjanNbR5fazDblJ8bC3ZpzhGi1X6ms876KNttG3MP4YJZN9Jmbba21G2T1OB6kM9aSPzcm9ISqeMp2iJMP3mWiZ3fWM7Md2Q64kjIidG-bpQm6CELPok49lB84L86dUV6WvfXO8VE9YP1wLBIPLxLby7BzQ0WNVJKzrY00S3-03OrUzPp4KYGfiAWqk2WUD5d8"
+    def __init__(self, app_id=None, secret_key=None, access_token=None, rate_limit=None, token_manager=None):
+        self.app_id = app_id or os.environ.get('ZALO_APP_ID')
+        self.secret_key = secret_key or os.environ.get('ZALO_APP_SECRET')
+        # Có token_manager thì token được lấy (và làm mới) qua Redis dùng chung giữa các worker
+        self.token_manager = token_manager
+        self._access_token = access_token or os.environ.get('ZALO_ACCESS_TOKEN')
         # Change API version from v3.0 to v3
         self.base_url = "https://openapi.zalo.me/v3.0"
         
-        if not all([self.app_id, self.secret_key, self.access_token]):
+        if not all([self.app_id, self.secret_key]) or not (self._access_token or self.token_manager):
             raise ValueError("Missing required environment variables (ZALO_APP_ID, ZALO_APP_SECRET, ZALO_ACCESS_TOKEN)")
 
-    def verify_webhook(self, data, mac):
-        """Xác thực webhook từ Zalo"""
-        data_str = json.dumps(data, sort_keys=True)
-        hmac_obj = hmac.new(self.secret_key.encode(), data_str.encode(), hashlib.sha256)
-        calculated_mac = hmac_obj.hexdigest()
-        return calculated_mac == mac
+        self._webhook_hmac = hmac.new(self.secret_key.encode(), digestmod=hashlib.sha256)
+        # Giới hạn gửi riêng cho OA này để một OA đông khách không làm OA khác bị Zalo chặn
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    @property
+    def access_token(self):
+        if self.token_manager is None:
+            return self._access_token
+        try:
+            self._access_token = self.token_manager.get_token()
+        except Exception as e:
+            # Không lấy được token mới: gửi bằng token gần nhất, Zalo sẽ trả lỗi thay vì làm hỏng luồng xử lý
+            print(f"Error getting access token: {e}")
+        return self._access_token
+
+    def _renew_token(self, rejected_token):
+        """Zalo báo token không hợp lệ: làm mới một lần. Trả về True nếu nên gửi lại."""
+        if self.token_manager is None:
+            return False
+        try:
+            self._access_token = self.token_manager.invalidate(rejected_token)
+            return self._access_token != rejected_token
+        except Exception as e:
+            print(f"Error refreshing access token: {e}")
+            return False
+
+    def _throttle(self):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def verify_webhook(self, raw_body, mac):
+        """Xác thực webhook từ Zalo trên đúng các byte đã được ký (request.get_data())"""
+        if not mac:
+            return False
+        if isinstance(raw_body, str):
+            raw_body = raw_body.encode()
+        # Sao chép HMAC đã khởi tạo sẵn với secret key thay vì tạo lại key pad mỗi request
+        hmac_obj = self._webhook_hmac.copy()
+        hmac_obj.update(raw_body)
+        return hmac.compare_digest(hmac_obj.hexdigest(), mac)
+
+    async def send_text_message_async(self, user_id, message):
+        """Gửi tin nhắn từ code async: chờ rate limit bằng asyncio.sleep, gọi HTTP trên thread pool"""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.send_text_message, user_id, message, throttle=False)
+        )
 
-    def send_text_message(self, user_id, message):
+    def send_text_message(self, user_id, message, retry_on_invalid_token=True, throttle=True):
         """Gửi tin nhắn văn bản đến người dùng (sử dụng Message API v3)"""
         # The correct endpoint according to documentation
         url = f"{self.base_url}/oa/message/cs"
@@ -50,6 +135,8 @@ class ZaloAPI:
         }
         
         try:
+            if throttle:
+                self._throttle()
             print(f"Sending request to: {url}")
             print(f"With headers: {headers}")
             print(f"With data: {data}")
@@ -70,6 +157,9 @@ class ZaloAPI:
                     if json_response.get("error") == 0:
                         # Success case
                         return json_response
+                    elif (json_response.get("error") in INVALID_TOKEN_ERRORS and retry_on_invalid_token
+                          and self._renew_token(headers['access_token'])):
+                        return self.send_text_message(user_id, message, retry_on_invalid_token=False)
                     else:
                         # Error reported by Zalo
                         return {
@@ -107,6 +197,7 @@ class ZaloAPI:
         }
         
         try:
+            self._throttle()
             response = requests.post(url, headers=headers, json=data)
             if response.text:
                 try:
@@ -144,6 +235,7 @@ class ZaloAPI:
         }
         
         try:
+            self._throttle()
             response = requests.post(url, headers=headers, json=data)
             if response.text:
                 try:
@@ -214,6 +306,7 @@ class ZaloAPI:
         }
         
         try:
+            self._throttle()
             response = requests.post(url, headers=headers, json=data)
             return response.json() if response.status_code == 200 else {"error": response.status_code}
         except Exception as e:
@@ -3,7 +3,8 @@ import json
 import hmac
 import hashlib
 from app import app
-from unittest.mock import patch, MagicMock
+import time
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # tests/test_app.py
 
@@ -18,6 +19,16 @@ def mock_zalo_api():
     with patch('app.zalo_api') as mock:
         yield mock
 
+@pytest.fixture
+def mock_message_handler():
+    with patch('app.message_handler') as mock:
+        mock.process_message = AsyncMock(return_value=None)
+        yield mock
+
+def _now_ms():
+    """timestamp hiện tại (ms) như Zalo gửi; thiếu timestamp thì webhook bị coi là sự kiện cũ"""
+    return str(int(time.time() * 1000))
+
 def test_webhook_get(client):
     """Test GET request to webhook endpoint"""
     response = client.get('/webhook')
@@ -45,15 +56,22 @@ def test_webhook_post_invalid_signature(client, mock_zalo_api):
     assert response.status_code == 401
     assert response.json['error'] == "Invalid signature"
 
-def test_webhook_user_send_text(client, mock_zalo_api):
+def test_webhook_post_non_json_body_is_rejected(client, mock_zalo_api):
+    """Body không phải JSON object: trả 400 thay vì lỗi 500"""
+    response = client.post('/webhook', data="not json", content_type="text/plain")
+
+    assert response.status_code == 400
+    assert response.json['error'] == "Invalid JSON body"
+
+def test_webhook_user_send_text(client, mock_zalo_api, mock_message_handler):
     """Test handling user_send_text event"""
     mock_zalo_api.verify_webhook.return_value = True
-    mock_zalo_api.send_text_message.return_value = {"success": True}
     
     data = {
         "event_name": "user_send_text",
+        "timestamp": _now_ms(),
         "sender": {"id": "test_user"},
-        "message": {"text": "Hello"}
+        "message": {"text": "Hello", "msg_id": f"msg-{_now_ms()}"}
     }
     
     # Create valid signature
@@ -72,28 +90,34 @@ def test_webhook_user_send_text(client, mock_zalo_api):
                          json=data, 
                          headers=headers)
     
+    # Tin nhắn được đưa vào hàng đợi của MessageHandler, phản hồi gửi sau thời gian gộp tin
     assert response.status_code == 200
-    assert response.json['status'] == "success"
-    mock_zalo_api.send_text_message.assert_called_once()
+    assert response.json['status'] == "message_queued"
+    mock_zalo_api.send_typing_indicator.assert_called_once_with("test_user")
+    mock_message_handler.process_message.assert_awaited_once()
+    assert mock_message_handler.process_message.await_args[0][1] == "test_user"
 
 def test_webhook_user_follow(client, mock_zalo_api):
-    """Test handling user_follow event"""
+    """Test handling follow event"""
     mock_zalo_api.verify_webhook.return_value = True
+    mock_zalo_api.send_text_message.return_value = {"error": 0}
     
     data = {
-        "event_name": "user_follow",
+        "event_name": "follow",
+        "timestamp": _now_ms(),
         "follower": {"id": "test_user"}
     }
     
-    response = client.post('/webhook', json=data)
+    with patch('app.asyncio.sleep', new=AsyncMock()):
+        response = client.post('/webhook', json=data, headers={'X-ZaloOA-Signature': 'signature'})
     
     assert response.status_code == 200
     assert response.json['status'] == "success"
     
-    # Verify welcome message was sent
-    mock_zalo_api.send_text_message.assert_called_once()
-    called_args = mock_zalo_api.send_text_message.call_args[0]
-    assert "Xin chào!" in called_args[1]
+    # Verify welcome message was sent (lời chào gồm nhiều tin, tin đầu là câu chào)
+    first_call = mock_zalo_api.send_text_message.call_args_list[0][0]
+    assert first_call[0] == "test_user"
+    assert "Xin chào!" in first_call[1]
 
 def test_webhook_user_send_image(client, mock_zalo_api):
     """Test handling user_send_image event"""
@@ -101,10 +125,11 @@ def test_webhook_user_send_image(client, mock_zalo_api):
     
     data = {
         "event_name": "user_send_image",
+        "timestamp": _now_ms(),
         "sender": {"id": "test_user"}
     }
     
-    response = client.post('/webhook', json=data)
+    response = client.post('/webhook', json=data, headers={'X-ZaloOA-Signature': 'signature'})
     
     assert response.status_code == 200
     assert response.json['status'] == "success"
@@ -120,11 +145,33 @@ def test_webhook_unhandled_event(client, mock_zalo_api):
     
     data = {
         "event_name": "unknown_event",
+        "timestamp": _now_ms(),
         "sender": {"id": "test_user"}
     }
     
     response = client.post('/webhook',
-                         json=data)
+                         json=data,
+                         headers={'X-ZaloOA-Signature': 'signature'})
     
     assert response.status_code == 200 
-    assert response.json['status'] == "unhandled_event"
\ No newline at end of file
+    assert response.json['status'] == "unhandled_event"
+def test_asgi_lifespan_starts_and_stops_background_services():
+    """uvicorn app:asgi_app gửi lifespan.startup/shutdown: service nền phải được bật/tắt ở mỗi worker"""
+    import asyncio
+    from app import LifespanMiddleware
+
+    calls = []
+    asgi = LifespanMiddleware(None, on_startup=lambda: calls.append("startup"),
+                              on_shutdown=lambda: calls.append("shutdown"))
+    incoming = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi({"type": "lifespan"}, receive, send))
+    assert calls == ["startup", "shutdown"]
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark lưu context/history của một người dùng trong Redis:
+- Cũ: JSON text, lịch sử là list "User: ..."/"Bot: ..." phải tách tiền tố mỗi lượt
+- Mới: Turn + codec msgpack có version, nén zlib cho câu trả lời dài
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.conversation import Turn, decode_context, decode_history, encode_context, encode_history
+
+CONTEXT = {
+    "service_type": "visa", "country": "nhật bản", "days": 5, "pax": 4, "no_meal": False,
+    "phone": None, "reset": False, "special_request": None, "visa_type": "du lịch",
+    "last_visa_country": "nhật bản", "user_id": "4321567890123456789",
+}
+
+LONG_REPLY = ((
+    "Dạ, hồ sơ xin visa Nhật Bản du lịch tự túc gồm: hộ chiếu còn hạn trên 6 tháng, 2 ảnh 4.5x4.5 nền trắng, "
+    "tờ khai theo mẫu, bản sao CCCD, giấy xác nhận công việc hoặc đăng ký kinh doanh, sao kê tài khoản 3 tháng "
+    "gần nhất với số dư tối thiểu 100 triệu, lịch trình chi tiết và đặt phòng khách sạn. Thời gian xét duyệt "
+    "khoảng 5-7 ngày làm việc. Phí dịch vụ trọn gói khoảng 2-2.5 triệu VND ạ. "
+) * 2).strip()
+
+TURNS = [
+    ("user", "Chào em, chị muốn hỏi visa Nhật"),
+    ("bot", "Dạ em chào chị! Chị định đi Nhật mục đích du lịch hay thăm thân ạ?"),
+    ("user", "du lịch tự túc 4 người em"),
+    ("bot", LONG_REPLY),
+    ("user", "sao kê bao nhiêu là đủ em"),
+    ("bot", "Dạ, số dư khuyến nghị khoảng 100 triệu cho mỗi người ạ."),
+    ("user", "ok em, chi phí bao nhiêu"),
+    ("bot", "Dạ, phí dịch vụ trọn gói khoảng 2-2.5 triệu VND/người ạ."),
+    ("user", "để chị suy nghĩ thêm"),
+    ("bot", "Dạ vâng, chị cần hỗ trợ gì thêm cứ nhắn em nhé!"),
+]
+
+
+def old_encode(context, lines):
+    return json.dumps(context).encode("utf-8"), json.dumps(lines).encode("utf-8")
+
+
+def old_decode(context_data, history_data):
+    context = json.loads(context_data or '{}')
+    history = []
+    for msg in json.loads(history_data or '[]'):
+        if msg.startswith("User:"):
+            history.append({"sender": "user", "message": msg[5:].strip()})
+        elif msg.startswith("Bot:"):
+            history.append({"sender": "bot", "message": msg[4:].strip()})
+    return context, history
+
+
+def new_encode(context, turns):
+    return encode_context(context), encode_history(turns)
+
+
+def new_decode(context_data, history_data):
+    return decode_context(context_data), decode_history(history_data)
+
+
+def main(number=20000):
+    lines = [f"{'User' if role == 'user' else 'Bot'}: {text}" for role, text in TURNS]
+    turns = [Turn(role, text, ts=1760000000 + i * 30, intent="visa") for i, (role, text) in enumerate(TURNS)]
+
+    old_data = old_encode(CONTEXT, lines)
+    new_data = new_encode(CONTEXT, turns)
+    assert new_decode(*new_data)[0] == CONTEXT
+    assert [t.text for t in new_decode(*new_data)[1]] == [m["message"] for m in old_decode(*old_data)[1]]
+
+    print(f"{len(TURNS)} lượt hội thoại, {number} lần")
+    print(f"Bytes/người dùng (context + history): cũ {sum(map(len, old_data))}, mới {sum(map(len, new_data))}")
+    for label, func, args in (
+        ("encode cũ (json)", old_encode, (CONTEXT, lines)),
+        ("encode mới (msgpack)", new_encode, (CONTEXT, turns)),
+        ("decode cũ (json + tách tiền tố)", old_decode, old_data),
+        ("decode mới (msgpack)", new_decode, new_data),
+    ):
+        elapsed = timeit.timeit(lambda: func(*args), number=number)
+        print(f"{label:<34}{elapsed / number * 1e6:>8.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
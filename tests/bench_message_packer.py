@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark số tin nhắn gửi đi cho mỗi câu trả lời:
+- Cũ: _split_message ghép từng dòng theo giới hạn cứng 160 (dòng dài hơn thành một tin quá khổ)
+- Mới: message_packer.pack_message (câu/từ/grapheme, số tin tối thiểu) ở cùng giới hạn 160
+  và ở giới hạn thật của kênh Zalo
+
+Dùng corpus mặc định bên dưới, hoặc truyền file JSON lines (mỗi dòng một câu trả lời đã gửi).
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from services.message_packer import CHANNEL_LIMITS, pack_message
+
+SEND_DELAY = 0.8  # giây chờ giữa hai tin nhắn (_send_multi_part_response)
+
+CORPUS = [
+    "Dạ, visa Nhật Bản du lịch tự túc cần hộ chiếu còn hạn trên 6 tháng, 2 ảnh 4.5x4.5 nền trắng, tờ khai theo mẫu, "
+    "bản sao CCCD, xác nhận công việc và sao kê tài khoản 3 tháng gần nhất. Thời gian xét duyệt khoảng 5-7 ngày làm "
+    "việc. Phí dịch vụ trọn gói khoảng 2-2.5 triệu VND ạ. Anh/chị để lại số điện thoại để tư vấn viên hỗ trợ chi tiết nhé!",
+    "📋 Báo giá tour Nhật Bản 4 người 5 ngày:\n"
+    "- Giá: 360 USD/ngày\n"
+    "- Tài xế + HDV tiếng Việt\n"
+    "- Tổng chi phí: 1800 USD\n\n"
+    "✅ Bao gồm: xe đưa đón, hướng dẫn viên, phí cầu đường, bữa trưa.\n"
+    "❌ Không bao gồm: vé máy bay, khách sạn, vé tham quan.\n\n"
+    "Anh/chị muốn em giữ chỗ luôn không ạ? Để lại số điện thoại để em gửi lịch trình chi tiết nhé!",
+    "Dạ em chào anh/chị! Passport Lounge hỗ trợ visa và tour riêng cho gia đình, nhóm bạn. Anh/chị đang quan tâm "
+    "visa nước nào hay tour đi đâu ạ?",
+    "Về visa Úc, hồ sơ diện du lịch gồm hộ chiếu, ảnh, sổ hộ khẩu, giấy tờ chứng minh công việc và tài chính. "
+    "Visa Úc nộp online, có kết quả trong khoảng 15-30 ngày. Nếu có lịch sử du lịch Nhật, Hàn, Schengen thì tỷ lệ "
+    "đậu cao hơn. Phí dịch vụ khoảng 3-4 triệu VND, chưa gồm phí lãnh sự ạ.",
+    "Dạ tour Hàn Quốc mùa thu (tháng 10-11) rất đẹp ạ!\n"
+    "Lịch trình gợi ý 5 ngày: Seoul - Nami - Everland - Busan.\n"
+    "Giá tham khảo cho 6 người: 330 USD/ngày (xe + HDV).\n"
+    "Anh/chị đi bao nhiêu người và dự kiến khởi hành ngày nào ạ?",
+    "Dạ, nếu anh/chị tự làm thì cần chuẩn bị kỹ phần chứng minh tài chính, đặc biệt là sổ tiết kiệm và sao kê "
+    "lương. Bên em có gói kiểm tra hồ sơ miễn phí: anh/chị gửi ảnh chụp giấy tờ qua Zalo, chuyên viên sẽ phản hồi "
+    "trong vòng 2 giờ làm việc ạ.",
+]
+
+
+def old_split(message, limit=160):
+    if len(message) <= limit:
+        return [message]
+    messages = []
+    current_message = ""
+    for line in message.split('\n'):
+        if len(current_message) + len(line) + 1 > limit:
+            if current_message:
+                messages.append(current_message.strip())
+            current_message = line
+        else:
+            current_message += f"\n{line}" if current_message else line
+    if current_message:
+        messages.append(current_message.strip())
+    return messages
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(path=None, number=200):
+    corpus = load_corpus(path) if path else CORPUS
+    results = {}
+    runs = (
+        ("old (160)", lambda text: old_split(text, 160), 160),
+        ("new (160)", lambda text: pack_message(text, 160), 160),
+        (f"new ({CHANNEL_LIMITS['zalo']})", lambda text: pack_message(text, channel="zalo"), CHANNEL_LIMITS["zalo"]),
+    )
+    for name, split, limit in runs:
+        counts = [len(split(text)) for text in corpus]
+        oversized = sum(len(part) > limit for text in corpus for part in split(text))
+        seconds = timeit.timeit(lambda: [split(text) for text in corpus], number=number)
+        results[name] = counts
+        sends = sum(counts) / len(corpus)
+        print(f"{name}: {sends:.2f} tin/câu trả lời, {oversized} tin vượt giới hạn, "
+              f"chờ {(sends - 1) * SEND_DELAY:.2f}s/câu trả lời, "
+              f"chia {seconds / (number * len(corpus)) * 1e6:.1f} µs/câu trả lời")
+    return results
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark chi phí CPU xác thực chữ ký webhook:
+- Cũ: parse JSON -> json.dumps(sort_keys=True) -> hmac.new(secret) -> so sánh ==
+- Mới: HMAC dựng sẵn .copy() trên raw body -> hmac.compare_digest
+"""
+import hashlib
+import hmac
+import json
+import timeit
+
+SECRET = "zalo-oa-secret-key-for-benchmark"
+
+SAMPLE_BODY = json.dumps({
+    "app_id": "1234567890",
+    "user_id_by_app": "5566778899",
+    "event_name": "user_send_text",
+    "timestamp": "1741106695000",
+    "sender": {"id": "3273615087242629962"},
+    "recipient": {"id": "579745863508352884"},
+    "message": {
+        "msg_id": "This is message id",
+        "text": "Em ơi cho chị hỏi giá visa Nhật Bản cho 2 người đi du lịch tháng 4 với ạ"
+    }
+}, ensure_ascii=False).encode()
+
+
+def old_verify(raw_body, mac):
+    data = json.loads(raw_body)
+    data_str = json.dumps(data, sort_keys=True)
+    calculated = hmac.new(SECRET.encode(), data_str.encode(), hashlib.sha256).hexdigest()
+    return calculated == mac
+
+
+_BASE = hmac.new(SECRET.encode(), digestmod=hashlib.sha256)
+
+
+def new_verify(raw_body, mac):
+    hmac_obj = _BASE.copy()
+    hmac_obj.update(raw_body)
+    return hmac.compare_digest(hmac_obj.hexdigest(), mac)
+
+
+def main(number=100000):
+    mac = hmac.new(SECRET.encode(), SAMPLE_BODY, hashlib.sha256).hexdigest()
+    assert new_verify(SAMPLE_BODY, mac)
+
+    old_time = timeit.timeit(lambda: old_verify(SAMPLE_BODY, mac), number=number)
+    new_time = timeit.timeit(lambda: new_verify(SAMPLE_BODY, mac), number=number)
+
+    old_us = old_time / number * 1e6
+    new_us = new_time / number * 1e6
+    print(f"Body size: {len(SAMPLE_BODY)} bytes, {number} iterations")
+    print(f"Cũ (parse + re-serialize + hmac.new): {old_us:.2f} µs/webhook")
+    print(f"Mới (raw bytes + cached HMAC):        {new_us:.2f} µs/webhook")
+    print(f"Tiết kiệm: {old_us - new_us:.2f} µs/webhook ({old_us / new_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
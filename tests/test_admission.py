@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from services.admission import AdmissionController, template_answer
+from services.visa_quotes import annotate_visa
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeAIProcessor:
+    """Chỉ có catalog visa và nhận diện quốc gia bằng từ khóa."""
+
+    usd_vnd_rate = 25000
+
+    def __init__(self):
+        visa = annotate_visa({"country": "Nhật Bản", "price": 80, "visa_type": "Du lịch",
+                              "processing_time": "5-7 ngày"}, self.usd_vnd_rate)
+        self.visa_data = {"nhật bản": [visa]}
+
+    def _extract_country_from_query(self, query):
+        return "nhật bản" if "nhật" in query.lower() else None
+
+    def _select_best_visa(self, country, context):
+        return self.visa_data[country][0]
+
+
+class FakeTourProcessor:
+    def _calculate_tour_price(self, country, pax, days, no_meal):
+        return {"total_price": 100 * pax * days, "total_price_per_pax": 100 * days, "days": days, "pax": pax}
+
+    def _build_price_response(self, price_info, context):
+        return f"tour {context['country']} {price_info['pax']} người {price_info['days']} ngày: {price_info['total_price']} USD"
+
+
+def test_levels_follow_backlog():
+    backlog = [0]
+    controller = AdmissionController(backlog=lambda: backlog[0], degrade_backlog=4, shed_backlog=12)
+
+    assert controller.admit() == "normal"
+    backlog[0] = 5
+    assert controller.admit() == "degraded"
+    backlog[0] = 12
+    assert controller.admit() == "shed"
+    backlog[0] = 0
+    assert controller.admit() == "normal"
+    assert controller.status()["turns_by_level"] == {"normal": 2, "degraded": 1, "shed": 1}
+
+
+def test_levels_follow_oldest_turn_age():
+    clock = FakeClock()
+    controller = AdmissionController(backlog=lambda: 0, degrade_backlog=4, shed_backlog=12,
+                                     degrade_age=15, shed_age=40, clock=clock)
+
+    with controller.track():
+        clock.now += 20
+        assert controller.admit() == "degraded"
+        clock.now += 30
+        assert controller.admit() == "shed"
+    assert controller.admit() == "normal"
+
+
+def test_template_answers():
+    ai, tour = FakeAIProcessor(), FakeTourProcessor()
+
+    visa = template_answer("visa", "visa nhật bao nhiêu", {}, ai, tour)
+    assert "1.8-2.3 triệu" in visa and "5-7 ngày" in visa
+
+    assert template_answer("tour", "tour nhật 4 người 5 ngày", {}, ai, tour) == "tour nhật bản 4 người 5 ngày: 2000 USD"
+    assert template_answer("tour", "tour nhật", {"pax": 2}, ai, tour) is None
+    assert template_answer("visa", "visa mỹ", {}, ai, tour) is None
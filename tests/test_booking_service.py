@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from bson import ObjectId
+
+import services.booking_service as booking_module
+from services.booking_service import BookingService, ServiceNameCache
+
+
+class FakeCollection:
+    """Collection giả: find_one/find/aggregate trả về dữ liệu dựng sẵn và ghi lại lời gọi."""
+
+    def __init__(self, docs=(), aggregate_result=()):
+        self.docs = list(docs)
+        self.aggregate_result = list(aggregate_result)
+        self.calls = []
+
+    def find_one(self, query, projection=None):
+        self.calls.append(("find_one", query))
+        return next((doc for doc in self.docs if doc["_id"] == query["_id"]), None)
+
+    def find(self, query, projection=None):
+        self.calls.append(("find", query))
+        return [doc for doc in self.docs if doc["_id"] in query["_id"]["$in"]]
+
+    def aggregate(self, pipeline):
+        self.calls.append(("aggregate", pipeline))
+        return iter(self.aggregate_result)
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+
+def test_service_name_cache_is_bounded_lru_with_ttl():
+    cache = ServiceNameCache(max_size=2, ttl=60)
+    cache.set(("tour", 1), "Tour 1")
+    cache.set(("tour", 2), "Tour 2")
+    assert cache.get(("tour", 1)) == "Tour 1"  # tour 1 vừa dùng, tour 2 bị đẩy ra trước
+    cache.set(("tour", 3), "Tour 3")
+    assert len(cache) == 2
+    assert cache.get(("tour", 2)) is None
+    assert cache.get(("tour", 1)) == "Tour 1"
+
+    expired = ServiceNameCache(ttl=0.01)
+    expired.set(("visa", 1), "Visa Nhật")
+    time.sleep(0.02)
+    assert expired.get(("visa", 1)) is None
+
+
+def test_details_pipeline_guards_each_lookup_by_service_type():
+    booking_id = ObjectId()
+    pipeline = BookingService()._booking_details_pipeline(booking_id)
+    assert pipeline[0] == {"$match": {"_id": booking_id}}
+    lookups = {stage["$lookup"]["from"]: stage["$lookup"] for stage in pipeline if "$lookup" in stage}
+    assert sorted(lookups) == ["flights", "tours", "visas"]
+    guard = lookups["visas"]["pipeline"][0]["$match"]["$expr"]["$and"]
+    assert {"$eq": ["$$stype", "visa"]} in guard
+
+    # Biết trước loại dịch vụ: vẫn một aggregate nhưng chỉ $lookup đúng collection đó
+    narrowed = BookingService()._booking_details_pipeline(booking_id, "visa")
+    assert narrowed[0] == {"$match": {"_id": booking_id, "service_type": "visa"}}
+    assert [stage["$lookup"]["from"] for stage in narrowed if "$lookup" in stage] == ["visas"]
+
+
+def test_booking_without_service_type_is_returned_without_details(monkeypatch):
+    booking_id = ObjectId()
+    bookings = FakeCollection(aggregate_result=[{"_id": booking_id, "status": "pending",
+                                                 "_tour_details": [], "_visa_details": [], "_flight_details": []}])
+    monkeypatch.setattr(booking_module, "db", FakeDB(bookings=bookings))
+
+    result = BookingService().get_booking_details(str(booking_id))
+
+    assert result["success"] is True
+    assert result["booking"] == {"_id": booking_id, "status": "pending"}
+    assert result["service_details"] is None
+    assert [call[0] for call in bookings.calls] == ["aggregate"]
+
+
+def test_booking_details_cache_the_service_name(monkeypatch):
+    booking_id, tour_id = ObjectId(), ObjectId()
+    booking = {"_id": booking_id, "service_type": "tour", "service_id": tour_id}
+    bookings = FakeCollection(
+        docs=[booking],
+        aggregate_result=[dict(booking, _tour_details=[{"_id": tour_id, "name": "Tour Nhật 5N4Đ"}],
+                               _visa_details=[], _flight_details=[])]
+    )
+    tours = FakeCollection()
+    monkeypatch.setattr(booking_module, "db", FakeDB(bookings=bookings, tours=tours))
+    monkeypatch.setattr(booking_module, "_service_name_cache", ServiceNameCache())
+    service = BookingService()
+
+    result = service.get_booking_details(str(booking_id))
+    assert result["service_details"]["name"] == "Tour Nhật 5N4Đ"
+    assert "_tour_details" not in result["booking"]
+    # Một round trip duy nhất, không find_one đọc service_type trước
+    assert [call[0] for call in bookings.calls] == ["aggregate"]
+
+    # Tên đã có trong cache: danh sách booking không truy vấn collection tours
+    listed = service._resolve_service_names([dict(booking)])
+    assert listed[0]["service_name"] == "Tour Nhật 5N4Đ"
+    assert tours.calls == []
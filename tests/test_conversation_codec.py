@@ -0,0 +1,40 @@
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.conversation import (
+    COMPRESS_THRESHOLD, Turn, decode_context, decode_history, encode_context, encode_history,
+)
+
+
+def test_history_round_trip():
+    turns = [Turn.user("visa nhật bao nhiêu?", intent="visa"), Turn.bot("Dạ, visa Nhật khoảng 2 triệu ạ")]
+
+    assert decode_history(encode_history(turns)) == turns
+
+
+def test_long_replies_are_compressed():
+    reply = "Dạ, hồ sơ visa Nhật gồm hộ chiếu, ảnh 4.5x4.5, sao kê 3 tháng gần nhất. " * 20
+    encoded = encode_history([Turn.bot(reply)])
+
+    assert len(reply.encode("utf-8")) > COMPRESS_THRESHOLD
+    assert len(encoded) < len(reply.encode("utf-8")) // 4
+    assert decode_history(encoded)[0].text == reply
+
+
+def test_legacy_json_is_still_readable():
+    legacy_history = json.dumps(["User: tour thái lan", "Bot: Dạ, mấy người ạ?"]).encode("utf-8")
+    legacy_context = json.dumps({"country": "thái lan", "pax": 2})
+
+    assert [(t.role, t.text) for t in decode_history(legacy_history)] == [
+        ("user", "tour thái lan"), ("bot", "Dạ, mấy người ạ?"),
+    ]
+    assert decode_context(legacy_context) == {"country": "thái lan", "pax": 2}
+
+
+def test_context_round_trip():
+    context = {"country": "hàn quốc", "days": 5, "no_meal": False, "phone": None}
+
+    assert decode_context(encode_context(context)) == context
+    assert decode_context(None) == {}
@@ -0,0 +1,205 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.conversation import Turn
+from services.conversation_store import ConversationStore
+
+
+class MemoryRedis:
+    """Redis tối giản cho ConversationStore: chuỗi có TTL, một zset và pipeline chạy tuần tự."""
+
+    def __init__(self):
+        self.store = {}
+        self.ttls = {}
+        self.zset = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def mget(self, *keys):
+        return [self.store.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        self.ttls[key] = ex
+        return True
+
+    def expire(self, key, ttl):
+        if key in self.store:
+            self.ttls[key] = ttl
+
+    def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+            self.ttls.pop(key, None)
+
+    def ttl(self, key):
+        if key not in self.store:
+            return -2
+        return -1 if self.ttls.get(key) is None else self.ttls[key]
+
+    def scan_iter(self, match=None, count=None):
+        prefix = match.rstrip("*")
+        return iter([key for key in list(self.store) if key.startswith(prefix)])
+
+    def zadd(self, name, mapping, nx=False):
+        for member, score in mapping.items():
+            if not (nx and member in self.zset):
+                self.zset[member] = score
+
+    def zscore(self, name, member):
+        return self.zset.get(member)
+
+    def zrangebyscore(self, name, low, high, start=0, num=None, withscores=False):
+        members = sorted((score, member) for member, score in self.zset.items() if score <= high)
+        return [(member, score) for score, member in members[start:start + num]]
+
+    def register_script(self, source):
+        def release(keys, args):
+            last_seen, context_key, history_key = keys
+            user_id, cutoff = args
+            score = self.zset.get(user_id)
+            if score is not None and score <= cutoff:
+                self.delete(context_key, history_key)
+                del self.zset[user_id]
+                return 1
+            return 0
+        return release
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+
+class Pipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis_client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class MemoryCollection:
+    """Collection Mongo tối giản: find_one/delete_one/delete_many theo _id và bulk_write ReplaceOne."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def delete_one(self, query):
+        self.docs.pop(query["_id"], None)
+
+    def delete_many(self, query):
+        for doc_id in query["_id"]["$in"]:
+            if self.docs.get(doc_id, {}).get("archived_at") == query["archived_at"]:
+                del self.docs[doc_id]
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            self.docs[op._filter["_id"]] = dict(op._doc, _id=op._filter["_id"])
+
+
+def make_store(redis_client=None, archive=None):
+    archive = archive if archive is not None else MemoryCollection()
+    return ConversationStore(redis_client or MemoryRedis(), ttl=3600, idle_after=60,
+                             archive_collection=lambda: archive), archive
+
+
+def test_writes_refresh_ttl_on_both_keys():
+    redis_client = MemoryRedis()
+    store, _ = make_store(redis_client)
+    store.set_history("u1", [Turn.user("chào")])
+    redis_client.ttls["history:u1"] = 5
+
+    store.set_context("u1", {"country": "nhật bản"})
+
+    assert redis_client.ttls == {"context:u1": 3600, "history:u1": 3600}
+    assert "u1" in redis_client.zset
+
+
+def test_history_keeps_last_entries():
+    store, _ = make_store()
+    turns = [Turn.user("a", intent="tour"), Turn.bot("b"), Turn.user("c"), Turn.bot("d")]
+    store.set_history("u1", turns)
+    store.append_history("u1", Turn.bot("e"), keep=3)
+
+    assert [turn.text for turn in store.get_history("u1")] == ["c", "d", "e"]
+
+
+def test_idle_conversation_is_archived_and_rehydrated():
+    redis_client = MemoryRedis()
+    store, archive = make_store(redis_client)
+    store.set_context("u1", {"country": "hàn quốc"})
+    store.append_history("u1", Turn.user("visa hàn", intent="visa"))
+    store.set_context("u2", {"country": "mỹ"})
+    redis_client.zset["u1"] -= 120
+
+    assert store.archive_idle() == 1
+    assert "context:u1" not in redis_client.store and "u1" not in redis_client.zset
+    assert "context:u2" in redis_client.store
+
+    assert store.get_context("u1") == {"country": "hàn quốc"}
+    assert [(t.role, t.text, t.intent) for t in store.get_history("u1")] == [("user", "visa hàn", "visa")]
+    assert redis_client.ttls["context:u1"] == 3600
+    assert archive.docs == {}
+
+
+def test_new_user_checks_archive_once():
+    lookups = []
+    archive = MemoryCollection()
+    archive.find_one = lambda query: lookups.append(query) or None
+    store, _ = make_store(archive=archive)
+
+    assert store.get_context("new") == {}
+    assert store.get_history("new") == []
+    assert len(lookups) == 1
+
+
+def test_user_returning_during_archive_leaves_no_stale_copy():
+    redis_client = MemoryRedis()
+    store, archive = make_store(redis_client)
+    store.set_context("u1", {"country": "hàn quốc"})
+    store.set_context("u2", {"country": "mỹ"})
+    redis_client.zset["u1"] -= 120
+    redis_client.zset["u2"] -= 120
+
+    write = archive.bulk_write
+
+    def bulk_write_then_u1_returns(operations, ordered=True):
+        write(operations, ordered)
+        store.set_context("u1", {"country": "nhật bản"})
+
+    archive.bulk_write = bulk_write_then_u1_returns
+
+    assert store.archive_idle() == 1
+    assert list(archive.docs) == ["u2"]
+    assert store.get_context("u1") == {"country": "nhật bản"}
+
+
+def test_backfill_tracks_keys_written_without_ttl():
+    redis_client = MemoryRedis()
+    store, _ = make_store(redis_client)
+    # Khóa cũ ghi bằng SET thường: không TTL, không có trong last_seen
+    redis_client.set("context:old", b"{}")
+    redis_client.set("history:old", b"[]")
+    store.set_context("u1", {"country": "mỹ"})
+    seen_u1 = redis_client.zset["u1"]
+
+    assert store.backfill_untracked(now=1000.0) == 2
+    assert redis_client.ttls["context:old"] == 3600 and redis_client.ttls["history:old"] == 3600
+    assert redis_client.zset["old"] == 1000.0
+    assert redis_client.zset["u1"] == seen_u1
+    # Chạy lại không còn gì để sửa; archiver giờ thấy hội thoại cũ
+    assert store.backfill_untracked() == 0
+    assert store.archive_idle(now=1000.0 + 120) == 1
+    assert "context:old" not in redis_client.store
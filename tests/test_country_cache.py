@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.country_cache import CountryCache, normalize_country_query
+
+
+class DictRedis:
+    """Redis tối giản chỉ hỗ trợ GET/SETEX."""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+def test_normalized_phrasings_share_one_entry():
+    assert normalize_country_query("Cho em hỏi giá ?") == normalize_country_query("cho em  hỏi giá")
+
+
+def test_none_answers_are_cached():
+    cache = CountryCache(DictRedis())
+    cache.set("ok cảm ơn", None)
+
+    assert cache.get("OK, cảm ơn!") == (True, None)
+    assert cache.get("visa nhật") == (False, None)
+
+
+def test_results_are_shared_between_workers():
+    redis_client = DictRedis()
+    CountryCache(redis_client).set("đi sing", "singapore")
+
+    assert CountryCache(redis_client).get("đi sing") == (True, "singapore")
+
+
+def test_seed_from_log_lines():
+    cache = CountryCache(None)
+    lines = [
+        "2025-03-01 10:00:00 - INFO - AI nhận diện quốc gia từ 'cho em hỏi giá': 'none'",
+        "2025-03-01 10:00:01 - INFO - AI nhận diện quốc gia từ 'visa xứ sở kim chi': 'hàn quốc'",
+        "2025-03-01 10:00:02 - INFO - Đang xử lý query: 'abc'",
+    ]
+
+    assert cache.seed_from_log(lines) == 2
+    assert cache.get("cho em hỏi giá") == (True, None)
+    assert cache.get("visa xứ sở kim chi") == (True, "hàn quốc")
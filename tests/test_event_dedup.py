@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.event_dedup import EventDeduplicator, LocalEventCache
+
+
+class SetNxRedis:
+    """Redis tối giản chỉ hỗ trợ SET NX EX, đếm số round trip."""
+
+    def __init__(self):
+        self.store = {}
+        self.calls = 0
+
+    def set(self, key, value, nx=False, ex=None):
+        self.calls += 1
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+
+def test_duplicate_rejected_locally_without_redis_round_trip():
+    redis_client = SetNxRedis()
+    dedup = EventDeduplicator(redis_client, ttl=300)
+
+    assert dedup.claim("text:1") is True
+    assert dedup.claim("text:1") is False
+    assert redis_client.calls == 1
+
+
+def test_second_worker_loses_atomic_claim():
+    redis_client = SetNxRedis()
+    worker_a = EventDeduplicator(redis_client, ttl=300)
+    worker_b = EventDeduplicator(redis_client, ttl=300)
+
+    assert worker_a.claim("text:2") is True
+    assert worker_b.claim("text:2") is False
+
+
+def test_local_only_when_redis_unavailable():
+    dedup = EventDeduplicator(None, ttl=300)
+
+    assert dedup.claim("follow:1") is True
+    assert dedup.claim("follow:1") is False
+
+
+def test_local_cache_evicts_oldest_entries():
+    cache = LocalEventCache(max_size=2, ttl=300)
+    cache.add("a")
+    cache.add("b")
+    cache.add("c")
+
+    assert not cache.seen("a")
+    assert cache.seen("b")
+    assert cache.seen("c")
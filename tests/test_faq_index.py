@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.faq_index import FAQIndex
+from services.text_index import BM25Index, normalize_text
+
+FAQS = [
+    {"question": "Làm hộ chiếu mới mất bao lâu?", "answer": "Khoảng 7-10 ngày làm việc."},
+    {"question": "Chính sách hoàn hủy tour như thế nào?", "answer": "Hủy trước 30 ngày hoàn 90%."},
+    {"question": "Các hình thức thanh toán cho tour du lịch?", "answer": "Tiền mặt, chuyển khoản, thẻ."},
+    {"question": "Tôi có thể đổi ngoại tệ ở đâu?", "answer": "Ngân hàng hoặc điểm thu đổi được cấp phép."},
+]
+
+
+def test_normalize_text_folds_accents_and_punctuation():
+    assert normalize_text("Làm Hộ chiếu, ĐỔI tiền?") == "lam ho chieu doi tien"
+
+
+def test_bm25_ranks_matching_question_first_with_or_without_accents():
+    index = BM25Index([faq["question"] for faq in FAQS])
+    for query in ("làm hộ chiếu mới mất bao lâu vậy em", "lam ho chieu mat bao lau"):
+        top = index.search(query, k=2)
+        assert top[0][0] == 0
+        assert top[0][2] > 0.6
+        assert all(confidence < 0.6 for _, _, confidence in top[1:])
+    assert index.search("xyz abc") == []
+
+
+def test_faq_index_answers_confident_matches_and_returns_snippets_otherwise():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return FAQS
+
+    faq_index = FAQIndex(loader=loader)
+    assert faq_index.answer("có thể đổi ngoại tệ ở đâu") == "Ngân hàng hoặc điểm thu đổi được cấp phép."
+    # Chỉ nhắc tới hộ chiếu: chưa đủ chắc để trả lời thẳng nhưng vẫn là tài liệu cho prompt
+    assert faq_index.answer("hộ chiếu") is None
+    assert faq_index.snippets("hộ chiếu") == ["Hỏi: Làm hộ chiếu mới mất bao lâu?\nĐáp: Khoảng 7-10 ngày làm việc."]
+    assert faq_index.answer("giá tour nhật 4 người 5 ngày") is None
+    assert len(calls) == 1
+
+
+def test_faq_index_survives_loader_failure():
+    def loader():
+        raise RuntimeError("mongo down")
+
+    faq_index = FAQIndex(loader=loader)
+    assert faq_index.answer("đổi ngoại tệ ở đâu") is None
+    assert faq_index.snippets("đổi ngoại tệ ở đâu") == []
@@ -0,0 +1,87 @@
+import os
+import re
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import services.flight_service as flight_module
+from services.flight_service import (FlightPage, FlightService, backfill_route_keys, normalize_place,
+                                     parse_departure_date, with_route_keys)
+
+
+class FakeFlights:
+    """Collection flights giả: ghi lại các lệnh ghi."""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+        self.writes = []
+
+    def insert_many(self, documents):
+        self.writes.extend(documents)
+        return type("Result", (), {"inserted_ids": [i for i, _ in enumerate(documents)]})()
+
+    def update_one(self, query, update):
+        self.writes.append(update["$set"])
+        return type("Result", (), {"modified_count": 1})()
+
+    def find(self, query, projection=None):
+        return iter(self.docs)
+
+    def bulk_write(self, operations, ordered=True):
+        self.writes.extend(op._doc["$set"] for op in operations)
+        return type("Result", (), {"modified_count": len(operations)})()
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+
+def _matches(place_query, stored_name):
+    return re.match(place_query["$regex"], normalize_place(stored_name)) is not None
+
+
+def test_parse_departure_date_rolls_over_month_and_year_end():
+    assert parse_departure_date("31/01/2024") == (datetime(2024, 1, 31), datetime(2024, 2, 1))
+    assert parse_departure_date("2024-02-29") == (datetime(2024, 2, 29), datetime(2024, 3, 1))
+    assert parse_departure_date("31/12/2024")[1] == datetime(2025, 1, 1)
+    assert parse_departure_date("32/01/2024") is None
+
+
+def test_route_filter_keeps_prefix_matching():
+    search_filter = FlightService()._build_filter("Hà Nội", "Hồ Chí Minh", "31/03/2024")
+    assert _matches(search_filter["departure_key"], "Hà Nội (HAN)")
+    assert _matches(search_filter["departure_key"], "ha noi")
+    assert not _matches(search_filter["departure_key"], "Hà Nam")
+    assert _matches(search_filter["destination_key"], "TP. Hồ Chí Minh")
+    assert search_filter["departure_time"] == {"$gte": datetime(2024, 3, 31), "$lt": datetime(2024, 4, 1)}
+
+
+def test_every_write_path_sets_route_keys(monkeypatch):
+    collection = FakeFlights()
+    monkeypatch.setattr(flight_module, "db", type("DB", (), {"get_collection": lambda self, name: collection})())
+    service = FlightService()
+
+    service.add_flights([{"departure": "Hà Nội (HAN)", "destination": "Tokyo Narita", "price": 5000000}])
+    service.update_flight("65f0c0ffee0000000000abcd", {"destination": "TP. Hồ Chí Minh"})
+
+    assert collection.writes[0]["departure_key"] == "ha noi han"
+    assert collection.writes[0]["destination_key"] == "tokyo narita"
+    assert collection.writes[1] == {"destination": "TP. Hồ Chí Minh", "destination_key": "ho chi minh"}
+
+
+def test_backfill_recomputes_only_outdated_keys():
+    flights = FakeFlights([
+        with_route_keys({"_id": 1, "departure": "Hà Nội", "destination": "Đà Nẵng"}),
+        {"_id": 2, "departure": "TP. Hồ Chí Minh", "destination": "Hà Nội", "departure_key": "tp ho chi minh"},
+    ])
+    assert backfill_route_keys(flights) == 1
+    assert flights.writes == [{"departure_key": "ho chi minh", "destination_key": "ha noi"}]
+
+
+def test_list_message_does_not_claim_a_total_from_one_page():
+    flight = {"airline": "VN", "flight_number": "VN123", "departure": "Hà Nội",
+              "departure_time": datetime(2024, 3, 31, 8, 0), "price": 1500000, "class_type": "Phổ thông"}
+    message = FlightService().format_flight_list_message(FlightPage([flight] * 5, next_cursor="x"))
+    assert "TÌM THẤY" not in message
+    assert message.count("VN123") == 5
@@ -0,0 +1,38 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.gazetteer import LocationGazetteer, TokenTrie
+
+
+def test_longest_multi_word_match():
+    trie = TokenTrie()
+    for name in ["Nhật", "Nhật Bản", "Hàn Quốc", "Tokyo"]:
+        trie.add(name)
+
+    assert trie.find_all("Tour Nhật Bản ghé Tokyo rồi sang hàn quốc!") == ["nhật bản", "tokyo", "hàn quốc"]
+
+
+def test_locations_loaded_once_until_invalidated():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ["Thái Lan"]
+
+    gazetteer = LocationGazetteer(loader=loader, ttl=600)
+    assert gazetteer.find_locations("đi thái lan") == ["thái lan"]
+    assert gazetteer.find_locations("đi thái lan 5 ngày") == ["thái lan"]
+    assert len(calls) == 1
+
+    gazetteer.invalidate()
+    gazetteer.find_locations("thái lan")
+    assert len(calls) == 2
+
+
+def test_fallback_when_loader_fails():
+    def loader():
+        raise RuntimeError("mongo down")
+
+    gazetteer = LocationGazetteer(loader=loader)
+    assert gazetteer.find_locations("visa nhật bản") == ["nhật bản"]
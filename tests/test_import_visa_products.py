@@ -0,0 +1,119 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+pd = pytest.importorskip("pandas")
+
+import import_visa_products as importer  # noqa: E402
+
+
+class MemoryCollection:
+    """Collection giả cho import: insert/drop/rename và các truy vấn đếm mà validate_staging dùng."""
+
+    def __init__(self, name, db, docs=()):
+        self.name = name
+        self.db = db
+        self.docs = list(docs)
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+
+    def drop(self):
+        self.docs = []
+
+    def insert_many(self, documents, ordered=True):
+        self.docs.extend(documents)
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def create_index(self, keys, name=None, **options):
+        self.indexes[name] = {"key": keys, **options}
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def count_documents(self, query):
+        if not query:
+            return len(self.docs)
+        return sum(1 for doc in self.docs if not doc.get("country") or doc.get("price", 0) < 0)
+
+    def rename(self, new_name, dropTarget=False):
+        self.db.collections[new_name] = self
+        del self.db.collections[self.name]
+        self.name = new_name
+
+
+class MemoryDB:
+    def __init__(self, live_docs):
+        self.collections = {}
+        self.collections["visas"] = MemoryCollection("visas", self, live_docs)
+        self.collections["visas"].indexes["country_1"] = {"key": [("country", 1)], "unique": True}
+
+    def get_collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self)
+        return self.collections[name]
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["Tên sản phẩm*", "Giá", "Nhãn hiệu", "Mô tả sản phẩm", "Mô tả ngắn",
+                                       "Id sản phẩm", "Đường dẫn/Alias"])
+
+
+def test_build_visa_documents_from_small_frame():
+    df = _frame([
+        ["Visa Du Lịch Qatar", "$1,200", "Visa điện tử", "", "", "11", "visa-qatar"],
+        ["", "$50", None, "", "", "12", ""],
+        ["Du Lịch Ả Rập Xê Út", None, None, "", "", "13", ""],
+        ["Visa Du Lịch Qatar", "$900", "Visa dán", "", "", "14", "visa-qatar-2"],
+    ])
+
+    documents = importer.build_visa_documents(df)
+
+    by_country = {doc["country"]: doc for doc in documents}
+    assert sorted(by_country) == ["Qatar", "Ả Rập Xê Út"]
+    # Dòng sau ghi đè dòng trước cùng quốc gia; giá bỏ "$" và dấu phẩy
+    assert by_country["Qatar"]["price"] == 900.0
+    assert by_country["Qatar"]["visa_method"] == "Visa dán"
+    assert by_country["Qatar"]["country_aliases"] == ["qatar"]
+    assert by_country["Ả Rập Xê Út"]["price"] == 0.0
+    assert by_country["Ả Rập Xê Út"]["visa_method"] == "Visa điện tử"
+    assert by_country["Qatar"]["costs"]["options"][0]["price"] == 900.0
+    assert len(by_country["Qatar"]["process_steps"]) == 4
+
+
+def test_failed_import_leaves_live_catalog_untouched(monkeypatch):
+    live_docs = [{"_id": i, "country": f"Nước {i}", "price": 100} for i in range(10)]
+    db = MemoryDB(live_docs)
+    monkeypatch.setattr(importer, "db", db)
+
+    # File chỉ còn 1 sản phẩm (thiếu sheet...): ít hơn MIN_KEEP_RATIO của catalog đang chạy
+    monkeypatch.setattr(importer.pd, "read_excel",
+                        lambda path: _frame([["Visa Du Lịch Qatar", "100", "", "", "", "1", ""]]))
+    assert importer.import_excel_visa_products("visa_products.xlsx") is False
+    assert db.collections["visas"].docs == live_docs
+
+    def unreadable(path):
+        raise ValueError("File is not a zip file")
+
+    monkeypatch.setattr(importer.pd, "read_excel", unreadable)
+    assert importer.import_excel_visa_products("broken.xlsx") is False
+    assert db.collections["visas"].docs == live_docs
+
+
+def test_valid_import_swaps_in_staging_with_live_indexes(monkeypatch):
+    db = MemoryDB([{"_id": 1, "country": "Qatar", "price": 100}])
+    monkeypatch.setattr(importer, "db", db)
+    monkeypatch.setattr(importer.pd, "read_excel", lambda path: _frame([
+        ["Visa Du Lịch Qatar", "120", "", "", "", "1", ""],
+        ["Visa Du Lịch Ấn Độ", "80", "", "", "", "2", ""],
+    ]))
+
+    assert importer.import_excel_visa_products("visa_products.xlsx") is True
+    visas = db.collections["visas"]
+    assert sorted(doc["country"] for doc in visas.docs) == ["Qatar", "Ấn Độ"]
+    assert visas.indexes["country_1"]["unique"] is True
+    assert importer.STAGING_COLLECTION not in db.collections
@@ -0,0 +1,28 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.intent_classifier import IntentClassifier
+
+
+def test_returns_all_intents_in_priority_order():
+    classifier = IntentClassifier()
+
+    assert classifier.classify_all("Tour riêng đi Hàn Quốc, cần làm visa không?") == [
+        ("TOUR_SEARCH", 0), ("VISA_INFO", 1), ("PRIVATE_TOUR", 9)
+    ]
+
+
+def test_classify_keeps_first_match_semantics():
+    classifier = IntentClassifier()
+
+    assert classifier.classify("Giá vé máy bay đi Tokyo") == "FLIGHT_INFO"
+    assert classifier.classify("Hộ chiếu hết hạn\nlàm visa được không") == "VISA_INFO"
+    assert classifier.classify("ok") == "UNKNOWN"
+
+
+def test_dot_does_not_cross_lines():
+    classifier = IntentClassifier({"A": [r"visa.*nước"]})
+
+    assert classifier.classify("visa\nnước") == "UNKNOWN"
+    assert classifier.classify("visa đi nước ngoài") == "A"
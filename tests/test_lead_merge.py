@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import InsertOne
+
+from services.lead_merge import build_lead_upsert, merge_lead_docs, normalize_phone
+
+
+def test_normalize_phone_folds_country_code():
+    assert normalize_phone("+84912345678") == "0912345678"
+    assert normalize_phone("84 912 345 678") == "0912345678"
+    assert normalize_phone("0912.345.678") == "0912345678"
+    assert normalize_phone("") is None
+
+
+def test_merge_unions_lists_and_keeps_first_identity_fields():
+    first = {"phone": "+84912345678", "source": "zalo_bot", "customer_needs": ["visa nhật"], "service_type": "visa"}
+    second = {"phone": "0912345678", "source": "zalo_chat", "customer_needs": ["tour"], "service_type": "tour", "name": "Lan"}
+
+    merged = merge_lead_docs(first, second)
+
+    assert merged["customer_needs"] == ["visa nhật", "tour"]
+    assert merged["service_interests"] == ["visa", "tour"]
+    assert merged["source"] == "zalo_bot"
+    assert merged["name"] == "Lan"
+
+
+def test_upsert_is_keyed_on_normalized_phone():
+    operation = build_lead_upsert({"phone": "+84912345678", "notes": [{"text": "gọi lại"}], "status": "new_lead"})
+    doc = operation._doc
+
+    assert operation._filter == {"phone_normalized": "0912345678"}
+    assert doc["$setOnInsert"]["status"] == "new_lead"
+    assert doc["$addToSet"]["notes"] == {"$each": [{"text": "gọi lại"}]}
+    assert "status" not in doc["$set"]
+
+
+def test_lead_without_phone_is_inserted():
+    operation = build_lead_upsert({"name": "Lan", "zalo_user_id": "u1"})
+    assert isinstance(operation, InsertOne)
+    assert operation._doc["name"] == "Lan"
+    assert "phone_normalized" not in operation._doc
+
+
+def test_special_concerns_flag_is_never_cleared():
+    operation = build_lead_upsert({"phone": "0912345678", "special_concerns": False})
+    assert operation._doc["$max"] == {"special_concerns": False}
+    assert "special_concerns" not in operation._doc["$set"]
+
+    merged = merge_lead_docs({"phone": "0912345678", "special_concerns": True},
+                             {"phone": "0912345678", "special_concerns": False})
+    assert merged["special_concerns"] is True
+
+
+def test_create_lead_keeps_service_type_and_special_case_types(monkeypatch):
+    from services import lead_service as lead_service_module
+
+    class RecordingWriter:
+        """Bộ ghi giả: giữ lại các lead được đưa vào hàng đợi."""
+
+        def __init__(self):
+            self.docs = []
+
+        def submit(self, doc):
+            self.docs.append(doc)
+            return True
+
+    writer = RecordingWriter()
+    monkeypatch.setattr(lead_service_module, "lead_writer", writer)
+    service = lead_service_module.LeadService()
+
+    assert service.create_lead({"phone": "+84912345678", "service_type": "visa", "special_concerns": True,
+                                "special_case_types": ["previous_rejection"]}) is True
+    service.create_lead_with_description({"phone": "0912345678", "service_type": "tour"}, "Hỏi tour Nhật")
+
+    first, second = [build_lead_upsert(doc)._doc for doc in writer.docs]
+    assert first["$addToSet"]["service_interests"] == {"$each": ["visa"]}
+    assert first["$addToSet"]["special_case_types"] == {"$each": ["previous_rejection"]}
+    assert first["$max"] == {"special_concerns": True}
+    assert second["$addToSet"]["service_interests"] == {"$each": ["tour"]}
+    assert second["$addToSet"]["descriptions"] == {"$each": ["Hỏi tour Nhật"]}
+    # Lead sau không có ca đặc biệt: $max giữ nguyên cờ đã bật của lead trước
+    assert second["$max"] == {"special_concerns": False}
+
+
+def test_migration_converts_string_created_at_of_leads_without_phone():
+    from datetime import datetime
+
+    from services.lead_merge import migrate_existing_leads
+
+    class MigrationCollection:
+        """Collection giả cho migrate_existing_leads: ghi lại các lệnh ghi."""
+
+        def __init__(self, docs):
+            self.docs = docs
+            self.updates = []
+            self.replaced = []
+
+        def find(self, query):
+            return self
+
+        def sort(self, *args):
+            return iter(self.docs)
+
+        def update_one(self, query, update):
+            self.updates.append((query["_id"], update["$set"]))
+
+        def replace_one(self, query, doc):
+            self.replaced.append(doc)
+
+        def delete_many(self, query):
+            pass
+
+        def create_index(self, *args, **kwargs):
+            pass
+
+    collection = MigrationCollection([
+        {"_id": 1, "phone": "0912345678", "created_at": "2024-05-01T09:00:00"},
+        {"_id": 2, "name": "Lan", "created_at": "2024-04-01T08:30:00"},
+        {"_id": 3, "name": "Minh", "created_at": datetime(2024, 6, 1)},
+    ])
+
+    migrate_existing_leads(collection)
+
+    assert collection.replaced[0]["created_at"] == datetime(2024, 5, 1, 9, 0)
+    assert collection.updates == [(2, {"created_at": datetime(2024, 4, 1, 8, 30)})]
@@ -0,0 +1,124 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from services.lead_service import LIST_PROJECTION, LeadService, decode_cursor, encode_cursor
+
+
+def _matches(doc, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(key)
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op in ("$lt", "$gt", "$lte", "$gte") and (value is None or operand is None):
+                    return False
+                if ((op == "$lt" and not value < operand) or (op == "$gt" and not value > operand)
+                        or (op == "$lte" and not value <= operand) or (op == "$gte" and not value >= operand)):
+                    return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            # Như Mongo: null đứng trước mọi giá trị khác
+            self.docs.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field) or 0),
+                           reverse=direction != ASCENDING)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """Collection giả hỗ trợ find/sort/limit và các toán tử mà truy vấn keyset dùng."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.projections = []
+
+    def find(self, query, projection=None):
+        self.projections.append(projection)
+        return FakeCursor([dict(doc) for doc in self.docs if _matches(doc, query)])
+
+
+def _service(docs):
+    service = LeadService()
+    service.collection = FakeCollection(docs)
+    return service
+
+
+def test_status_pages_cover_every_lead_once_with_created_at_ties():
+    base = datetime(2024, 5, 1, 9, 0)
+    # Mỗi created_at có 3 lead: ranh giới trang rơi giữa các bản ghi trùng thời điểm
+    docs = [{"_id": ObjectId(), "status": "new_lead", "phone": f"09000000{i:02d}",
+             "created_at": base + timedelta(minutes=i // 3)} for i in range(10)]
+    docs.append({"_id": ObjectId(), "status": "contacted", "created_at": base})
+    service = _service(docs)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = service.get_leads_by_status("new_lead", limit=4, cursor=cursor)
+        seen.extend(lead.phone for lead in page)
+        pages += 1
+        cursor = page.next_cursor
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert sorted(seen) == sorted(doc["phone"] for doc in docs[:10])
+    assert len(set(seen)) == 10
+    # Mới nhất trước
+    assert seen[0] == "0900000009"
+    assert service.collection.projections[0] == LIST_PROJECTION
+
+
+def test_cursor_round_trips_non_datetime_sort_values():
+    doc_id = ObjectId()
+    for value in (datetime(2024, 5, 1, 9, 0, 0, 123000), 42, "Nguyễn Văn A", None):
+        assert decode_cursor(encode_cursor(value, doc_id)) == (value, doc_id)
+
+
+def test_iter_leads_pages_through_string_sort_field():
+    docs = [{"_id": ObjectId(), "name": name} for name in ["An", "Bình", "Bình", "Chi", "Dung"]]
+    service = _service(docs)
+    names = [doc["name"] for doc in service.iter_leads(batch_size=2, sort_field="name")]
+    assert names == ["An", "Bình", "Bình", "Chi", "Dung"]
+
+
+def test_cursor_survives_projection_without_sort_field_and_missing_values():
+    docs = [{"_id": ObjectId(), "name": "Lan", "follow_up_date": datetime(2024, 5, 1)},
+            {"_id": ObjectId(), "name": "Minh"},
+            {"_id": ObjectId(), "name": "Hoa"}]
+    service = _service(docs)
+
+    names = [doc["name"] for doc in service.iter_leads(projection={"name": 1}, batch_size=1,
+                                                       sort_field="follow_up_date")]
+
+    assert sorted(names) == ["Hoa", "Lan", "Minh"]
+    # Trường sắp xếp luôn được lấy về để dựng cursor
+    assert service.collection.projections[0] == {"name": 1, "follow_up_date": 1}
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.lead_writer import LeadWriteBuffer
+
+
+class FakeCollection:
+    """Collection giả ghi lại các lô bulk_write; `failures` là các lỗi ném ra ở những lần gọi đầu."""
+
+    def __init__(self, failures=()):
+        self.batches = []
+        self.failures = list(failures)
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(list(operations))
+        if self.failures:
+            raise self.failures.pop(0)
+
+
+class StreamRedis:
+    """Redis giả hỗ trợ XADD/XREADGROUP/XACK/XDEL cho một consumer group."""
+
+    def __init__(self):
+        self.entries = []  # [(id, fields)]
+        self.delivered = set()
+        self.acked = []
+        self._seq = 0
+
+    def xadd(self, key, fields):
+        self._seq += 1
+        entry_id = f"{self._seq}-0"
+        self.entries.append((entry_id, fields))
+        return entry_id
+
+    def xgroup_create(self, *args, **kwargs):
+        return True
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        start = list(streams.values())[0]
+        if start == "0":
+            items = [entry for entry in self.entries if entry[0] in self.delivered]
+        else:
+            items = [entry for entry in self.entries if entry[0] not in self.delivered][:count]
+            self.delivered.update(entry_id for entry_id, _ in items)
+        if not items:
+            if block:
+                time.sleep(min(block, 20) / 1000)
+            return []
+        return [["leads:pending", items]]
+
+    def xautoclaim(self, *args, **kwargs):
+        return ["0-0", [], []]
+
+    def xack(self, key, group, *ids):
+        self.acked.extend(ids)
+
+    def xdel(self, key, *ids):
+        self.entries = [entry for entry in self.entries if entry[0] not in ids]
+
+
+class DownRedis:
+    """Redis không kết nối được: mọi lệnh đều lỗi, đếm số lần bị gọi."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            self.calls += 1
+            raise ConnectionError("redis down")
+        return fail
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_local_mode_flushes_when_batch_is_full():
+    collection = FakeCollection()
+    writer = LeadWriteBuffer(None, batch_size=3, flush_interval=30, collection=collection)
+    for i in range(3):
+        writer.submit({"phone": f"090000000{i}", "name": f"Khách {i}"})
+    try:
+        assert _wait_for(lambda: collection.batches)
+        assert len(collection.batches[0]) == 3
+    finally:
+        writer.stop()
+
+
+def test_local_mode_flushes_on_interval_and_merges_same_phone():
+    collection = FakeCollection()
+    writer = LeadWriteBuffer(None, batch_size=50, flush_interval=0.1, collection=collection)
+    writer.submit({"phone": "+84912345678", "customer_needs": ["visa"]})
+    writer.submit({"phone": "0912 345 678", "customer_needs": ["tour"]})
+    writer.submit({"name": "Không SĐT", "zalo_user_id": "u1"})
+    try:
+        assert _wait_for(lambda: collection.batches)
+        operations = collection.batches[0]
+        assert sum(isinstance(op, UpdateOne) for op in operations) == 1
+        assert sum(isinstance(op, InsertOne) for op in operations) == 1
+    finally:
+        writer.stop()
+
+
+def test_stream_mode_writes_then_acks():
+    redis_client = StreamRedis()
+    collection = FakeCollection()
+    writer = LeadWriteBuffer(redis_client, batch_size=2, flush_interval=30, collection=collection)
+    writer.submit({"phone": "0900000001"})
+    writer.submit({"phone": "0900000002"})
+    try:
+        assert _wait_for(lambda: redis_client.acked)
+        assert len(collection.batches[0]) == 2
+        assert sorted(redis_client.acked) == ["1-0", "2-0"]
+        assert redis_client.entries == []
+    finally:
+        writer.stop()
+
+
+def test_stream_read_errors_back_off():
+    redis_client = DownRedis()
+    collection = FakeCollection()
+    writer = LeadWriteBuffer(redis_client, batch_size=50, flush_interval=0.05, collection=collection)
+    writer.submit({"phone": "0900000001"})  # XADD lỗi: lead vào bộ đệm cục bộ
+    try:
+        time.sleep(0.5)
+        # 0.1 + 0.2 + 0.4s: chỉ vài lần đọc thay vì lặp liên tục
+        assert redis_client.calls <= 6
+        assert _wait_for(lambda: collection.batches)
+    finally:
+        writer.stop()
+
+
+def test_duplicate_key_upserts_are_retried_and_other_errors_requeue():
+    duplicate = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}, {"index": 1, "code": 11000}]})
+    collection = FakeCollection(failures=[duplicate])
+    writer = LeadWriteBuffer(None, collection=collection)
+    writer._flush([(None, '{"phone": "0900000001"}'), (None, '{"name": "Không SĐT"}')])
+    # Lần 2 chỉ thử lại upsert; InsertOne trùng _id là lead đã ghi ở lần trước
+    assert len(collection.batches) == 2
+    assert [type(op) for op in collection.batches[1]] == [UpdateOne]
+    assert not writer._local
+
+    failing = FakeCollection(failures=[BulkWriteError({"writeErrors": [{"index": 0, "code": 121}]})])
+    writer = LeadWriteBuffer(None, collection=failing)
+    writer._flush([(None, '{"phone": "0900000001"}')])
+    assert len(writer._local) == 1
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import services.message_handler as handler_module
+from services.faq_index import FAQIndex
+from services.gazetteer import LocationGazetteer
+from services.message_handler import MessageHandler
+
+FAQS = [
+    {"question": "Làm sao để xin visa Nhật Bản?", "answer": "FAQ: hồ sơ visa Nhật"},
+    {"question": "Làm thế nào để đặt tour du lịch?", "answer": "FAQ: cách đặt tour"},
+    {"question": "Tôi có thể đổi ngoại tệ ở đâu?", "answer": "FAQ: đổi ngoại tệ"},
+]
+
+
+class MemoryStore:
+    """conversation_store giả lưu context trong bộ nhớ."""
+
+    def __init__(self):
+        self.contexts = {}
+        self.history = []
+
+    def get_context(self, user_id):
+        return dict(self.contexts.get(user_id, {}))
+
+    def set_context(self, user_id, context):
+        self.contexts[user_id] = dict(context)
+
+    def append_history(self, user_id, *turns):
+        self.history.extend(turns)
+
+
+class OpenAdmission:
+    """Không có backlog Gemini: mọi lượt đều được xử lý bình thường."""
+
+    def admit(self):
+        return "normal"
+
+    def track(self):
+        return contextlib.nullcontext()
+
+
+class NoWaitSchedulers:
+    @contextlib.asynccontextmanager
+    async def slot(self, user_id, context=None):
+        yield
+
+    def get(self):
+        return self
+
+
+def _handler(monkeypatch):
+    monkeypatch.setattr(handler_module, "conversation_store", MemoryStore())
+    monkeypatch.setattr(handler_module, "faq_index", FAQIndex(loader=lambda: FAQS))
+    monkeypatch.setattr(handler_module, "location_gazetteer", LocationGazetteer(loader=lambda: ["Nhật Bản"]))
+    monkeypatch.setattr(handler_module, "admission_controller", OpenAdmission())
+    monkeypatch.setattr(handler_module, "turn_schedulers", NoWaitSchedulers())
+
+    handler = MessageHandler.__new__(MessageHandler)
+    handler.pending_messages = {}
+    handler.routed = []
+    handler.sent = []
+
+    async def visa(text, user_id):
+        handler.routed.append("visa")
+        return ["visa"]
+
+    async def tour(text, user_id):
+        handler.routed.append("tour")
+        return ["tour"]
+
+    async def send(user_id, responses):
+        handler.sent.extend(responses)
+
+    handler._handle_visa_query = visa
+    handler._handle_tour_query = tour
+    handler._send_response = send
+    return handler
+
+
+def _process(handler, text, user_id="u1"):
+    handler.pending_messages[user_id] = {"messages": [{"text": text}], "last_time": 0}
+    asyncio.run(handler._process_pending_messages(user_id))
+
+
+def test_destination_inquiries_reach_visa_and_tour_handlers(monkeypatch):
+    handler = _handler(monkeypatch)
+    _process(handler, "visa nhật bản")
+    _process(handler, "xin visa nhật bản", user_id="u2")
+    _process(handler, "tour du lịch nhật bản 5 ngày", user_id="u3")
+    assert handler.routed == ["visa", "visa", "tour"]
+    assert not any(text.startswith("FAQ") for text in handler.sent)
+
+
+def test_general_question_is_answered_from_faq_outside_a_flow(monkeypatch):
+    handler = _handler(monkeypatch)
+    _process(handler, "tôi có thể đổi ngoại tệ ở đâu")
+    assert handler.sent == ["FAQ: đổi ngoại tệ"]
+    assert handler.routed == []
+
+    # Đang tư vấn tour Nhật (context có điểm đến): câu hỏi tiếp theo vẫn đi vào luồng tour
+    handler_module.conversation_store.set_context("u2", {"country": "Nhật Bản", "service_type": "tour"})
+    _process(handler, "làm thế nào để đặt tour du lịch", user_id="u2")
+    assert handler.routed == ["tour"]
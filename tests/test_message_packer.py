@@ -0,0 +1,50 @@
+import os
+import sys
+import unicodedata
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from services.message_packer import pack_message
+
+REPLY = (
+    "Dạ, visa Nhật Bản du lịch cần hộ chiếu còn hạn 6 tháng. Ảnh 4.5x4.5 nền trắng. "
+    "Sao kê 3 tháng gần nhất với số dư 100 triệu! Thời gian xét duyệt khoảng 5-7 ngày làm việc ạ.\n\n"
+    "- Phí dịch vụ: 2-2.5 triệu VND\n"
+    "- Hotline: 1900 636563"
+)
+
+
+def _words(text):
+    return text.split()
+
+
+def test_short_reply_is_single_message():
+    assert pack_message("Dạ, em chào anh/chị ạ!", limit=160) == ["Dạ, em chào anh/chị ạ!"]
+    assert pack_message("   ", limit=160) == []
+
+
+def test_long_line_is_split_at_sentences_within_limit():
+    parts = pack_message(REPLY, limit=80)
+    assert all(len(part) <= 80 for part in parts)
+    assert _words(" ".join(parts)) == _words(REPLY)
+    assert parts[1] == "Sao kê 3 tháng gần nhất với số dư 100 triệu!"
+    assert parts[-1] == "- Hotline: 1900 636563"
+    assert len(parts) == 4
+
+
+def test_fills_messages_across_lines():
+    lines = ["Dòng số %d của bảng giá tour." % i for i in range(12)]
+    text = "\n".join(lines)
+    parts = pack_message(text, limit=160)
+    # Tổng 359 ký tự: 3 tin là tối thiểu, chỉ ngắt ở chỗ xuống dòng
+    assert len(parts) == 3
+    assert "\n".join(parts) == text
+
+
+def test_never_splits_a_grapheme_cluster():
+    word = unicodedata.normalize("NFD", "nhiều") * 30
+    parts = pack_message(word, limit=25)
+    assert "".join(parts) == word
+    assert all(len(part) <= 25 for part in parts)
+    assert not any(unicodedata.combining(part[0]) for part in parts)
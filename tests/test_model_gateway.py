@@ -0,0 +1,96 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from services.model_gateway import ModelGateway
+
+
+class SlowModel:
+    """Model giả: đếm số lời gọi đồng thời lớn nhất."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self._lock:
+            self.active -= 1
+        if prompt == "boom":
+            raise RuntimeError("quota")
+        return prompt.upper()
+
+
+def test_models_are_created_once():
+    created = []
+    gateway = ModelGateway(api_key="test-key", model_factory=lambda name: created.append(name) or SlowModel())
+
+    assert gateway.model() is gateway.model("gemini-2.0-flash")
+    assert created == ["gemini-2.0-flash"]
+
+
+def test_concurrency_limit_and_stats():
+    model = SlowModel()
+    gateway = ModelGateway(api_key="test-key", max_concurrency=2, model_factory=lambda name: model)
+
+    async def run():
+        return await asyncio.gather(*(gateway.generate_async(f"q{i}") for i in range(6)))
+
+    results = asyncio.run(run())
+
+    assert results == [f"Q{i}" for i in range(6)]
+    assert model.peak <= 2
+    stats = gateway.stats()["gemini-2.0-flash"]
+    assert stats["calls"] == 6
+    assert stats["errors"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == 0
+    assert stats["p50_ms"] >= 15
+
+
+def test_errors_are_counted():
+    gateway = ModelGateway(api_key="test-key", model_factory=lambda name: SlowModel())
+
+    try:
+        gateway.generate("boom")
+    except RuntimeError:
+        pass
+
+    assert gateway.stats()["gemini-2.0-flash"]["errors"] == 1
+    assert gateway.in_flight() == 0
+
+
+def test_async_calls_count_as_queued_while_waiting_for_a_pool_thread():
+    release = threading.Event()
+
+    class BlockingModel:
+        def generate_content(self, prompt, **kwargs):
+            release.wait(2)
+            return prompt
+
+    gateway = ModelGateway(api_key="test-key", max_concurrency=1, model_factory=lambda name: BlockingModel())
+
+    async def run():
+        # Pool có 2 thread, semaphore 1: 1 đang chạy, 1 chờ slot, 2 còn chờ thread trống
+        tasks = [asyncio.ensure_future(gateway.generate_async(f"q{i}")) for i in range(4)]
+        await asyncio.sleep(0.05)
+        backlog = gateway.backlog()
+        tasks[-1].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks[:-1])
+        return backlog
+
+    assert asyncio.run(run()) == 4
+    stats = gateway.stats()["gemini-2.0-flash"]
+    assert stats["queued"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["calls"] == 3
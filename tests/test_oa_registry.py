@@ -0,0 +1,88 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import services.oa_registry as oa_module
+from services.oa_registry import OAConfig, OARegistry, current_oa_id, scoped_id, set_current_oa, shard_of
+from services.zalo_api import RateLimiter
+
+
+def make_registry(**kwargs):
+    configs = {oa_id: OAConfig(oa_id, max_concurrency=limit) for oa_id, limit in
+               (("brand_a", None), ("brand_b", None), ("brand_c", 6))}
+    return OARegistry(configs=configs, **kwargs)
+
+
+def test_default_oa_keeps_legacy_keys(monkeypatch):
+    monkeypatch.setattr(oa_module, "oa_registry", make_registry())
+    token = set_current_oa(None)
+    try:
+        assert current_oa_id() == "brand_a"
+        assert scoped_id("123") == "123"
+        set_current_oa("brand_b")
+        assert scoped_id("123") == "brand_b:123"
+    finally:
+        oa_module._current_oa.reset(token)
+
+
+def test_tasks_inherit_current_oa(monkeypatch):
+    monkeypatch.setattr(oa_module, "oa_registry", make_registry())
+
+    async def handle(oa_id):
+        set_current_oa(oa_id)
+        # Giống MessageHandler: task xử lý được tạo trong request
+        return await asyncio.create_task(asyncio.sleep(0, result=scoped_id("u1")))
+
+    async def run():
+        return await asyncio.gather(handle("brand_b"), handle("brand_c"), handle("brand_a"))
+
+    assert asyncio.run(run()) == ["brand_b:u1", "brand_c:u1", "u1"]
+
+
+def test_shards_partition_oas():
+    registries = [make_registry(shard_index=i, shard_count=3) for i in range(3)]
+
+    for oa_id in ("brand_a", "brand_b", "brand_c"):
+        owners = [i for i, registry in enumerate(registries) if registry.owns(oa_id)]
+        assert owners == [shard_of(oa_id, 3)]
+    assert make_registry(shard_index=0, shard_count=1).owns("anything")
+
+
+def test_concurrency_is_split_between_oas():
+    registry = make_registry()
+
+    assert registry.max_concurrency("brand_c") == 6
+    assert registry.max_concurrency("brand_a") == max(1, oa_module.Config.GEMINI_MAX_CONCURRENCY // 3)
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=100, burst=2)
+
+    waits = [limiter.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert 0 < waits[2] <= 0.011 and waits[3] > 0
+
+
+def test_async_rate_limiter_does_not_block_event_loop():
+    limiter = RateLimiter(rate=20, burst=1)
+    ticks, ticks_when_sent = [], []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def send():
+        await limiter.acquire_async()
+        # Token thứ hai phải chờ ~50 ms: ticker vẫn chạy trong lúc chờ
+        await limiter.acquire_async()
+        ticks_when_sent.append(len(ticks))
+
+    async def run():
+        await asyncio.gather(send(), ticker())
+
+    asyncio.run(run())
+    assert ticks_when_sent[0] >= 3
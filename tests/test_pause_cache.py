@@ -0,0 +1,78 @@
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.admin_commands import PauseCache
+
+
+class PauseRedis:
+    """Redis tối giản: key botpause:* và đếm số lần gọi EXISTS."""
+
+    def __init__(self):
+        self.store = {}
+        self.exists_calls = 0
+        self.published = []
+
+    def exists(self, key):
+        self.exists_calls += 1
+        return int(key in self.store)
+
+    def scan_iter(self, match=None, count=None):
+        prefix = match.rstrip("*")
+        return [key for key in self.store if key.startswith(prefix)]
+
+    def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+    def ttl(self, key):
+        return 60
+
+    def publish(self, channel, data):
+        self.published.append(data)
+
+
+def test_falls_back_to_redis_before_first_sync():
+    redis_client = PauseRedis()
+    redis_client.store["botpause:u1"] = json.dumps({"resume_at": time.time() + 600})
+    cache = PauseCache(redis_client, auto_start=False)
+
+    assert cache.is_paused("u1") is True
+    assert redis_client.exists_calls == 1
+
+
+def test_synced_checks_do_not_touch_redis():
+    redis_client = PauseRedis()
+    redis_client.store["botpause:u1"] = json.dumps({"resume_at": time.time() + 600})
+    redis_client.store["botpause:u2"] = "legacy"
+    cache = PauseCache(redis_client, auto_start=False)
+
+    assert cache.resync() == 2
+    assert cache.is_paused("u1") and cache.is_paused("u2")
+    assert not cache.is_paused("u3")
+    assert redis_client.exists_calls == 0
+
+
+def test_events_from_other_workers_and_expiry():
+    cache = PauseCache(PauseRedis(), auto_start=False)
+    cache.resync()
+
+    cache.apply(json.dumps({"user_id": "u1", "resume_at": time.time() + 600}))
+    cache.apply(json.dumps({"user_id": "u2", "resume_at": time.time() - 1}))
+    assert cache.is_paused("u1") and not cache.is_paused("u2")
+
+    cache.apply(json.dumps({"user_id": "u1", "resume_at": None}))
+    assert not cache.is_paused("u1")
+
+
+def test_local_changes_are_broadcast():
+    redis_client = PauseRedis()
+    cache = PauseCache(redis_client, auto_start=False)
+    cache.resync()
+
+    cache.mark_paused("u1", time.time() + 600)
+    assert cache.is_paused("u1")
+    cache.mark_resumed("u1")
+    assert not cache.is_paused("u1")
+    assert [json.loads(data)["resume_at"] is None for data in redis_client.published] == [False, True]
@@ -0,0 +1,138 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.token_manager import TokenManager
+
+
+class HashRedis:
+    """Redis giả tối thiểu: hash, SET NX và script nhả lock."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.strings = {}
+
+    def hgetall(self, key):
+        return {k: str(v) for k, v in self.hashes.get(key, {}).items()}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        entry = self.hashes.setdefault(key, {})
+        if mapping:
+            entry.update(mapping)
+        if field is not None:
+            entry[field] = value
+
+    def hsetnx(self, key, field, value):
+        entry = self.hashes.setdefault(key, {})
+        if field in entry:
+            return False
+        entry[field] = value
+        return True
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    def register_script(self, script):
+        def release(keys, args):
+            if self.strings.get(keys[0]) == args[0]:
+                del self.strings[keys[0]]
+                return 1
+            return 0
+        return release
+
+
+class FakeOAuth:
+    """Endpoint OAuth giả: mỗi lần refresh trả token mới và refresh token mới."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, url, headers=None, data=None, timeout=None):
+        self.calls.append(data["refresh_token"])
+        n = len(self.calls)
+        payload = {"access_token": f"access-{n}", "refresh_token": f"refresh-{n}", "expires_in": "90000"}
+        return type("Response", (), {"json": lambda self: payload})()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _manager(redis_client, oauth, clock, **kwargs):
+    return TokenManager("oa1", "app", "secret", redis_client, access_token="seed", refresh_token="refresh-0",
+                        refresh_margin=600, initial_expires_in=3600, local_ttl=60, http_post=oauth, clock=clock,
+                        **kwargs)
+
+
+def test_only_one_worker_refreshes_and_others_pick_up_new_token():
+    redis_client, oauth, clock = HashRedis(), FakeOAuth(), Clock()
+    worker_a = _manager(redis_client, oauth, clock)
+    worker_b = _manager(redis_client, oauth, clock)
+
+    assert worker_a.get_token() == "seed"
+    assert worker_b.get_token() == "seed"
+
+    # Vào vùng refresh_margin: worker A làm mới, worker B đọc lại Redis và dùng token mới
+    clock.now += 3100
+    assert worker_a.get_token() == "access-1"
+    assert worker_b.get_token() == "access-1"
+    assert oauth.calls == ["refresh-0"]
+    assert redis_client.hashes["zalo:token:oa1"]["refresh_token"] == "refresh-1"
+    assert "zalo:token:oa1:lock" not in redis_client.strings
+
+
+def test_worker_keeps_valid_token_while_another_holds_the_lock():
+    redis_client, oauth, clock = HashRedis(), FakeOAuth(), Clock()
+    worker = _manager(redis_client, oauth, clock)
+    worker.get_token()
+
+    redis_client.strings["zalo:token:oa1:lock"] = "other-worker"
+    clock.now += 3100
+    assert worker.get_token() == "seed"
+    assert oauth.calls == []
+
+
+def test_invalidate_reuses_token_already_replaced_by_another_worker():
+    redis_client, oauth, clock = HashRedis(), FakeOAuth(), Clock()
+    worker_a = _manager(redis_client, oauth, clock)
+    worker_b = _manager(redis_client, oauth, clock)
+    worker_a.get_token()
+    worker_b.get_token()
+
+    assert worker_a.invalidate("seed") == "access-1"
+    # B cũng bị Zalo từ chối token cũ nhưng không refresh lần nữa
+    assert worker_b.invalidate("seed") == "access-1"
+    assert oauth.calls == ["refresh-0"]
+
+
+def test_oauth_outage_keeps_using_unexpired_token():
+    def unreachable(url, headers=None, data=None, timeout=None):
+        raise ConnectionError("oauth.zaloapp.com unreachable")
+
+    clock = Clock()
+    manager = TokenManager("oa", "app", "sec", None, access_token="tok", refresh_token="r",
+                           initial_expires_in=300, http_post=unreachable, clock=clock)
+    # Đã vào vùng refresh_margin nhưng token còn hạn: vẫn trả token cũ
+    assert manager.get_token() == "tok"
+    assert manager.get_token() == "tok"
+
+
+def test_zalo_api_sends_with_last_token_when_manager_fails():
+    from services.zalo_api import ZaloAPI
+
+    class BrokenManager:
+        """Token manager luôn lỗi khi lấy token."""
+
+        def get_token(self):
+            raise ConnectionError("redis down")
+
+    api = ZaloAPI(app_id="app", secret_key="sec", access_token="tok", token_manager=BrokenManager())
+    assert api.access_token == "tok"
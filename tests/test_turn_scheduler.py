@@ -0,0 +1,69 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from services.turn_scheduler import CustomerSignals, TurnScheduler, classify_score
+
+
+def make_scheduler(max_concurrency=1, leads=(), bookings=()):
+    signals = CustomerSignals(loader=lambda user_id: {"lead": user_id in leads, "open_booking": user_id in bookings})
+    return TurnScheduler(max_concurrency=max_concurrency, signals=signals)
+
+
+def test_scores_and_classes():
+    scheduler = make_scheduler(leads={"lead"}, bookings={"booker"})
+
+    assert classify_score(scheduler.score("anon", {})) == "normal"
+    assert classify_score(scheduler.score("anon", {"ready_for_price": True})) == "warm"
+    assert classify_score(scheduler.score("lead", {})) == "warm"
+    assert classify_score(scheduler.score("booker", {})) == "hot"
+    assert classify_score(scheduler.score("anon", {"customer_phone": "0901234567"})) == "hot"
+
+
+def test_higher_scores_are_served_first_under_contention():
+    scheduler = make_scheduler(max_concurrency=1, bookings={"booker"})
+    order = []
+
+    async def turn(user_id, context=None):
+        async with scheduler.slot(user_id, context):
+            order.append(user_id)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        first = asyncio.create_task(turn("first"))
+        await asyncio.sleep(0.005)
+        waiting = [asyncio.create_task(turn("anon")), asyncio.create_task(turn("phone", {"phone": "0901234567"}))]
+        await asyncio.sleep(0.005)
+        waiting.append(asyncio.create_task(turn("booker")))
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(run())
+
+    assert order == ["first", "phone", "booker", "anon"]
+    status = scheduler.status()
+    assert status["active"] == 0 and status["waiting"] == 0
+    assert status["classes"]["hot"]["turns"] == 2
+    assert status["classes"]["normal"]["turns"] == 2
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    scheduler = make_scheduler(max_concurrency=1)
+
+    async def run():
+        async def hold():
+            async with scheduler.slot("a"):
+                await asyncio.sleep(0.02)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.005)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        await holder
+        async with scheduler.slot("b"):
+            pass
+
+    asyncio.run(asyncio.wait_for(run(), 1))
+    assert scheduler.status()["active"] == 0
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.visa_chunks import build_chunks, relevant_chunks
+
+CHINA_VISA = {
+    "country": "Trung Quốc",
+    "country_aliases": ["trung quoc", "china", "tq"],
+    "requirements": {
+        "travel_docs": ["Hộ chiếu gốc còn hạn ít nhất 6 tháng", "Ảnh thẻ 4x6cm nền trắng"],
+        "financial_docs": ["Sao kê tài khoản ngân hàng 3 tháng gần nhất", "Giấy tờ chứng minh công việc và thu nhập"],
+        "family_docs": ["Giấy đăng ký kết hôn (nếu đi cùng vợ/chồng)", "Giấy khai sinh (nếu đi cùng con)"],
+    },
+    "costs": {
+        "options": [
+            {"type": "Visa nhập cảnh 1 lần", "price": 180, "duration": "90 ngày"},
+            {"type": "Visa nhập cảnh nhiều lần", "price": 300, "duration": "1 năm"},
+        ],
+        "includes": ["Phí lãnh sự quán"],
+        "excludes": ["Phí xử lý nhanh"],
+    },
+}
+
+
+def _visa():
+    return {key: value for key, value in CHINA_VISA.items()}
+
+
+def test_build_chunks_one_per_category_and_cost_section():
+    texts = [text for text, _ in build_chunks(CHINA_VISA)]
+    assert texts[0].startswith("Giấy tờ chuyến đi: Hộ chiếu gốc")
+    assert texts[1].startswith("Giấy tờ tài chính: ")
+    assert texts[3] == "Các gói visa: Visa nhập cảnh 1 lần - 180 USD, thời hạn 90 ngày; " \
+                       "Visa nhập cảnh nhiều lần - 300 USD, thời hạn 1 năm"
+    assert texts[4] == "Phí bao gồm: Phí lãnh sự quán. Không bao gồm: Phí xử lý nhanh"
+    assert len(texts) == 5
+
+
+def test_relevant_chunks_follow_the_question():
+    visa = _visa()
+    assert relevant_chunks(visa, "sao kê tài khoản mấy tháng ạ")[0].startswith("Giấy tờ tài chính")
+    assert relevant_chunks(visa, "đi cùng con thì cần thêm gì")[0].startswith("Giấy tờ gia đình")
+    assert relevant_chunks(visa, "visa nhiều lần giá sao em")[0].startswith("Các gói visa")
+    assert relevant_chunks(visa, "phí đã gồm phí lãnh sự chưa")[0].startswith("Phí bao gồm")
+    # Câu hỏi chỉ nêu tên nước: không thêm đoạn nào vào prompt
+    assert relevant_chunks(visa, "visa trung quốc") == []
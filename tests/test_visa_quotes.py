@@ -0,0 +1,32 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.visa_quotes import annotate_visa, duration_to_days, recompute_quotes
+
+
+def test_duration_to_days():
+    assert duration_to_days("90 ngày") == 90
+    assert duration_to_days("3 tháng") == 90
+    assert duration_to_days("1 năm") == 365
+    assert duration_to_days("") == 0
+
+
+def test_annotate_visa_precomputes_quote_and_durations():
+    visa = {"country": "Mỹ", "price": 200,
+            "costs": {"options": [{"duration": "30 ngày"}, {"duration": "6 tháng"}]}}
+
+    annotate_visa(visa, 25000)
+
+    assert visa["region_class"] == "premium"
+    assert visa["max_duration_days"] == 180
+    assert visa["costs"]["options"][0]["duration_days"] == 30
+    assert visa["quote"] == {"rate": 25000, "price_vnd": 5000000, "range_low": 4.2, "range_high": 5.8}
+
+
+def test_rate_change_only_recomputes_stale_quotes():
+    catalog = {"nhật bản": [annotate_visa({"country": "Nhật Bản", "price": 100}, 25000)]}
+
+    assert recompute_quotes(catalog, 25000) == 0
+    assert recompute_quotes(catalog, 26000) == 1
+    assert catalog["nhật bản"][0]["quote"]["price_vnd"] == 2600000
@@ -0,0 +1,96 @@
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from services.weather_service import WeatherService
+
+
+def _weather_payload(city):
+    return {
+        "name": city, "sys": {"country": "JP"},
+        "main": {"temp": 18.5, "feels_like": 17.9, "humidity": 60},
+        "wind": {"speed": 3.2}, "weather": [{"description": "mây rải rác"}]
+    }
+
+
+async def _start_fake_openweathermap(hits, delay=0.05):
+    """Server HTTP cục bộ thay cho OpenWeatherMap, đếm số request theo địa điểm."""
+    async def handler(request):
+        city = request.query["q"]
+        hits[city] = hits.get(city, 0) + 1
+        await asyncio.sleep(delay)
+        if city == "nowhere":
+            return web.json_response({"message": "city not found"}, status=404)
+        return web.json_response(_weather_payload(city))
+
+    app = web.Application()
+    app.router.add_get("/data/2.5/weather", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/data/2.5/weather"
+
+
+def _run_with_service(scenario, ttl=1800):
+    async def main():
+        hits = {}
+        runner, url = await _start_fake_openweathermap(hits)
+        service = WeatherService(base_url=url, ttl=ttl)
+        try:
+            return await scenario(service, hits)
+        finally:
+            service.close()
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_are_coalesced():
+    async def scenario(service, hits):
+        results = await asyncio.gather(*(service.get_weather("Tokyo") for _ in range(5)))
+        assert all(r["name"] == "Tokyo" for r in results)
+        assert hits == {"Tokyo": 1}
+
+    _run_with_service(scenario)
+
+
+def test_results_are_served_from_cache_until_ttl():
+    async def scenario(service, hits):
+        await service.get_weather("Tokyo")
+        await service.get_weather("  tokyo ")
+        assert hits["Tokyo"] == 1
+
+        await asyncio.sleep(0.15)
+        await service.get_weather("Tokyo")
+        assert hits["Tokyo"] == 2
+
+    _run_with_service(scenario, ttl=0.1)
+
+
+def test_errors_are_not_cached():
+    async def scenario(service, hits):
+        assert await service.get_weather("nowhere") is None
+        assert await service.get_weather("nowhere") is None
+        assert hits["nowhere"] == 2
+
+    _run_with_service(scenario)
+
+
+def test_prefetcher_warms_destinations():
+    async def scenario(service, hits):
+        service.start_prefetcher(["Tokyo", "Seoul"], interval=60)
+        for _ in range(50):
+            if len(hits) == 2:
+                break
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.1)
+
+        weather = await service.get_weather("Seoul")
+        assert weather["name"] == "Seoul"
+        assert hits == {"Tokyo": 1, "Seoul": 1}
+
+    _run_with_service(scenario)
@@ -0,0 +1,41 @@
+import hashlib
+import hmac
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.zalo_api import ZaloAPI
+
+BODY = b'{"event_name":"user_send_text","sender":{"id":"123"},"message":{"text":"visa nh\\u1eadt"}}'
+
+
+def _sign(body, key="secret"):
+    return hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _api():
+    return ZaloAPI(app_id="app", secret_key="secret", access_token="tok")
+
+
+def test_valid_signature_is_accepted_for_bytes_and_str_body():
+    api = _api()
+    assert api.verify_webhook(BODY, _sign(BODY))
+    assert api.verify_webhook(BODY.decode(), _sign(BODY))
+    # HMAC dựng sẵn được sao chép, không bị lẫn trạng thái giữa các request
+    assert api.verify_webhook(BODY, _sign(BODY))
+
+
+def test_tampered_body_is_rejected():
+    tampered = BODY.replace(b'"123"', b'"124"')
+    assert not _api().verify_webhook(tampered, _sign(BODY))
+
+
+def test_signature_from_another_key_is_rejected():
+    assert not _api().verify_webhook(BODY, _sign(BODY, key="other-secret"))
+
+
+def test_missing_signature_is_rejected():
+    api = _api()
+    assert not api.verify_webhook(BODY, None)
+    assert not api.verify_webhook(BODY, "")